@@ -1,32 +1,106 @@
-from flask import Flask, render_template, request, jsonify, url_for, session, redirect, flash
-from openai import OpenAI
+from flask import (Flask, render_template, request, jsonify, url_for, session, redirect, flash, Response,
+                   stream_with_context, g)
 import os
+import time
+import asyncio
+import logging
 import math
 import json
 import hashlib
-from datetime import datetime, timedelta
+import click
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; batch maths falls back to plain Python
+    np = None
+from datetime import date, datetime, timedelta
 from dotenv import load_dotenv
 
-# Load environment variables from .env file
+# Load environment variables from .env file (before the modules below read their settings)
 load_dotenv()
 
+from log_config import configure_logging
+import metrics
+from storage import create_user_store, migrate_json_to_sqlite, USER_DATA_FILE, CachedUserStore
+from meal_cache import create_meal_cache, make_key as make_meal_key
+from meal_jobs import MealJobManager, DONE
+from event_log import create_event_log, MEAL, BMR, COMPLETION, GOAL, PLAN, EVENT_LOG_RETENTION_DAYS, TREND_PERIODS
+from single_flight import create_single_flight, variant_slot
+from dish_index import DishIndex, as_index, dish_from_history
+from nutrition import create_nutrition_db
+from model_router import create_model_router
+from llm_client import create_llm_client, create_async_llm_client, CircuitOpenError, LLMClient
+from precompute import (PrecomputedPlans, build_grid, grid_from_profiles, run_precompute,
+                        DEFAULT_STATES, DEFAULT_PREFERENCES)
+import llm_stub
+import meal_parser
+import assets
+import goals
+import sync
+import workouts
+from page_cache import PageCache
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-change-this-in-production')
+# Fingerprinted static files from `flask build-assets`, if they have been built
+assets.init_app(app)
+# Pages whose output only depends on login state are rendered once and revalidated by ETag
+page_cache = PageCache(app)
 
 # Initialize OpenRouter API - get key from environment variable
-api_key = os.getenv('OPENAI_API_KEY')
-if api_key:
-    # OpenRouter uses OpenAI-compatible API
-    client = OpenAI(
-        api_key=api_key,
-        base_url="https://openrouter.ai/api/v1"
-    )
-    print("OpenRouter API configured successfully - Using DeepSeek V3.1")
-    print(f"API Key Preview: {api_key[:15]}...{api_key[-10:]}")
+# OpenRouter uses OpenAI-compatible API; one pooled client is shared by every request
+client = create_llm_client()
+if client is not None:
+    logger.info("OpenRouter API configured successfully - Using DeepSeek V3.1")
 else:
-    client = None
-    print("Warning: OPENAI_API_KEY not found in environment variables")
-    print("Add your OpenRouter API key to .env file to get AI-powered food recommendations")
+    logger.warning("OPENAI_API_KEY not found in environment variables; "
+                   "add your OpenRouter API key to .env to get AI-powered food recommendations")
+# LLM_ASYNC=1: background meal jobs await AsyncOpenAI on one event loop instead of holding a thread each
+async_client = create_async_llm_client(client)
+# Meal generation goes to the fastest of LLM_MODELS and slow calls are hedged on the next one
+model_router = create_model_router()
+
+REQUEST_LATENCY = metrics.histogram('http_request_duration_seconds', 'Request latency by route',
+                                    ['route', 'method', 'status'])
+LLM_TOKENS = metrics.counter('llm_tokens_total', 'Tokens reported in OpenRouter usage', ['type'])
+MEAL_PLAN_PARSES = metrics.counter('meal_plan_parse_total', 'parse_meal_plan results', ['result'])
+MEAL_PLAN_SOURCES = metrics.counter('meal_plan_source_total', 'Where meal plan responses came from', ['source'])
+MEAL_REPEATS = metrics.counter('meal_plan_repeats_total',
+                               'Meals that repeated a recent dish: replaced by a targeted call, or kept', ['result'])
+MEAL_CALORIE_CHECKS = metrics.counter('meal_calorie_check_total',
+                                      'Meal calories checked against the nutrition data: ok, corrected or unknown dish',
+                                      ['result'])
+WORKOUT_UPLOADS = metrics.counter('workout_upload_events_total',
+                                  'Workout events uploaded: stored, or duplicate (a retried batch)', ['result'])
+SYNC_DELTAS = metrics.counter('sync_deltas_total', 'Client deltas received by /sync: applied, or ignored '
+                              'as superseded or for a past day', ['type', 'result'])
+
+# Cache of AI meal plans keyed by (state, city, calorie bucket, food preference)
+meal_cache = create_meal_cache()
+
+# Concurrent requests for the same plan share one OpenRouter call, across workers too
+single_flight = create_single_flight()
+
+# Plans generated offline by `flask precompute-plans` for common inputs
+precomputed_plans = PrecomputedPlans()
+
+# Bundled dish nutrition data: plans without OpenRouter, and a check on the calories it reports
+nutrition_db = create_nutrition_db()
+
+# 'json' asks the model for a compact schema-checked object; 'html' is the original free-form block
+MEAL_PLAN_FORMAT = os.getenv('MEAL_PLAN_FORMAT', 'json').lower()
+# Days of meals per LLM call; above 1 the later days are stored and served without another call (JSON only)
+MEAL_PLAN_DAYS = max(1, int(os.getenv('MEAL_PLAN_DAYS', '1'))) if MEAL_PLAN_FORMAT == 'json' else 1
+# Recent dish names listed in the prompt; repeats beyond that are caught locally and replaced
+MEAL_PROMPT_DISHES = int(os.getenv('MEAL_PROMPT_DISHES', '21'))
+
+# Meal plans are generated in the background so the calculator responds immediately
+MEAL_PLAN_ASYNC = os.getenv('MEAL_PLAN_ASYNC', '1') == '1'
+# Let the page stream tokens over Server-Sent Events instead of polling
+MEAL_PLAN_STREAM = os.getenv('MEAL_PLAN_STREAM', '0') == '1'
+meal_jobs = MealJobManager()
 
 def calculate_bmr(gender, weight, height, age):
     """Calculate BMR using Mifflin-St Jeor Equation"""
@@ -36,72 +110,112 @@ def calculate_bmr(gender, weight, height, age):
         bmr = 10 * weight + 6.25 * height - 5 * age - 161
     return bmr
 
+ACTIVITY_MULTIPLIERS = {
+    'sedentary': 1.2,
+    'light': 1.375,
+    'moderate': 1.55,
+    'very': 1.725,
+    'extra': 1.9
+}
+
 def calculate_calorie_needs(bmr, activity_level):
     """Calculate daily calorie needs based on activity level"""
-    activity_multipliers = {
-        'sedentary': 1.2,
-        'light': 1.375,
-        'moderate': 1.55,
-        'very': 1.725,
-        'extra': 1.9
-    }
-    return bmr * activity_multipliers.get(activity_level, 1.2)
+    return bmr * ACTIVITY_MULTIPLIERS.get(activity_level, 1.2)
 
-def get_food_recommendations(region, city, calorie_limit, food_preference, previous_meals=None):
-    """Get food recommendations from OpenRouter API only"""
-    # If no API client is available, return error message
-    if client is None:
-        print("OpenRouter API not available - No API key found")
-        return """
+def calculate_bmr_batch(genders, weights, heights, ages):
+    """Vectorized calculate_bmr over equal-length sequences; returns a list of floats"""
+    if np is None:
+        return [calculate_bmr(g, w, h, a) for g, w, h, a in zip(genders, weights, heights, ages)]
+    # Same operation order as the scalar formula so results match bit for bit
+    # A comprehension beats building a numpy string array for the comparison
+    offset = np.asarray([5.0 if gender == 'male' else -161.0 for gender in genders])
+    weights = np.asarray(weights, dtype=np.float64)
+    heights = np.asarray(heights, dtype=np.float64)
+    ages = np.asarray(ages, dtype=np.float64)
+    return (10 * weights + 6.25 * heights - 5 * ages + offset).tolist()
+
+def calculate_calorie_needs_batch(bmrs, activity_levels):
+    """Vectorized calculate_calorie_needs; returns a list of floats"""
+    multipliers = [ACTIVITY_MULTIPLIERS.get(level, 1.2) for level in activity_levels]
+    if np is None:
+        return [bmr * multiplier for bmr, multiplier in zip(bmrs, multipliers)]
+    return (np.asarray(bmrs, dtype=np.float64) * np.asarray(multipliers)).tolist()
+
+def get_cached_meal_plan(region, city, calorie_limit, food_preference, previous_meals=None):
+    """Return a precomputed or cached meal plan response for these inputs, or None"""
+    cache_key = make_meal_key(region, city, calorie_limit, food_preference)
+    previous_meals = as_index(previous_meals)
+    cached_plan = precomputed_plans.get(cache_key, previous_meals)
+    if cached_plan:
+        logger.debug("Precomputed meal plan hit for %s", cache_key)
+        MEAL_PLAN_SOURCES.labels('precomputed').inc()
+        return cached_plan
+    if meal_cache is None:
+        return None
+    cached_plan = meal_cache.get(cache_key, previous_meals)
+    if cached_plan:
+        logger.debug("Meal plan cache hit for %s", cache_key)
+        MEAL_PLAN_SOURCES.labels('cache').inc()
+    return cached_plan
+
+API_NOT_CONFIGURED_HTML = """
         <div class="error-message">
             <h4>API Configuration Required</h4>
             <p>To get personalized food recommendations, please configure your OpenRouter API key in the environment variables.</p>
             <p>Visit <a href="https://openrouter.ai/keys" target="_blank">https://openrouter.ai/keys</a> to get your free API key.</p>
         </div>
         """
-    
-    try:
-        # Create dietary preference text for prompt
-        preference_text = {
-            'vegetarian': 'strictly vegetarian (no meat, poultry, fish or seafood)',
-            'non-vegetarian': 'non-vegetarian (can include meat, poultry, fish and seafood)',
-            'eggetarian': 'eggetarian (vegetarian diet with eggs allowed)',
-            'mixed': 'mixed diet (combination of vegetarian and non-vegetarian options)'
-        }.get(food_preference, 'mixed diet')
-        
-        # Add previous meals context if provided
-        previous_meals_text = ""
-        if previous_meals:
-            previous_meals_text = f"\nIMPORTANT: Avoid recommending these recently suggested meals: {', '.join(previous_meals[:10])}\nProvide NEW and DIFFERENT meal options to ensure variety."
-        
-        # Include city-specific context if available
-        location_context = f"{region} state"
-        if city and city != "":
-            location_context = f"{city} city, {region} state"
-        
-        # Calculate calorie distribution for meals
-        breakfast_calories = int(calorie_limit * 0.25)  # 25% for breakfast
-        lunch_calories = int(calorie_limit * 0.40)      # 40% for lunch
-        dinner_calories = int(calorie_limit * 0.35)     # 35% for dinner
-        
-        prompt = f"""You are a nutritionist expert specializing in authentic Indian regional cuisine. Create a personalized daily meal plan for {location_context} with the following strict requirements:
 
-DIETARY REQUIREMENTS:
-- Total daily calories: {calorie_limit}
-- Meal distribution: Breakfast (~{breakfast_calories} cal), Lunch (~{lunch_calories} cal), Dinner (~{dinner_calories} cal)
-- Diet type: {preference_text}
-- Regional focus: Authentic dishes from {location_context}
-{previous_meals_text}
+MEAL_PLAN_SYSTEM_PROMPT = "You are a certified nutritionist and culinary expert with deep knowledge of traditional Indian regional cuisines. Your expertise covers authentic recipes, nutritional values, and cultural significance of dishes from all Indian states. You provide precise, culturally accurate meal recommendations with exact calorie calculations based on standard serving sizes. Always follow the user's dietary restrictions strictly and focus on authentic local dishes from the specified region."
+OPENROUTER_HEADERS = {
+    "HTTP-Referer": "https://bmr-calculator.up.railway.app",
+    "X-Title": "BMI Calculator App"
+}
+FOOD_PREFERENCE_TEXT = {
+    'vegetarian': 'strictly vegetarian (no meat, poultry, fish or seafood)',
+    'non-vegetarian': 'non-vegetarian (can include meat, poultry, fish and seafood)',
+    'eggetarian': 'eggetarian (vegetarian diet with eggs allowed)',
+    'mixed': 'mixed diet (combination of vegetarian and non-vegetarian options)'
+}
 
-MEAL REQUIREMENTS:
-1. Each meal must be a SINGLE traditional dish (not multiple items)
-2. Use only authentic recipes from {location_context}
-3. Include regional cooking methods and local ingredients
-4. Ensure dietary restrictions are followed strictly
-5. Provide accurate calorie counts based on standard serving sizes
-6. Mention key nutritional benefits and local significance
-
-OUTPUT FORMAT (Must follow exactly):
+def build_meal_plan_request(region, city, calorie_limit, food_preference, previous_meals=None, days=1):
+    """chat.completions.create arguments for a meal plan (days > 1 needs the JSON format)"""
+    # Create dietary preference text for prompt
+    preference_text = FOOD_PREFERENCE_TEXT.get(food_preference, 'mixed diet')
+    
+    # Add previous meals context if provided: compact dish names, most recent first
+    previous_meals_text = ""
+    if previous_meals:
+        previous_meals_text = f"\nIMPORTANT: Avoid recommending these recently suggested meals: {', '.join(previous_meals[:MEAL_PROMPT_DISHES])}\nProvide NEW and DIFFERENT meal options to ensure variety."
+    
+    # Include city-specific context if available
+    location_context = f"{region} state"
+    if city and city != "":
+        location_context = f"{city} city, {region} state"
+    
+    # Calculate calorie distribution for meals
+    breakfast_calories = int(calorie_limit * 0.25)  # 25% for breakfast
+    lunch_calories = int(calorie_limit * 0.40)      # 40% for lunch
+    dinner_calories = int(calorie_limit * 0.35)     # 35% for dinner
+    
+    plan_scope = "daily meal plan"
+    variety_rule = ""
+    if MEAL_PLAN_FORMAT == 'json':
+        # Compact structured output: fewer tokens and deterministic parsing
+        day_format = f"""{{"breakfast": {{"name": "<dish name in English>", "calories": {breakfast_calories}, "description": "<2-3 sentences: main ingredients, preparation, why it's popular in {location_context}, key nutritional benefits>"}}, "lunch": {{...same fields, ~{lunch_calories} calories}}, "dinner": {{...same fields, ~{dinner_calories} calories}}}}"""
+        if days > 1:
+            # One call covers several days, so the long system prompt and format block are paid once
+            plan_scope = f"{days}-day meal plan (breakfast, lunch and dinner for each day)"
+            variety_rule = f"\n7. Never repeat a dish: all {days * 3} meals across the {days} days must be different dishes"
+            output_format = f"""OUTPUT FORMAT: Respond with only this JSON object, no other text:
+{{"days": [<exactly {days} day objects, in order>]}}
+where each day object is:
+{day_format}"""
+        else:
+            output_format = f"""OUTPUT FORMAT: Respond with only this JSON object, no other text:
+{day_format}"""
+    else:
+        output_format = f"""OUTPUT FORMAT (Must follow exactly):
 <div class="meal-plan">
     <div class="meal-section">
         <div class="meal-title">Breakfast</div>
@@ -130,34 +244,110 @@ OUTPUT FORMAT (Must follow exactly):
 </div>
 
 IMPORTANT: Only respond with the HTML structure above. Do not add any extra text, explanations, or formatting outside the specified structure."""
+    
+    prompt = f"""You are a nutritionist expert specializing in authentic Indian regional cuisine. Create a personalized {plan_scope} for {location_context} with the following strict requirements:
 
-        
-        print(f"Making API call for {region} cuisine, {calorie_limit} calories, {preference_text}")
-        
-        response = client.chat.completions.create(
-            model="deepseek/deepseek-chat",  # Updated to DeepSeek V3.1 (free)
-            messages=[
-                {"role": "system", "content": f"You are a certified nutritionist and culinary expert with deep knowledge of traditional Indian regional cuisines. Your expertise covers authentic recipes, nutritional values, and cultural significance of dishes from all Indian states. You provide precise, culturally accurate meal recommendations with exact calorie calculations based on standard serving sizes. Always follow the user's dietary restrictions strictly and focus on authentic local dishes from the specified region."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1000,
-            temperature=0.7,  # Add some creativity while maintaining accuracy
-            extra_headers={
-                "HTTP-Referer": "https://bmr-calculator.up.railway.app",
-                "X-Title": "BMI Calculator App"
-            }
-        )
-        
-        print("DeepSeek V3.1 API call successful!")
-        api_response = response.choices[0].message.content
-        print(f"API Response length: {len(api_response)} characters")
-        print(f"API Response preview: {api_response[:150]}...")
-        return api_response
-        
-    except Exception as e:
+DIETARY REQUIREMENTS:
+- Total daily calories: {calorie_limit}
+- Meal distribution: Breakfast (~{breakfast_calories} cal), Lunch (~{lunch_calories} cal), Dinner (~{dinner_calories} cal)
+- Diet type: {preference_text}
+- Regional focus: Authentic dishes from {location_context}
+{previous_meals_text}
+
+MEAL REQUIREMENTS:
+1. Each meal must be a SINGLE traditional dish (not multiple items)
+2. Use only authentic recipes from {location_context}
+3. Include regional cooking methods and local ingredients
+4. Ensure dietary restrictions are followed strictly
+5. Provide accurate calorie counts based on standard serving sizes
+6. Mention key nutritional benefits and local significance{variety_rule}
+
+{output_format}"""
+
+    
+    logger.debug("Making API call for %s cuisine, %s calories, %s", region, calorie_limit, preference_text)
+    
+    request_args = dict(
+        model="deepseek/deepseek-chat",  # Updated to DeepSeek V3.1 (free)
+        messages=[
+            {"role": "system", "content": MEAL_PLAN_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=1000,
+        temperature=0.7,  # Add some creativity while maintaining accuracy
+        extra_headers=OPENROUTER_HEADERS
+    )
+    if MEAL_PLAN_FORMAT == 'json' and days > 1:
+        request_args['max_tokens'] = 450 * days + 150
+        request_args['response_format'] = {
+            "type": "json_schema",
+            "json_schema": {"name": "meal_plan_days", "strict": True, "schema": meal_parser.MULTI_DAY_PLAN_SCHEMA}
+        }
+    elif MEAL_PLAN_FORMAT == 'json':
+        request_args['max_tokens'] = 600
+        request_args['response_format'] = {
+            "type": "json_schema",
+            "json_schema": {"name": "meal_plan", "strict": True, "schema": meal_parser.MEAL_PLAN_SCHEMA}
+        }
+    return request_args
+
+def build_single_meal_request(meal_type, region, city, calories, food_preference, avoid_dishes):
+    """chat.completions.create arguments for one replacement meal that avoids avoid_dishes"""
+    location_context = f"{city} city, {region} state" if city else f"{region} state"
+    preference_text = FOOD_PREFERENCE_TEXT.get(food_preference, 'mixed diet')
+    prompt = f"""Suggest one authentic {meal_type} dish from {location_context} of about {calories} calories.
+Diet type: {preference_text}
+It must be a SINGLE traditional dish and must not be any of these or a variant of them: {', '.join(avoid_dishes)}
+
+OUTPUT FORMAT: Respond with only this JSON object, no other text:
+{{"name": "<dish name in English>", "calories": {calories}, "description": "<2-3 sentences: main ingredients, preparation, why it's popular in {location_context}, key nutritional benefits>"}}"""
+    return dict(
+        model="deepseek/deepseek-chat",
+        messages=[
+            {"role": "system", "content": MEAL_PLAN_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=250,
+        temperature=0.9,  # A different dish is the point of the call
+        extra_headers=OPENROUTER_HEADERS,
+        response_format={
+            "type": "json_schema",
+            "json_schema": {"name": "meal", "strict": True, "schema": meal_parser.MEAL_SCHEMA}
+        }
+    )
+
+def record_llm_meal_plan(api_response, usage, cache_key):
+    """Count a fresh LLM response and cache it if it parses into a usable plan"""
+    MEAL_PLAN_SOURCES.labels('llm').inc()
+    if usage is not None:
+        LLM_TOKENS.labels('prompt').inc(usage.prompt_tokens or 0)
+        LLM_TOKENS.labels('completion').inc(usage.completion_tokens or 0)
+    logger.debug("DeepSeek V3.1 API call successful: %d characters, preview %.150s",
+                 len(api_response), api_response)
+    
+    # Only cache responses that parse into a usable plan
+    if cache_key is not None:
+        parsed = parse_meal_plan(api_response, check_calories=False)
+        if parsed:
+            dishes = [meal['name'] for meal in parsed.values()]
+            meal_cache.put(cache_key, api_response, dishes)
+
+def meal_plan_failure(e, cache_key):
+    """What to show after the OpenRouter call failed: a cached plan or an error block"""
+    # While OpenRouter is failing, any cached plan beats an error message
+    if cache_key is not None:
+        fallback_plan = meal_cache.get(cache_key)
+        if fallback_plan:
+            logger.warning("DeepSeek API unavailable (%s), serving cached plan", e)
+            MEAL_PLAN_SOURCES.labels('stale_cache').inc()
+            return fallback_plan
+    MEAL_PLAN_SOURCES.labels('error').inc()
+    if isinstance(e, CircuitOpenError):
+        logger.warning("DeepSeek API circuit breaker open - skipping call")
+    else:
         # If API call fails, return error message
-        print(f"DeepSeek API Error: {e}")
-        return f"""
+        logger.error("DeepSeek API Error: %s", e)
+    return f"""
         <div class="error-message">
             <h4>API Error</h4>
             <p>Unable to get food recommendations at this time.</p>
@@ -166,103 +356,231 @@ IMPORTANT: Only respond with the HTML structure above. Do not add any extra text
         </div>
         """
 
-def parse_meal_plan(html_content):
-    """Parse the HTML response to extract meal information with improved error handling"""
+def meal_plan_cache_key(region, city, calorie_limit, food_preference):
+    """Cache key for a fresh plan, or None without a meal cache"""
+    if meal_cache is None:
+        return None
+    return meal_cache.make_key(region, city, calorie_limit, food_preference)
+
+def get_food_recommendations(region, city, calorie_limit, food_preference, previous_meals=None, on_token=None,
+                             use_cache=True, username=None):
+    """Get food recommendations from OpenRouter API only.
+    
+    If on_token is given the response is streamed and on_token is called
+    with each piece of text as it arrives. use_cache=False always asks the LLM.
+    username picks the user's SINGLE_FLIGHT_VARIANTS slot when coalescing.
+    """
+    # Serve a precomputed or cached plan for the same region/calorie bucket/diet if we have one
+    if use_cache:
+        cached_plan = get_cached_meal_plan(region, city, calorie_limit, food_preference, previous_meals)
+        if cached_plan:
+            return cached_plan
+    cache_key = meal_plan_cache_key(region, city, calorie_limit, food_preference)
+    if cache_key is not None:
+        calorie_limit = cache_key[2]  # Generate for the bucket so the plan fits everyone in it
+    
+    # If no API client is available, return error message
+    if client is None:
+        logger.warning("OpenRouter API not available - No API key found")
+        return API_NOT_CONFIGURED_HTML
+    
     try:
-        import re
-        
-        # If it's an error message, return None
-        if 'error-message' in html_content or 'API Configuration Required' in html_content:
-            return None
-        
-        print(f"Parsing HTML content (length: {len(html_content)})")
-        
-        # Extract meal sections using more flexible regex patterns
-        meal_sections = re.findall(r'<div class="meal-section">(.*?)</div>\s*</div>', html_content, re.DOTALL)
-        
-        # If the first pattern doesn't work, try alternative patterns
-        if not meal_sections:
-            meal_sections = re.findall(r'<div class="meal-section">(.*?)</div>', html_content, re.DOTALL | re.MULTILINE)
-        
-        meals = {}
-        meal_types = ['breakfast', 'lunch', 'dinner']
-        
-        print(f"Found {len(meal_sections)} meal sections")
-        
-        for i, section in enumerate(meal_sections[:3]):  # Only take first 3 meals
-            meal_type = meal_types[i] if i < len(meal_types) else f'meal_{i+1}'
-            
-            print(f"Processing {meal_type} section: {section[:100]}...")
-            
-            # Extract dish name with multiple patterns
-            dish_match = re.search(r'<h4[^>]*>(.*?)</h4>', section, re.DOTALL)
-            if not dish_match:
-                dish_match = re.search(r'<h3[^>]*>(.*?)</h3>', section, re.DOTALL)
-            
-            dish_name = dish_match.group(1).strip() if dish_match else f'Traditional {meal_type.title()}'
-            dish_name = re.sub(r'<.*?>', '', dish_name)  # Remove any HTML tags from dish name
-            
-            # Extract calories with more flexible patterns
-            calories_match = re.search(r'(\d+)\s*(?:calories?|cal|kcal)', section, re.IGNORECASE)
-            if not calories_match:
-                # Look for numbers that might be calories (typically 100-800 range for individual meals)
-                number_matches = re.findall(r'\b(\d{2,3})\b', section)
-                potential_calories = [int(n) for n in number_matches if 100 <= int(n) <= 800]
-                calories = potential_calories[0] if potential_calories else 300
-            else:
-                calories = int(calories_match.group(1))
-            
-            # Extract description with flexible patterns
-            desc_match = re.search(r'<p class="food-description"[^>]*>(.*?)</p>', section, re.DOTALL)
-            if not desc_match:
-                desc_match = re.search(r'<p[^>]*>(.*?)</p>', section, re.DOTALL)
-            
-            if desc_match:
-                description = desc_match.group(1).strip()
-                description = re.sub(r'<.*?>', '', description)  # Remove HTML tags
-                description = re.sub(r'\s+', ' ', description)   # Normalize whitespace
-            else:
-                description = f'Authentic {meal_type} dish with traditional ingredients and regional flavors'
-            
-            meals[meal_type] = {
-                'description': f"{dish_name}. {description}",
-                'calories': calories
-            }
-            
-            print(f"Parsed {meal_type}: {dish_name} ({calories} cal)")
-        
-        # If we couldn't parse properly, return None
-        if not meals:
-            print("No meals parsed successfully")
-            return None
-        
-        print(f"Successfully parsed {len(meals)} meals")
-        return meals
-        
+        request_args = build_meal_plan_request(region, city, calorie_limit, food_preference, previous_meals)
+        if single_flight is None:
+            return request_meal_plan(request_args, on_token, cache_key)
+        # Identical concurrent requests share one upstream call
+        flight_key = meal_plan_flight_key(region, city, calorie_limit, food_preference, cache_key, username)
+        api_response, shared = single_flight.do(
+            flight_key, lambda: request_meal_plan(request_args, on_token, cache_key),
+            (lambda: meal_cache.get(cache_key, previous_meals, refresh=True)) if cache_key is not None else None)
+        # A shared plan may repeat this user's recent dishes; generate_meal_plan replaces those meals
+        if shared and on_token is not None:
+            on_token(api_response)
+        return api_response
+    except Exception as e:
+        return meal_plan_failure(e, cache_key)
+
+def request_meal_plan(request_args, on_token, cache_key):
+    """One routed (and possibly hedged) OpenRouter request, streamed to on_token if given; returns the text"""
+    api_response, usage = model_router.complete(client, request_args, is_usable_meal_plan, on_token)
+    record_llm_meal_plan(api_response, usage, cache_key)
+    return api_response
+
+def is_usable_meal_plan(content):
+    """Whether a response parses into a meal plan; hedged requests wait for one that does"""
+    try:
+        return meal_parser.parse(content) is not None
+    except Exception:
+        return False
+
+async def get_food_recommendations_async(region, city, calorie_limit, food_preference, previous_meals=None,
+                                         on_token=None, use_cache=True, username=None):
+    """get_food_recommendations as a coroutine on async_client's event loop.
+
+    The OpenRouter call is awaited; cache and SQLite work runs in the
+    loop's thread pool so it never blocks other in-flight calls.
+    """
+    if use_cache:
+        cached_plan = await asyncio.to_thread(get_cached_meal_plan, region, city, calorie_limit,
+                                              food_preference, previous_meals)
+        if cached_plan:
+            return cached_plan
+    cache_key = meal_plan_cache_key(region, city, calorie_limit, food_preference)
+    if cache_key is not None:
+        calorie_limit = cache_key[2]
+    
+    try:
+        request_args = build_meal_plan_request(region, city, calorie_limit, food_preference, previous_meals)
+        if single_flight is None:
+            return await request_meal_plan_async(request_args, on_token, cache_key)
+        flight_key = meal_plan_flight_key(region, city, calorie_limit, food_preference, cache_key, username)
+        shared_result = None
+        if cache_key is not None:
+            shared_result = lambda: asyncio.to_thread(meal_cache.get, cache_key, previous_meals, refresh=True)
+        api_response, shared = await single_flight.do_async(
+            flight_key, lambda: request_meal_plan_async(request_args, on_token, cache_key), shared_result)
+        if shared and on_token is not None:
+            on_token(api_response)
+        return api_response
     except Exception as e:
-        print(f"Error parsing meal plan: {e}")
+        return await asyncio.to_thread(meal_plan_failure, e, cache_key)
+
+async def request_meal_plan_async(request_args, on_token, cache_key):
+    """request_meal_plan on async_client"""
+    api_response, usage = await model_router.complete_async(async_client, request_args, is_usable_meal_plan,
+                                                            on_token)
+    await asyncio.to_thread(record_llm_meal_plan, api_response, usage, cache_key)
+    return api_response
+
+def meal_plan_flight_key(region, city, calorie_limit, food_preference, cache_key, username):
+    """Coalescing key: the normalized prompt inputs plus the user's variation slot"""
+    key = cache_key if cache_key is not None else make_meal_key(region, city, calorie_limit, food_preference)
+    return key + (variant_slot(username),)
+
+def repeated_meals(meal_plan, recent):
+    """Meal types whose dish nearly repeats a recent dish or an earlier meal of the same plan.
+
+    recent is the user's DishIndex; the plan's other dishes are added to it.
+    """
+    repeated = []
+    for meal_type, meal in meal_plan.items():
+        if recent.match(meal['name']) is not None:
+            repeated.append(meal_type)
+        else:
+            recent.add(meal['name'])
+    return repeated
+
+def avoided_dishes(meal_plan, previous_meals):
+    """Dish names a replacement must avoid: the rest of the plan and the most recent history"""
+    return [meal['name'] for meal in meal_plan.values()] + list(previous_meals or ())[:MEAL_PROMPT_DISHES]
+
+def accept_replacement(meal_plan, meal_type, content, usage, recent):
+    """Swap in a replacement meal if it parses and is really new; returns True if it was"""
+    if usage is not None:
+        LLM_TOKENS.labels('prompt').inc(usage.prompt_tokens or 0)
+        LLM_TOKENS.labels('completion').inc(usage.completion_tokens or 0)
+    meal = meal_parser.parse_meal(content, meal_type)
+    if meal is None or recent.match(meal.name) is not None:
+        MEAL_REPEATS.labels('kept').inc()
+        return False
+    MEAL_REPEATS.labels('replaced').inc()
+    meal_plan[meal_type] = meal.to_dict()
+    recent.add(meal.name)
+    return True
+
+def replace_repeated_meals(meal_plan, region, city, food_preference, previous_meals):
+    """Regenerate just the meals that repeat a recent dish, one small call each.
+
+    A meal whose replacement fails or still repeats is kept as it was.
+    """
+    recent = DishIndex(previous_meals or ())
+    for meal_type in repeated_meals(meal_plan, recent):
+        if client is None:
+            MEAL_REPEATS.labels('kept').inc()
+            continue
+        logger.info("%s '%s' repeats a recent dish, asking for a replacement", meal_type, meal_plan[meal_type]['name'])
+        request_args = build_single_meal_request(meal_type, region, city, meal_plan[meal_type]['calories'],
+                                                 food_preference, avoided_dishes(meal_plan, previous_meals))
+        try:
+            content, usage = model_router.complete(
+                client, request_args, lambda content: meal_parser.parse_meal(content, meal_type) is not None)
+            accept_replacement(meal_plan, meal_type, content, usage, recent)
+        except Exception as e:
+            logger.warning("Replacement %s failed (%s), keeping the repeated dish", meal_type, e)
+            MEAL_REPEATS.labels('kept').inc()
+    return meal_plan
+
+async def replace_repeated_meals_async(meal_plan, region, city, food_preference, previous_meals):
+    """replace_repeated_meals on async_client"""
+    recent = DishIndex(previous_meals or ())
+    for meal_type in repeated_meals(meal_plan, recent):
+        logger.info("%s '%s' repeats a recent dish, asking for a replacement", meal_type, meal_plan[meal_type]['name'])
+        request_args = build_single_meal_request(meal_type, region, city, meal_plan[meal_type]['calories'],
+                                                 food_preference, avoided_dishes(meal_plan, previous_meals))
+        try:
+            content, usage = await model_router.complete_async(
+                async_client, request_args, lambda content: meal_parser.parse_meal(content, meal_type) is not None)
+            accept_replacement(meal_plan, meal_type, content, usage, recent)
+        except Exception as e:
+            logger.warning("Replacement %s failed (%s), keeping the repeated dish", meal_type, e)
+            MEAL_REPEATS.labels('kept').inc()
+    return meal_plan
+
+def parse_meal_plan(html_content, check_calories=True):
+    """Parse the JSON or HTML response into {meal_type: {'name', 'description', 'calories'}}.
+    
+    check_calories corrects calories that are implausible for dishes in the nutrition data.
+    """
+    try:
+        meal_plan = meal_parser.parse(html_content)
+    except Exception as e:
+        logger.exception("Error parsing meal plan: %s", e)
+        MEAL_PLAN_PARSES.labels('failure').inc()
         # Return None if parsing fails
         return None
+    
+    if meal_plan is None:
+        if html_content and 'error-message' not in html_content:
+            logger.warning("No meals parsed successfully")
+            MEAL_PLAN_PARSES.labels('failure').inc()
+        else:
+            MEAL_PLAN_PARSES.labels('error_response').inc()
+        return None
+    MEAL_PLAN_PARSES.labels('success').inc()
+    meal_plan = meal_plan.to_dict()
+    if check_calories and nutrition_db is not None:
+        for result in nutrition_db.check_calories(meal_plan).values():
+            MEAL_CALORIE_CHECKS.labels(result).inc()
+    return meal_plan
+
+def offline_meal_plan(region, calorie_limit, food_preference, previous_meals=None):
+    """A meal plan from the bundled nutrition data, for when OpenRouter is unavailable; or None"""
+    if nutrition_db is None:
+        return None
+    meal_plan = nutrition_db.plan(region, calorie_limit, food_preference, previous_meals)
+    if meal_plan is None:
+        return None
+    MEAL_PLAN_SOURCES.labels('offline').inc()
+    return meal_plan.to_dict()
 
 # User Data Management Functions
+user_store = create_user_store()
+# Meal, BMR and completion history live in an append-only log, not the user record
+event_log = create_event_log(user_store)
+# Workout planner events, uploaded in batches and stored column-wise per user and month
+workout_store = workouts.create_workout_store()
+
 def load_user_data():
-    """Load user data from JSON file"""
-    try:
-        with open('user_data.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {"users": {}}
-    except json.JSONDecodeError:
-        return {"users": {}}
+    """Load all user data (legacy whole-store view)"""
+    return {"users": user_store.all_users()}
 
 def save_user_data(data):
-    """Save user data to JSON file"""
+    """Save a whole {"users": {...}} blob into the user store"""
     try:
-        with open('user_data.json', 'w') as f:
-            json.dump(data, f, indent=2)
+        user_store.put_users(data.get('users', {}))
         return True
     except Exception as e:
-        print(f"Error saving user data: {e}")
+        logger.error("Error saving user data: %s", e)
         return False
 
 def hash_password(password):
@@ -275,26 +593,21 @@ def verify_password(password, hashed):
 
 def create_user(username, email, password):
     """Create a new user account"""
-    data = load_user_data()
-    
-    # Check if user already exists
-    if username in data['users']:
+    # Check if user already exists (usernames and emails are unique case-insensitively)
+    if user_store.find_user_by('username', username) is not None:
         return False, "Username already exists"
     
     # Check if email already exists
-    for user_data in data['users'].values():
-        if user_data.get('email') == email:
-            return False, "Email already registered"
+    if user_store.find_user_by_email(email) is not None:
+        return False, "Email already registered"
     
     # Create new user
-    data['users'][username] = {
+    new_user = {
         'username': username,
         'email': email,
         'password_hash': hash_password(password),
         'created_at': datetime.now().isoformat(),
         'profile': {},
-        'bmr_history': [],
-        'meal_history': [],
         'goals': {
             'daily_water': {'target': 8, 'completed': False, 'date_completed': None},
             'daily_exercise': {'target': '30 minutes', 'completed': False, 'date_completed': None},
@@ -307,7 +620,12 @@ def create_user(username, email, password):
             'completed_today': 0,
             'completion_percentage': 0,
             'streak_days': 0,
-            'last_activity': datetime.now().date().isoformat()
+            'last_activity': datetime.now().date().isoformat(),
+            'day': datetime.now().date().isoformat(),
+            'mask': 0,
+            'history': '',
+            'history_start': datetime.now().date().isoformat(),
+            'last_full_day': None
         },
         'settings': {
             'email_notifications': True,
@@ -317,108 +635,279 @@ def create_user(username, email, password):
         }
     }
     
-    if save_user_data(data):
-        return True, "User created successfully"
-    else:
+    try:
+        if not user_store.add_user(username, new_user):
+            # Lost a race with a concurrent signup
+            if user_store.find_user_by_email(email) not in (None, username):
+                return False, "Email already registered"
+            return False, "Username already exists"
+    except Exception as e:
+        logger.error("Error saving user data: %s", e)
         return False, "Error saving user data"
+    return True, "User created successfully"
 
 def authenticate_user(username, password):
     """Authenticate user login"""
-    data = load_user_data()
+    user_data = user_store.get_user(username)
     
-    if username not in data['users']:
+    if user_data is None:
         return False, "User not found"
     
-    user_data = data['users'][username]
     if verify_password(password, user_data['password_hash']):
         return True, "Login successful"
     else:
         return False, "Invalid password"
 
+def resolve_username(username):
+    """The stored spelling of a username typed in any case, or None"""
+    if user_store.get_user(username) is not None:
+        return username
+    return user_store.find_user_by('username', username)
+
 def get_user_data(username):
-    """Get user data by username"""
-    data = load_user_data()
-    if username in data['users']:
-        return data['users'][username]
-    return None
+    """Get user data by username, with yesterday's goals rolled over on the first read of the day"""
+    user = user_store.get_user(username)
+    if user is not None and 'goals' in user and 'progress' in user and goals.is_stale(user):
+        user_store.update_user(username, goals.roll_over)
+        user = user_store.get_user(username)
+    return user
 
-def update_user_progress(username, goal_id):
-    """Update user progress for a specific goal"""
-    data = load_user_data()
-    
-    if username not in data['users']:
-        return False
-    
-    user = data['users'][username]
-    today = datetime.now().date().isoformat()
+def update_user_progress(username, goal_id, completed=True):
+    """Check or uncheck a goal for today"""
+    today = datetime.now().date()
     
-    if goal_id in user['goals']:
-        user['goals'][goal_id]['completed'] = True
-        user['goals'][goal_id]['date_completed'] = today
-        
-        # Update progress
-        completed_count = sum(1 for goal in user['goals'].values() if goal['completed'])
-        user['progress']['completed_today'] = completed_count
-        user['progress']['completion_percentage'] = (completed_count / user['progress']['total_goals']) * 100
-        user['progress']['last_activity'] = today
+    try:
+        at = int(time.time() * 1000)
         
-        # Update streak if all goals completed
-        if completed_count == user['progress']['total_goals']:
-            user['progress']['streak_days'] += 1
+        def toggle(user):
+            if goals.goal_bit(user, goal_id) is None:
+                return None
+            return goals.set_goal(user, goal_id, completed, today, at=at)
         
-        return save_user_data(data)
-    
-    return False
+        # None: no such user or goal; False: the goal was already in that state
+        changed = user_store.update_user(username, toggle)
+        if changed is None:
+            return False
+        # Only real flips are logged, so trends count each goal at most once a day
+        if changed:
+            event_log.append(username, GOAL, {'goal_id': goal_id, 'completed': completed}, day=today.isoformat())
+        return True
+    except Exception as e:
+        logger.error("Error saving user data: %s", e)
+        return False
 
 def add_meal_to_history(username, meal_plan):
     """Add meal plan to user's history"""
-    data = load_user_data()
-    
-    if username not in data['users']:
-        return False
-    
-    user = data['users'][username]
     today = datetime.now().date().isoformat()
     
     # Create meal plan array
     meal_descriptions = []
+    dishes = []
     if meal_plan:
         for meal_type, meal_info in meal_plan.items():
             meal_descriptions.append(f"{meal_type.title()}: {meal_info['description']}")
+            dishes.append(meal_info['name'])
     
-    # Add to history
+    # Add to history; the bare dish names feed the duplicate check and the prompt
     meal_entry = {
         'date': today,
-        'meal_plan': meal_descriptions
+        'meal_plan': meal_descriptions,
+        'dishes': dishes,
+        'calories': sum(meal_info.get('calories') or 0 for meal_info in (meal_plan or {}).values())
     }
     
-    user['meal_history'].append(meal_entry)
-    
-    # Keep only last 30 days of history
-    if len(user['meal_history']) > 30:
-        user['meal_history'] = user['meal_history'][-30:]
-    
-    return save_user_data(data)
+    try:
+        event_log.append(username, MEAL, meal_entry, day=today)
+        return True
+    except Exception as e:
+        logger.error("Error saving user data: %s", e)
+        return False
 
 def get_previous_meals(username, days=7):
-    """Get user's previous meal recommendations to avoid duplicates"""
-    data = load_user_data()
-    
-    if username not in data['users']:
-        return []
-    
-    user = data['users'][username]
-    recent_meals = []
-    
-    # Get meals from last X days
-    cutoff_date = datetime.now().date() - timedelta(days=days)
+    """Distinct dish names the user was given recently, most recent first, to avoid duplicates"""
+    recent = DishIndex()
     
-    for meal_entry in user['meal_history']:
-        entry_date = datetime.fromisoformat(meal_entry['date']).date()
-        if entry_date >= cutoff_date:
-            recent_meals.extend(meal_entry['meal_plan'])
+    # Only the last X days of the log are read
+    for day, meal_entry in reversed(event_log.recent(username, MEAL, days)):
+        # Entries written before dish names were stored only have the description lines
+        dishes = meal_entry.get('dishes') or [dish_from_history(line) for line in meal_entry['meal_plan']]
+        for dish in dishes:
+            if dish:
+                recent.add(dish)
     
-    return recent_meals
+    return recent.names()
+
+def get_meal_history(username, limit=5):
+    """Most recent meal history entries, oldest first"""
+    return [meal_entry for day, meal_entry in event_log.range(username, MEAL, limit=limit)]
+
+def render_meal_plan_html(meal_plan):
+    """Render a parsed meal plan as the classic meal-plan HTML block"""
+    return render_template('meal_plan_block.html', meal_plan=meal_plan)
+
+def generate_meal_plan(username, state, city, daily_calories, food_preference, previous_meals, on_token=None):
+    """Generate, parse and record a meal plan; returns the parsed plan or None"""
+    if MEAL_PLAN_DAYS > 1:
+        meal_plan = generate_multi_day_plan(username, state, city, daily_calories, food_preference, previous_meals)
+        if meal_plan:
+            add_meal_to_history(username, meal_plan)
+            return meal_plan
+    meal_plan_html = get_food_recommendations(state, city, int(daily_calories), food_preference,
+                                              previous_meals, on_token=on_token, username=username)
+    meal_plan = parse_meal_plan(meal_plan_html)
+    if meal_plan:
+        meal_plan = replace_repeated_meals(meal_plan, state, city, food_preference, previous_meals)
+    else:
+        meal_plan = offline_meal_plan(state, int(daily_calories), food_preference, previous_meals)
+    return record_meal_plan(username, meal_plan)
+
+async def generate_meal_plan_async(username, state, city, daily_calories, food_preference, previous_meals,
+                                   on_token=None):
+    """generate_meal_plan as a coroutine for async_client's event loop"""
+    if MEAL_PLAN_DAYS > 1:
+        meal_plan = await generate_multi_day_plan_async(username, state, city, daily_calories, food_preference,
+                                                        previous_meals)
+        if meal_plan:
+            await asyncio.to_thread(add_meal_to_history, username, meal_plan)
+            return meal_plan
+    meal_plan_html = await get_food_recommendations_async(state, city, int(daily_calories), food_preference,
+                                                          previous_meals, on_token=on_token, username=username)
+    meal_plan = await asyncio.to_thread(parse_meal_plan, meal_plan_html)
+    if meal_plan:
+        meal_plan = await replace_repeated_meals_async(meal_plan, state, city, food_preference, previous_meals)
+    else:
+        meal_plan = offline_meal_plan(state, int(daily_calories), food_preference, previous_meals)
+    return await asyncio.to_thread(record_meal_plan, username, meal_plan)
+
+def planned_meal_inputs(state, city, daily_calories, food_preference):
+    """The inputs a stored multi-day plan was made for; a later submit must match them to reuse it"""
+    return list(make_meal_key(state, city, daily_calories, food_preference))
+
+def get_planned_meals(username, state, city, daily_calories, food_preference):
+    """Today's meals from the user's stored multi-day plan for the same inputs, or None"""
+    entry = event_log.latest(username, PLAN, day=datetime.now().date().isoformat())
+    if entry and entry.get('inputs') == planned_meal_inputs(state, city, daily_calories, food_preference):
+        return entry['meal_plan']
+    return None
+
+def distinct_days(plans, previous_meals=None):
+    """The leading days of a multi-day plan in which no dish repeats or was suggested recently"""
+    recent = DishIndex(previous_meals or ())
+    kept = []
+    for plan in plans:
+        # add() is False for a near repeat, including one within the same day
+        if not all([recent.add(meal.name) for meal in plan]):
+            break
+        kept.append(plan)
+    return kept
+
+def store_multi_day_plan(username, inputs, previous_meals, api_response, usage):
+    """Validate a multi-day response, store one PLAN event per day and return today's plan (or None)"""
+    MEAL_PLAN_SOURCES.labels('llm').inc()
+    if usage is not None:
+        LLM_TOKENS.labels('prompt').inc(usage.prompt_tokens or 0)
+        LLM_TOKENS.labels('completion').inc(usage.completion_tokens or 0)
+    plans = meal_parser.parse_days(api_response)
+    if plans is None:
+        MEAL_PLAN_PARSES.labels('failure').inc()
+        logger.warning("Multi-day meal plan did not match the schema")
+        return None
+    MEAL_PLAN_PARSES.labels('success').inc()
+    kept = distinct_days(plans, previous_meals)
+    if len(kept) < len(plans):
+        logger.info("Keeping %d of %d planned days; day %d repeats a dish", len(kept), len(plans), len(kept) + 1)
+    if not kept:
+        return None
+    today = datetime.now().date()
+    event_log.append_many([
+        (username, PLAN, (today + timedelta(days=offset)).isoformat(),
+         {'inputs': inputs, 'meal_plan': plan.to_dict()})
+        for offset, plan in enumerate(kept)
+    ])
+    return kept[0].to_dict()
+
+def generate_multi_day_plan(username, state, city, daily_calories, food_preference, previous_meals):
+    """Ask for MEAL_PLAN_DAYS days in one call and store them; returns today's plan or None"""
+    request_args = build_meal_plan_request(state, city, int(daily_calories), food_preference, previous_meals,
+                                           days=MEAL_PLAN_DAYS)
+    try:
+        content, usage = model_router.complete(client, request_args, is_usable_multi_day_plan)
+    except Exception as e:
+        logger.warning("Multi-day meal plan failed (%s), falling back to a single day", e)
+        return None
+    inputs = planned_meal_inputs(state, city, daily_calories, food_preference)
+    return store_multi_day_plan(username, inputs, previous_meals, content, usage)
+
+def is_usable_multi_day_plan(content):
+    """Whether a response parses into a multi-day plan"""
+    return meal_parser.parse_days(content) is not None
+
+async def generate_multi_day_plan_async(username, state, city, daily_calories, food_preference, previous_meals):
+    """generate_multi_day_plan on async_client"""
+    request_args = build_meal_plan_request(state, city, int(daily_calories), food_preference, previous_meals,
+                                           days=MEAL_PLAN_DAYS)
+    try:
+        content, usage = await model_router.complete_async(async_client, request_args, is_usable_multi_day_plan)
+    except Exception as e:
+        logger.warning("Multi-day meal plan failed (%s), falling back to a single day", e)
+        return None
+    inputs = planned_meal_inputs(state, city, daily_calories, food_preference)
+    return await asyncio.to_thread(store_multi_day_plan, username, inputs, previous_meals, content, usage)
+
+def record_meal_plan(username, meal_plan):
+    """Add a parsed meal plan to the user's history"""
+    if meal_plan:
+        logger.info("AI meal recommendations successful")
+        # Add to user's meal history
+        add_meal_to_history(username, meal_plan)
+    else:
+        logger.warning("AI meal parsing failed")
+    return meal_plan
+
+def meal_job_payload(job):
+    """JSON body for a meal plan job, with the rendered plan once it is done"""
+    payload = {'success': True, **job.to_dict()}
+    if job.status == DONE and job.result:
+        payload['html'] = render_template('_meal_plan.html', meal_plan=job.result, **job.params)
+    return payload
+
+# Scrape-time views of the counters the caches and breaker already keep
+if isinstance(user_store, CachedUserStore):
+    metrics.gauge('user_cache_lookups', 'User record cache lookups by result',
+                  lambda: {('hit',): user_store.hits, ('miss',): user_store.misses}, ['result'])
+if meal_cache is not None:
+    metrics.gauge('meal_cache_lookups', 'Meal plan cache lookups by result',
+                  lambda: {('hit',): meal_cache.hits, ('miss',): meal_cache.misses}, ['result'])
+metrics.gauge('precomputed_plan_lookups', 'Precomputed meal plan lookups by result',
+              lambda: {('hit',): precomputed_plans.hits, ('miss',): precomputed_plans.misses}, ['result'])
+if client is not None:
+    metrics.gauge('llm_circuit_open', '1 while the OpenRouter circuit breaker is open or half-open',
+                  lambda: int(client.breaker.state != client.breaker.CLOSED))
+metrics.gauge('llm_model_latency_ewma_seconds', 'Smoothed OpenRouter latency by model and request kind',
+              model_router.ewmas, ['model', 'kind'])
+if async_client is not None:
+    metrics.gauge('llm_async_in_flight', 'OpenRouter calls currently awaited on the async client',
+                  lambda: async_client.in_flight)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_LATENCY.labels(route, request.method, str(response.status_code)).observe(
+            time.perf_counter() - started)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics for this worker process"""
+    if not metrics.METRICS_ENABLED:
+        return jsonify({'error': 'Route not found'}), 404
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 # Authentication Routes
 @app.route('/login', methods=['GET', 'POST'])
@@ -431,6 +920,7 @@ def login():
         
         if form_type == 'login':
             # Handle login
+            username = resolve_username(username) or username
             success, message = authenticate_user(username, password)
             if success:
                 session['username'] = username
@@ -476,23 +966,19 @@ def update_progress():
     goal_id = request.form.get('goal_id')
     completed = request.form.get('completed') == 'true'
     
-    if completed:
-        success = update_user_progress(session['username'], goal_id)
-        return jsonify({'success': success})
-    else:
-        # Handle unchecking goals if needed
-        return jsonify({'success': True})
+    success = update_user_progress(session['username'], goal_id, completed)
+    return jsonify({'success': success})
 
 @app.route('/')
 def index():
     """Landing page route"""
-    return render_template('landing.html')
+    return page_cache.render('landing.html')
 
 # Alternative route for landing
 @app.route('/landing')
 def landing():
     """Alternative landing page route"""
-    return render_template('landing.html')
+    return page_cache.render('landing.html')
 
 @app.route('/calculator', methods=['GET', 'POST'])
 def calculator():
@@ -516,18 +1002,26 @@ def calculator():
             city = request.form.get('city')
             food_preference = request.form.get('food_preference')
             
-            print(f"Form data: {gender}, {age}y, {weight}kg, {height}cm, {activity}, {state}, {city}, {food_preference}")
+            logger.debug("Form data: %s, %sy, %skg, %scm, %s, %s, %s, %s",
+                         gender, age, weight, height, activity, state, city, food_preference)
             
             # Calculate BMR and calories
             bmr = calculate_bmr(gender, weight, height, age)
             daily_calories = calculate_calorie_needs(bmr, activity)
             
-            print(f"BMR: {bmr}, Daily calories: {daily_calories}")
+            logger.debug("BMR: %s, Daily calories: %s", bmr, daily_calories)
             
             # Update user profile with latest data
-            data = load_user_data()
-            if username in data['users']:
-                data['users'][username]['profile'] = {
+            today = datetime.now().date().isoformat()
+            bmr_entry = {
+                'date': today,
+                'bmr': round(bmr),
+                'tdee': round(daily_calories),
+                'goal_calories': round(daily_calories)
+            }
+            
+            def apply_profile(user):
+                user['profile'] = {
                     'age': age,
                     'gender': gender,
                     'height': height,
@@ -537,55 +1031,83 @@ def calculator():
                     'state': state,
                     'city': city
                 }
-                # Add BMR to history
-                today = datetime.now().date().isoformat()
-                bmr_entry = {
-                    'date': today,
-                    'bmr': round(bmr),
-                    'tdee': round(daily_calories),
-                    'goal_calories': round(daily_calories)
-                }
-                data['users'][username]['bmr_history'].append(bmr_entry)
-                
-                # Keep only last 30 entries
-                if len(data['users'][username]['bmr_history']) > 30:
-                    data['users'][username]['bmr_history'] = data['users'][username]['bmr_history'][-30:]
-                
-                save_user_data(data)
+                user['latest_bmr'] = bmr_entry
+            
+            user_store.update_user(username, apply_profile)
+            event_log.append(username, BMR, bmr_entry, day=today)
             
             # Get previous meals to avoid duplicates
             previous_meals = get_previous_meals(username, days=7)
             
             # Try AI recommendations first, fallback to simple ones
             meal_plan = None
+            meal_job_id = None
             
-            # First try AI-powered recommendations if API is available
-            if client is not None:
-                try:
-                    print("Trying AI-powered meal recommendations...")
-                    # Include previous meals in prompt to avoid duplicates
-                    meal_plan_html = get_food_recommendations(state, city, int(daily_calories), food_preference, previous_meals)
-                    meal_plan = parse_meal_plan(meal_plan_html)
-                    if meal_plan:
-                        print("AI meal recommendations successful!")
-                        # Add to user's meal history
-                        add_meal_to_history(username, meal_plan)
-                    else:
-                        print("AI meal parsing failed")
-                except Exception as e:
-                    print(f"AI recommendations failed: {e}")
+            # Later days of a multi-day plan come straight from storage
+            if MEAL_PLAN_DAYS > 1:
+                meal_plan = get_planned_meals(username, state, city, daily_calories, food_preference)
+                if meal_plan:
+                    MEAL_PLAN_SOURCES.labels('stored').inc()
+                    add_meal_to_history(username, meal_plan)
             
-            # If AI failed or not available, show error message
+            # A cached plan is cheap enough to serve inline
+            cached_html = None
             if not meal_plan:
-                print("No meal recommendations available - API failed")
+                cached_html = get_cached_meal_plan(state, city, int(daily_calories), food_preference, previous_meals)
+            if cached_html:
+                meal_plan = parse_meal_plan(cached_html)
+                if meal_plan:
+                    add_meal_to_history(username, meal_plan)
+            
+            # Otherwise try AI-powered recommendations if API is available
+            if not meal_plan and client is not None:
+                # Include previous meals in prompt to avoid duplicates
+                generate_args = (username, state, city, daily_calories, food_preference, previous_meals)
+                if MEAL_PLAN_ASYNC:
+                    logger.debug("Queueing AI-powered meal recommendations")
+                    job_params = {
+                        'daily_calories': round(daily_calories),
+                        'state': state,
+                        'city': city,
+                        'food_preference': food_preference
+                    }
+                    if async_client is not None:
+                        job = meal_jobs.submit_async(
+                            username, job_params,
+                            lambda job: generate_meal_plan_async(*generate_args, on_token=job.push_token),
+                            async_client.submit)
+                    else:
+                        job = meal_jobs.submit(username, job_params,
+                                               lambda job: generate_meal_plan(*generate_args, on_token=job.push_token))
+                    meal_job_id = job.job_id
+                else:
+                    try:
+                        logger.debug("Trying AI-powered meal recommendations")
+                        if async_client is not None:
+                            meal_plan = async_client.run(generate_meal_plan_async(*generate_args))
+                        else:
+                            meal_plan = generate_meal_plan(*generate_args)
+                    except Exception as e:
+                        logger.error("AI recommendations failed: %s", e)
+            
+            # If AI failed or not available, plan from the bundled nutrition data
+            if not meal_plan and not meal_job_id:
+                meal_plan = offline_meal_plan(state, int(daily_calories), food_preference, previous_meals)
+                if meal_plan:
+                    add_meal_to_history(username, meal_plan)
+                else:
+                    logger.warning("No meal recommendations available - API failed")
             
-            print(f"Final meal plan: {list(meal_plan.keys()) if meal_plan else 'None'}")
+            logger.debug("Final meal plan: %s", list(meal_plan.keys()) if meal_plan else meal_job_id)
             
             return render_template('calculator.html', 
                                  bmr=round(bmr),
                                  daily_calories=round(daily_calories),
                                  meal_plan=meal_plan,
+                                 meal_job_id=meal_job_id,
+                                 meal_stream_enabled=MEAL_PLAN_STREAM,
                                  user_data=user_data,
+                                 meal_history=get_meal_history(username),
                                  previous_meals=previous_meals[:5],  # Show last 5 meals
                                  gender=gender,
                                  age=age,
@@ -596,11 +1118,12 @@ def calculator():
                                  city=city,
                                  food_preference=food_preference)
         except Exception as e:
-            print(f"Error processing form: {e}")
-            return render_template('calculator.html', error=str(e), user_data=user_data)
+            logger.exception("Error processing form: %s", e)
+            return render_template('calculator.html', error=str(e), user_data=user_data,
+                                   meal_history=get_meal_history(username))
     
     # GET request - pre-populate form with user data if available
-    template_data = {'user_data': user_data}
+    template_data = {'user_data': user_data, 'meal_history': get_meal_history(username)}
     if user_data and 'profile' in user_data:
         profile = user_data['profile']
         template_data.update({
@@ -616,15 +1139,106 @@ def calculator():
     
     return render_template('calculator.html', **template_data)
 
+@app.route('/meal/plan/<job_id>')
+def meal_plan_status(job_id):
+    """Poll a background meal plan job"""
+    if 'username' not in session:
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+    
+    job = meal_jobs.get(job_id)
+    if job is None or job.username != session['username']:
+        return jsonify({'success': False, 'error': 'Meal plan job not found'}), 404
+    
+    return jsonify(meal_job_payload(job))
+
+@app.route('/meal/plan/<job_id>/stream')
+def meal_plan_stream(job_id):
+    """Stream a background meal plan job as Server-Sent Events"""
+    if 'username' not in session:
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+    
+    job = meal_jobs.get(job_id)
+    if job is None or job.username != session['username']:
+        return jsonify({'success': False, 'error': 'Meal plan job not found'}), 404
+    
+    def events():
+        current = job
+        seen = 0
+        while True:
+            chunks, finished = current.wait(seen, timeout=1.0)
+            for chunk in chunks:
+                yield f"event: token\ndata: {json.dumps(chunk)}\n\n"
+            seen += len(chunks)
+            if finished:
+                break
+            if not chunks:
+                yield ": keep-alive\n\n"
+                # Jobs running on another worker are only visible through SQLite
+                if not meal_jobs.is_local(job_id):
+                    current = meal_jobs.get(job_id)
+        yield f"event: done\ndata: {json.dumps(meal_job_payload(current))}\n\n"
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/about')
 def about():
     """About page route"""
-    return render_template('about.html')
+    return page_cache.render('about.html')
 
 @app.route('/breathe')
 def breathe():
     """Breathing exercise page route"""
-    return render_template('breathe.html')
+    return page_cache.render('breathe.html')
+
+@app.route('/workouts')
+def workouts_page():
+    """Home workout planner and timer"""
+    return page_cache.render('Workouts.html')
+
+# Longest span GET /workouts/events returns at once
+WORKOUT_MAX_RANGE_DAYS = 366
+
+@app.route('/workouts/events', methods=['GET', 'POST'])
+def workout_events():
+    """Workout events between two dates (GET) or an uploaded batch of them (POST)"""
+    if 'username' not in session:
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+    
+    username = session['username']
+    
+    if request.method == 'GET':
+        try:
+            since = datetime.strptime(request.args['since'], '%Y-%m-%d').date()
+            until = datetime.strptime(request.args.get('until') or request.args['since'], '%Y-%m-%d').date()
+        except (KeyError, ValueError):
+            return jsonify({'success': False, 'error': 'since (and optionally until) must be YYYY-MM-DD dates'}), 400
+        if not 0 <= (until - since).days < WORKOUT_MAX_RANGE_DAYS:
+            return jsonify({'success': False,
+                            'error': f'until must be within {WORKOUT_MAX_RANGE_DAYS} days after since'}), 400
+        since, until = since.isoformat(), until.isoformat()
+        if request.args.get('summary') == '1':
+            return jsonify({'success': True, 'since': since, 'until': until,
+                            'days': workout_store.summary(username, since, until)})
+        return jsonify({'success': True, 'since': since, 'until': until,
+                        'events': workout_store.range(username, since, until)})
+    
+    if (request.content_length or 0) > workouts.WORKOUT_MAX_BODY:
+        return jsonify({'success': False, 'error': 'Upload too large'}), 413
+    try:
+        payload = workouts.decode_body(request.get_data(), request.headers.get('Content-Encoding'))
+        batch_id, events = workouts.parse_events(payload)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    try:
+        stored, duplicate = workout_store.add_events(username, events, batch_id)
+    except Exception as e:
+        logger.error("Error storing workout events: %s", e)
+        return jsonify({'success': False, 'error': 'Could not store workout events'}), 500
+    
+    WORKOUT_UPLOADS.labels('duplicate' if duplicate else 'stored').inc(stored)
+    return jsonify({'success': True, 'stored': stored, 'duplicate': duplicate})
 
 @app.route('/calculate', methods=['POST'])
 def calculate():
@@ -655,8 +1269,11 @@ def calculate():
         bmr = calculate_bmr(gender, weight, height, age)
         calorie_needs = calculate_calorie_needs(bmr, activity)
         
-        # Get food recommendations
-        recommendations = get_food_recommendations(state, calorie_needs, food_preference)
+        # Get food recommendations; structured responses are rendered to the HTML clients expect
+        recommendations = get_food_recommendations(state, None, calorie_needs, food_preference)
+        meal_plan = parse_meal_plan(recommendations) or offline_meal_plan(state, calorie_needs, food_preference)
+        if meal_plan:
+            recommendations = render_meal_plan_html(meal_plan)
         
         # Return results as JSON
         return jsonify({
@@ -666,12 +1283,66 @@ def calculate():
             'recommendations': recommendations
         })
     except Exception as e:
-        print(f"Error in calculate route: {e}")
+        logger.exception("Error in calculate route: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+BATCH_MAX_ROWS = int(os.getenv('BATCH_MAX_ROWS', '1000000'))
+BATCH_STREAM_CHUNK = 10000
+
+@app.route('/api/calculate/batch', methods=['POST'])
+def calculate_batch():
+    """BMR and TDEE for whole cohorts.
+    
+    Accepts JSON arrays (or single values, broadcast) for gender, weight,
+    height, age and activity. With ?stream=1 the results come back as
+    newline-delimited JSON chunks of up to 10,000 rows.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'error': 'Expected a JSON object'}), 400
+    
+    fields = ['gender', 'weight', 'height', 'age', 'activity']
+    lengths = {len(data[f]) for f in fields if isinstance(data.get(f), list)}
+    if len(lengths) != 1:
+        return jsonify({'success': False, 'error': 'Provide equal-length arrays for ' + ', '.join(fields)}), 400
+    count = lengths.pop()
+    if count > BATCH_MAX_ROWS:
+        return jsonify({'success': False, 'error': f'At most {BATCH_MAX_ROWS} rows per request'}), 400
+    
+    columns = {}
+    for f in fields:
+        value = data.get(f, 'sedentary' if f == 'activity' else None)
+        if value is None:
+            return jsonify({'success': False, 'error': f'Missing field: {f}'}), 400
+        columns[f] = value if isinstance(value, list) else [value] * count
+    
+    try:
+        for f in ('weight', 'height', 'age'):
+            columns[f] = [float(v) for v in columns[f]]
+            # float() takes 'nan' and 'inf', which jsonify would write out as invalid JSON
+            if not all(math.isfinite(v) for v in columns[f]):
+                raise ValueError(f)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'weight, height and age must be finite numbers'}), 400
+    
+    def compute(start, end):
+        bmr = calculate_bmr_batch(columns['gender'][start:end], columns['weight'][start:end],
+                                  columns['height'][start:end], columns['age'][start:end])
+        return bmr, calculate_calorie_needs_batch(bmr, columns['activity'][start:end])
+    
+    if request.args.get('stream') == '1':
+        def chunks():
+            for start in range(0, count, BATCH_STREAM_CHUNK):
+                bmr, tdee = compute(start, start + BATCH_STREAM_CHUNK)
+                yield json.dumps({'offset': start, 'bmr': bmr, 'tdee': tdee}) + '\n'
+        return Response(chunks(), mimetype='application/x-ndjson')
+    
+    bmr, tdee = compute(0, count)
+    return jsonify({'success': True, 'count': count, 'bmr': bmr, 'tdee': tdee})
+
 # Add a test route to debug
 @app.route('/test', methods=['GET', 'POST'])
 def test():
@@ -684,16 +1355,10 @@ def test():
 def test_api():
     """Test API connection directly"""
     try:
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
+        if client is None:
             return jsonify({'error': 'No API key found', 'status': 'failed'})
         
-        client = OpenAI(
-            api_key=api_key,
-            base_url="https://openrouter.ai/api/v1"
-        )
-        
-        response = client.chat.completions.create(
+        response = client.create_chat_completion(
             model="deepseek/deepseek-chat",
             messages=[
                 {"role": "user", "content": "Generate one simple Karnataka breakfast dish with calories. Format: Dish Name - 300 calories - Description"}
@@ -722,53 +1387,208 @@ def meal_completion():
     
     if request.method == 'GET':
         # Retrieve meal completions
-        date = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
+        day = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
         
         try:
-            user_data_dict = load_user_data()
-            
-            completed_meals = []
-            if ('users' in user_data_dict and 
-                username in user_data_dict['users'] and 
-                'meal_completions' in user_data_dict['users'][username] and
-                date in user_data_dict['users'][username]['meal_completions']):
-                
-                completed_meals = user_data_dict['users'][username]['meal_completions'][date]
+            completion = event_log.latest(username, COMPLETION, day=day) or {}
+            completed_meals = completion.get('completed_meals', [])
             
             return jsonify({'success': True, 'completed_meals': completed_meals})
         
         except Exception as e:
-            print(f"Error retrieving meal completion: {e}")
+            logger.error("Error retrieving meal completion: %s", e)
             return jsonify({'success': False, 'error': str(e)}), 500
     
     else:  # POST method
         # Save meal completions
+        data = request.get_json(silent=True) or {}
+        completed_meals = data.get('completed_meals', [])
+        if not isinstance(completed_meals, list) or not all(isinstance(meal, str) for meal in completed_meals):
+            return jsonify({'success': False, 'error': 'completed_meals must be a list of meal types'}), 400
         try:
-            data = request.get_json()
-            completed_meals = data.get('completed_meals', [])
-            date = data.get('date', datetime.now().strftime('%Y-%m-%d'))
-            
-            user_data_dict = load_user_data()
-            
-            if 'users' not in user_data_dict:
-                user_data_dict['users'] = {}
-            
-            if username not in user_data_dict['users']:
-                user_data_dict['users'][username] = {}
-            
-            if 'meal_completions' not in user_data_dict['users'][username]:
-                user_data_dict['users'][username]['meal_completions'] = {}
-            
-            user_data_dict['users'][username]['meal_completions'][date] = completed_meals
-            
-            save_user_data(user_data_dict)
+            day = date.fromisoformat(data.get('date') or datetime.now().strftime('%Y-%m-%d')).isoformat()
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'date must be YYYY-MM-DD'}), 400
+        
+        try:
+            # The latest event for a date wins
+            event_log.append(username, COMPLETION, {'completed_meals': completed_meals}, day=day)
             
             return jsonify({'success': True})
         
         except Exception as e:
-            print(f"Error saving meal completion: {e}")
+            logger.error("Error saving meal completion: %s", e)
             return jsonify({'success': False, 'error': str(e)}), 500
 
+def sync_state(username, day):
+    """Goal and meal completion state for /sync"""
+    completion = event_log.latest(username, COMPLETION, day=day) or {}
+    return sync.snapshot(get_user_data(username) or {}, completion.get('completed_meals', []), day)
+
+def sync_response(state, **fields):
+    version = sync.state_etag(state)
+    response = jsonify({'success': True, 'version': version, 'state': state, **fields})
+    response.set_etag(version)
+    # Browsers revalidate with If-None-Match and get a bodiless 304 while nothing changed
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+@app.route('/sync', methods=['GET', 'POST'])
+def sync_progress():
+    """Goal and meal completion state (GET) or a batch of client deltas to apply (POST)"""
+    if 'username' not in session:
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+    
+    username = session['username']
+    
+    if request.method == 'GET':
+        return sync_response(sync_state(username, request.args.get('date', datetime.now().strftime('%Y-%m-%d'))))
+    
+    payload = request.get_json(silent=True)
+    try:
+        deltas = sync.parse_deltas(payload)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    today = datetime.now().date()
+    goal_deltas = [delta for delta in deltas if delta['type'] == sync.GOAL_DELTA]
+    meal_deltas = [delta for delta in deltas if delta['type'] == sync.MEAL_DELTA]
+    try:
+        # Every goal toggle in one user-store write...
+        applied = []
+        if goal_deltas:
+            applied = user_store.update_user(
+                username, lambda user: sync.apply_goal_deltas(user, goal_deltas, today)) or []
+        completions = {day: event_log.latest(username, COMPLETION, day=day) or {}
+                       for day in {delta['day'] for delta in meal_deltas}}
+        applied_meals = sync.apply_meal_deltas(completions, meal_deltas)
+        # ...and the events they produce in one event-log transaction
+        rows = [(username, GOAL, today.isoformat(), {'goal_id': delta['goal_id'], 'completed': delta['completed']})
+                for delta in applied]
+        rows += [(username, COMPLETION, day, completions[day]) for day in sorted({d['day'] for d in applied_meals})]
+        if rows:
+            event_log.append_many(rows)
+    except Exception as e:
+        logger.error("Error applying sync deltas: %s", e)
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    for kind, received, took_effect in (('goal', goal_deltas, applied), ('meal', meal_deltas, applied_meals)):
+        SYNC_DELTAS.labels(kind, 'applied').inc(len(took_effect))
+        SYNC_DELTAS.labels(kind, 'ignored').inc(len(received) - len(took_effect))
+    day = (payload or {}).get('date') or today.isoformat()
+    return sync_response(sync_state(username, day), applied=len(applied) + len(applied_meals),
+                         ignored=len(deltas) - len(applied) - len(applied_meals))
+
+# Default chart span per period, in days
+TRENDS_DEFAULT_DAYS = {'day': 30, 'week': 12 * 7, 'month': 365}
+
+@app.route('/api/trends')
+def trends():
+    """Daily, weekly or monthly nutrition and adherence rollups between two dates"""
+    if 'username' not in session:
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+    
+    period = request.args.get('period', 'day')
+    if period not in TREND_PERIODS:
+        return jsonify({'success': False, 'error': f"period must be one of {', '.join(TREND_PERIODS)}"}), 400
+    try:
+        until = datetime.strptime(request.args.get('until') or datetime.now().strftime('%Y-%m-%d'), '%Y-%m-%d').date()
+        since = request.args.get('since')
+        since = (datetime.strptime(since, '%Y-%m-%d').date() if since
+                 else until - timedelta(days=TRENDS_DEFAULT_DAYS[period] - 1))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'since and until must be YYYY-MM-DD dates'}), 400
+    
+    buckets = event_log.trends(session['username'], period, since.isoformat(), until.isoformat())
+    return jsonify({'success': True, 'period': period, 'since': since.isoformat(), 'until': until.isoformat(),
+                    'buckets': buckets})
+
+@app.cli.command('migrate-users')
+def migrate_users_command():
+    """Import users from user_data.json into the configured user store"""
+    count = migrate_json_to_sqlite(USER_DATA_FILE, user_store)
+    print(f"Migrated {count} users from {USER_DATA_FILE}")
+
+@app.cli.command('verify-user-index')
+@click.option('--rebuild', is_flag=True, help='Rebuild the lookup keys from the user records first.')
+def verify_user_index_command(rebuild):
+    """Check the username/email lookup keys against the user records"""
+    if rebuild:
+        print(f"Rebuilt {user_store.rebuild_indexes()} lookup keys")
+    problems = user_store.verify_indexes()
+    for problem in problems:
+        print(f"  {problem}")
+    if problems:
+        raise click.ClickException(f'{len(problems)} index problems found')
+    print(f"User index OK ({user_store.count_users()} users)")
+
+@app.cli.command('compact-events')
+@click.option('--retention-days', default=EVENT_LOG_RETENTION_DAYS, show_default=True,
+              help='Keep raw events for this many days; older ones become monthly rollups.')
+def compact_events_command(retention_days):
+    """Fold old history events into monthly rollups"""
+    folded = event_log.compact(retention_days)
+    print(f"Compacted {folded} events older than {retention_days} days")
+
+@app.cli.command('rebuild-trends')
+def rebuild_trends_command():
+    """Recompute the daily, weekly and monthly trend rollups from the event log"""
+    print(f"Rebuilt trends from {event_log.rebuild_trends()} events")
+
+@app.cli.command('rollover-goals')
+def rollover_goals_command():
+    """Roll daily goals over to today for users who have not been seen yet today"""
+    today = datetime.now().date()
+    rolled = 0
+    for username, user in user_store.all_users().items():
+        if 'goals' in user and goals.is_stale(user, today):
+            if user_store.update_user(username, lambda record: goals.roll_over(record, today)):
+                rolled += 1
+    print(f"Rolled over {rolled} users")
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Write fingerprinted, minified and precompressed static assets to static/dist"""
+    assets.build(app.static_folder)
+
+@app.cli.command('precompute-plans')
+@click.option('--states', default='', help='Comma-separated states to sweep (default: all).')
+@click.option('--cities', default='', help='Comma-separated State:City pairs to sweep as well.')
+@click.option('--min-calories', default=1400, show_default=True)
+@click.option('--max-calories', default=3200, show_default=True)
+@click.option('--preferences', default=','.join(DEFAULT_PREFERENCES), show_default=True)
+@click.option('--from-users', 'top', default=0, help='Only sweep the N most common combinations in user profiles.')
+@click.option('--variants', default=1, show_default=True, help='Distinct plans to store per combination.')
+@click.option('--workers', default=4, show_default=True, help='Concurrent LLM calls.')
+@click.option('--stub', is_flag=True, help='Generate against the local LLM stub (offline).')
+def precompute_plans_command(states, cities, min_calories, max_calories, preferences, top, variants, workers, stub):
+    """Generate and store meal plans for popular region/calorie/diet combinations"""
+    global client
+    if stub:
+        client = LLMClient('stub-key', base_url=llm_stub.start_in_background(port=0))
+    if client is None:
+        raise click.ClickException('No LLM configured; set OPENAI_API_KEY or pass --stub')
+    
+    if top:
+        grid = grid_from_profiles(user_store.all_users(), top)
+    else:
+        city_map = {}
+        for pair in filter(None, cities.split(',')):
+            state, _, city = pair.partition(':')
+            city_map.setdefault(state.strip(), ['']).append(city.strip())
+        state_list = [s.strip() for s in states.split(',') if s.strip()] or DEFAULT_STATES
+        grid = build_grid(state_list, city_map, min_calories, max_calories,
+                          [p.strip() for p in preferences.split(',') if p.strip()])
+    
+    print(f"Precomputing {len(grid)} combinations x {variants} variants with {workers} workers")
+    started = datetime.now()
+    def generate(state, city, calories, preference, previous_meals):
+        return get_food_recommendations(state, city, calories, preference, previous_meals, use_cache=False)
+    
+    stats = run_precompute(precomputed_plans, grid, generate, parse_meal_plan,
+                           variants=variants, workers=workers)
+    print(f"Done in {(datetime.now() - started).total_seconds():.1f}s: {stats}")
+
 # Add error handlers
 @app.errorhandler(404)
 def not_found(error):
@@ -0,0 +1,23 @@
+"""ASGI entry point for serving the app under uvicorn or hypercorn.
+
+    LLM_ASYNC=1 uvicorn asgi:application --workers 2
+
+Flask stays a WSGI app; a2wsgi runs each request on a thread pool of
+ASGI_THREADS threads while the server's event loop holds the connections.
+With LLM_ASYNC=1 meal-plan jobs await OpenRouter on the async client's own
+loop, so a slow LLM call no longer pins a request thread or pool worker.
+a2wsgi is optional and only needed for this entry point (gunicorn keeps
+using app:app).
+"""
+import os
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError as e:  # Optional dependency
+    raise ImportError("asgi.py needs a2wsgi: pip install a2wsgi uvicorn") from e
+
+from app import app
+
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', '32'))
+
+application = WSGIMiddleware(app, workers=ASGI_THREADS)
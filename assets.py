@@ -0,0 +1,278 @@
+"""Fingerprinted, precompressed static assets.
+
+`flask build-assets` writes content-hashed copies of everything under
+static/ into static/dist/ together with a manifest.json:
+
+* CSS is minified and its url() references are rewritten to the hashed
+  names. Background images that have responsive variants get an
+  image-set() with AVIF/WebP plus smaller sizes behind max-width queries.
+* JPEG/PNG images are resized to ASSET_IMAGE_WIDTHS and re-encoded as JPEG,
+  WebP and (where Pillow supports it) AVIF. Without Pillow the original is
+  copied as-is.
+* Text assets get .gz and, if the brotli package is installed, .br siblings.
+
+Pillow and brotli are not in requirements.txt: the web process never needs
+them. Install requirements-assets.txt wherever the build runs; on Heroku
+bin/post_compile does that and runs `python assets.py` once per deploy, so
+dynos boot with the built files in their slug instead of each rebuilding
+them.
+
+At runtime init_app makes url_for('static', filename=...) resolve through the
+manifest and serves static/dist/ with the best precompressed variant the
+client accepts and an immutable, one-year Cache-Control. Without a manifest
+(no build yet, or ASSETS_ENABLED=0) the plain static files are used.
+"""
+import gzip
+import hashlib
+import io
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+
+from flask import request, send_file, abort
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # Optional: only gzip variants are written without it
+    brotli = None
+
+try:
+    from PIL import Image, features
+except ImportError:  # Optional: images are copied unchanged without it
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+ASSETS_ENABLED = os.getenv('ASSETS_ENABLED', '1') == '1'
+ASSET_DIST_DIR = 'dist'
+ASSET_IMAGE_WIDTHS = [int(w) for w in os.getenv('ASSET_IMAGE_WIDTHS', '640,1280,1920').split(',') if w]
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map'}
+RESIZABLE = {'.jpg', '.jpeg', '.png'}
+IMAGE_QUALITY = {'jpeg': 80, 'webp': 75, 'avif': 50}
+IMAGE_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+_CSS_STRINGS_AND_COMMENTS = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/', re.DOTALL)
+_CSS_TOKENS = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|\s*([{};,>])\s*|:\s+|\s+')
+_CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+_CSS_RULE = re.compile(r'([^{}]+)\{([^{}]*)\}')
+_BACKGROUND_IMAGE = re.compile(r'background-image:url\(([^)]+)\)')
+
+
+def _fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def _hashed_name(logical, data, suffix=None):
+    root, ext = posixpath.splitext(logical)
+    return f"{ASSET_DIST_DIR}/{root}{suffix or ''}.{_fingerprint(data)}{ext}"
+
+
+def minify_css(css):
+    """Strip comments and redundant whitespace without touching strings"""
+    css = _CSS_STRINGS_AND_COMMENTS.sub(lambda m: m.group(1) or '', css)
+
+    def token(match):
+        if match.group(1):
+            return match.group(1)
+        if match.group(2):
+            return match.group(2)
+        return ':' if match.group(0).startswith(':') else ' '
+
+    return _CSS_TOKENS.sub(token, css).replace(';}', '}').strip()
+
+
+class AssetBuilder:
+    """Builds static/dist/ and its manifest from a static folder"""
+
+    def __init__(self, static_dir, widths=ASSET_IMAGE_WIDTHS):
+        self.static_dir = static_dir
+        self.dist_dir = os.path.join(static_dir, ASSET_DIST_DIR)
+        self.widths = sorted(widths)
+        self.manifest = {}
+        self.variants = {}
+
+    def _write(self, name, data):
+        path = os.path.join(self.static_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        if posixpath.splitext(name)[1] in COMPRESSIBLE and len(data) > 1024:
+            with open(path + '.gz', 'wb') as f:
+                f.write(gzip.compress(data, 9, mtime=0))
+            if brotli is not None:
+                with open(path + '.br', 'wb') as f:
+                    f.write(brotli.compress(data, quality=11))
+        return name
+
+    def _sources(self):
+        for directory, dirnames, filenames in os.walk(self.static_dir):
+            if os.path.abspath(directory) == os.path.abspath(self.static_dir):
+                dirnames[:] = [d for d in dirnames if d != ASSET_DIST_DIR]
+            for filename in sorted(filenames):
+                path = os.path.join(directory, filename)
+                yield posixpath.normpath(os.path.relpath(path, self.static_dir).replace(os.sep, '/')), path
+
+    def _build_image(self, logical, path):
+        """Responsive variants of one image; the manifest points at the largest JPEG"""
+        formats = ['jpeg', 'webp'] + (['avif'] if features.check('avif') else [])
+        with Image.open(path) as image:
+            image = image.convert('RGB')
+            widths = [w for w in self.widths if w < image.width] + [min(image.width, self.widths[-1])]
+            variants = []
+            for width in sorted(set(widths)):
+                height = round(image.height * width / image.width)
+                resized = image.resize((width, height), Image.LANCZOS) if width != image.width else image
+                for fmt in formats:
+                    buffer = io.BytesIO()
+                    options = {'quality': IMAGE_QUALITY[fmt]}
+                    if fmt == 'jpeg':
+                        options.update(optimize=True, progressive=True)
+                    resized.save(buffer, fmt.upper(), **options)
+                    encoded = buffer.getvalue()
+                    ext = '.jpg' if fmt == 'jpeg' else f'.{fmt}'
+                    name = _hashed_name(posixpath.splitext(logical)[0] + ext, encoded, f'-{width}')
+                    variants.append({'width': width, 'type': IMAGE_TYPES[fmt], 'path': self._write(name, encoded)})
+        self.variants[logical] = variants
+        largest = max(v['width'] for v in variants)
+        return next(v['path'] for v in variants if v['width'] == largest and v['type'] == 'image/jpeg')
+
+    def _rewrite_css(self, logical, css):
+        css_dir = posixpath.dirname(logical)
+
+        def resolve(ref):
+            if re.match(r'^(?:[a-z]+:|//|#)', ref):
+                return None
+            if ref.startswith('/static/'):
+                target = ref[len('/static/'):]
+            else:
+                target = posixpath.normpath(posixpath.join(css_dir, ref.split('?')[0].split('#')[0]))
+            return target if target in self.manifest else None
+
+        def url(match):
+            target = resolve(match.group(2))
+            if target is None:
+                return match.group(0)
+            return f'url({_relative(self.manifest[target], css_dir)})'
+
+        def responsive(match):
+            selector, body = match.groups()
+            found = _BACKGROUND_IMAGE.search(body)
+            if selector.lstrip().startswith('@') or not found:
+                return match.group(0)
+            target = resolve(found.group(1).strip('\'"'))
+            if target is None or target not in self.variants:
+                return match.group(0)
+            by_width = {}
+            for variant in self.variants[target]:
+                by_width.setdefault(variant['width'], []).append(variant)
+            widths = sorted(by_width)
+
+            def image_set(width):
+                ordered = sorted(by_width[width], key=lambda v: list(IMAGE_TYPES.values()).index(v['type']))
+                return 'image-set(' + ','.join(
+                    f'url({_relative(v["path"], css_dir)}) type("{v["type"]}")' for v in ordered) + ')'
+
+            fallback = f'background-image:url({_relative(self.manifest[target], css_dir)})'
+            body = body.replace(found.group(0), f'{fallback};background-image:{image_set(widths[-1])}')
+            # Smaller screens get smaller files; later (narrower) queries win
+            queries = ''.join(f'@media (max-width:{width}px){{{selector}{{background-image:{image_set(width)}}}}}'
+                              for width in reversed(widths[:-1]))
+            return f'{selector}{{{body}}}{queries}'
+
+        css = minify_css(css)
+        css = _CSS_RULE.sub(responsive, css)
+        return _CSS_URL.sub(url, css)
+
+    def build(self):
+        """Write every asset and manifest.json; return the manifest"""
+        if os.path.isdir(self.dist_dir):
+            shutil.rmtree(self.dist_dir)
+        sources = sorted(self._sources(), key=lambda item: posixpath.splitext(item[0])[1] == '.css')
+        # Everything else first so stylesheets can point at hashed names
+        for logical, path in sources:
+            with open(path, 'rb') as f:
+                data = f.read()
+            ext = posixpath.splitext(logical)[1].lower()
+            if ext == '.css':
+                data = self._rewrite_css(logical, data.decode('utf-8')).encode('utf-8')
+                self.manifest[logical] = self._write(_hashed_name(logical, data), data)
+            elif ext in RESIZABLE and Image is not None:
+                self.manifest[logical] = self._build_image(logical, path)
+            else:
+                self.manifest[logical] = self._write(_hashed_name(logical, data), data)
+        manifest = {'assets': self.manifest, 'variants': self.variants}
+        with open(os.path.join(self.dist_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        return manifest
+
+
+def _relative(dist_path, css_dir):
+    """Path of a dist asset relative to the built stylesheet's directory"""
+    return posixpath.relpath(dist_path, posixpath.join(ASSET_DIST_DIR, css_dir))
+
+
+def load_manifest(static_dir):
+    path = os.path.join(static_dir, ASSET_DIST_DIR, 'manifest.json')
+    try:
+        with open(path) as f:
+            return json.load(f).get('assets', {})
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def init_app(app):
+    """Resolve static URLs through the manifest and serve dist/ with long-lived caching"""
+    manifest = load_manifest(app.static_folder) if ASSETS_ENABLED else {}
+    dist_dir = os.path.join(app.static_folder, ASSET_DIST_DIR)
+    if manifest:
+        logger.info("Serving %d fingerprinted assets from %s", len(manifest), dist_dir)
+
+    @app.url_defaults
+    def fingerprinted_static(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    def serve_dist(filename):
+        path = safe_join(dist_dir, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings[encoding] and os.path.isfile(path + suffix):
+                response = send_file(path + suffix, mimetype=mimetype, conditional=True)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_file(path, mimetype=mimetype, conditional=True)
+        response.vary.add('Accept-Encoding')
+        # The name changes whenever the content does
+        response.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable'
+        return response
+
+    app.add_url_rule(f'{app.static_url_path}/{ASSET_DIST_DIR}/<path:filename>', 'static_dist', serve_dist)
+    return manifest
+
+
+def build(static_dir):
+    """Build static_dir/dist and print what was written"""
+    manifest = AssetBuilder(static_dir).build()
+    for logical, built in sorted(manifest['assets'].items()):
+        variants = len(manifest['variants'].get(logical, []))
+        print(f"{logical} -> {built}" + (f" (+{variants} responsive variants)" if variants else ''))
+    if Image is None:
+        print("Pillow is not installed; images were copied without WebP/AVIF variants")
+    if brotli is None:
+        print("brotli is not installed; only gzip variants were written")
+    return manifest
+
+
+if __name__ == '__main__':
+    # Build-time entry point that does not import the app (and open its databases)
+    build(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
@@ -0,0 +1,127 @@
+"""Thread-pool vs event-loop meal-plan generation against the LLM stub.
+
+    python benchmarks/bench_async.py --jobs 50,200,500 --latency 1.0 --save async.json
+
+Starts llm_stub.py in a subprocess, imports the app with LLM_ASYNC=1 and
+submits the same burst of background meal jobs twice: through
+meal_jobs.submit with the sync client (the default deployment) and through
+meal_jobs.submit_async with the AsyncOpenAI client. Reports the time until
+the last job finishes, jobs per second, the peak number of jobs waiting on
+OpenRouter at once and the peak thread count.
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import benchlib  # noqa: E402
+from load_test import free_port  # noqa: E402
+
+STATES = ['Karnataka', 'Kerala', 'Tamil Nadu', 'Maharashtra', 'Punjab', 'West Bengal', 'Gujarat']
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f'LLM stub did not come up on port {port} within {timeout}s')
+            time.sleep(0.1)
+
+
+def run_burst(app, jobs, use_async):
+    """Submit jobs generations at once; return timings and peak concurrency"""
+    submitted = []
+    peaks = {'running': 0, 'threads': 0}
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            running = sum(1 for job in submitted if job.status == 'running')
+            peaks['running'] = max(peaks['running'], running)
+            peaks['threads'] = max(peaks['threads'], threading.active_count())
+            time.sleep(0.01)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    started = time.perf_counter()
+    for i in range(jobs):
+        # Distinct calorie targets so nothing is served from the meal cache
+        args = (STATES[i % len(STATES)], None, 1200 + i, 'vegetarian', None)
+        if use_async:
+            submitted.append(app.meal_jobs.submit_async(
+                'bench', {}, lambda job, args=args: app.get_food_recommendations_async(*args, use_cache=False),
+                app.async_client.submit))
+        else:
+            submitted.append(app.meal_jobs.submit(
+                'bench', {}, lambda job, args=args: app.get_food_recommendations(*args, use_cache=False)))
+    for job in submitted:
+        while not job.finished:
+            job.wait(0, 1)
+    elapsed = time.perf_counter() - started
+    done.set()
+    sampler.join()
+    return {
+        'makespan_ms': elapsed * 1000,
+        'jobs_rps': jobs / elapsed,
+        'peak_in_flight': peaks['running'],
+        'peak_threads': peaks['threads'],
+        'failed': sum(1 for job in submitted if job.status != 'done')
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', default='50,200', help='comma-separated burst sizes')
+    parser.add_argument('--latency', type=float, default=1.0, help='mean stub response delay in seconds')
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before failing')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='wellora-async-')
+    port = free_port()
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'llm_stub.py'), '--port', str(port), '--latency', str(args.latency)],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    results = {}
+    try:
+        wait_for_port(port)
+        for name, filename in (('USER_DB_PATH', 'user_data.db'), ('USER_DATA_FILE', 'user_data.json'),
+                               ('MEAL_CACHE_PATH', 'meal_cache.db'), ('PRECOMPUTED_DB_PATH', 'meal_cache.db')):
+            os.environ[name] = os.path.join(workdir, filename)
+        os.environ.update({'OPENAI_API_KEY': 'stub-key', 'OPENROUTER_BASE_URL': f'http://127.0.0.1:{port}/v1',
+                           'LLM_STUB': '0', 'LLM_ASYNC': '1', 'LOG_LEVEL': 'ERROR'})
+        import app
+
+        for jobs in (int(n) for n in args.jobs.split(',') if n):
+            for mode in ('sync', 'async'):
+                row = run_burst(app, jobs, mode == 'async')
+                results[f'{mode}_{jobs}'] = row
+                print(f"{mode:>5} {jobs:>5} jobs: {row['makespan_ms'] / 1000:7.2f} s  {row['jobs_rps']:7.1f} jobs/s  "
+                      f"peak in flight {row['peak_in_flight']:>4}  peak threads {row['peak_threads']:>4}  "
+                      f"failed {row['failed']}")
+    finally:
+        stub.terminate()
+        stub.wait(timeout=10)
+
+    if args.save:
+        benchlib.save(args.save, results)
+    if args.compare and benchlib.compare(args.compare, results, args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
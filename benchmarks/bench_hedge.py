@@ -0,0 +1,100 @@
+"""Tail latency of meal-plan requests with and without hedging, against the LLM stub.
+
+    python benchmarks/bench_hedge.py --requests 400 --latency 0.2 --slow-rate 0.05 --save hedge.json
+
+Starts llm_stub in-process with two models: the primary at --latency and
+a second one 1.5x slower, both with --slow-rate of calls ten times slower.
+The same request mix is sent through a ModelRouter with hedging off and on
+(after a warm-up that fills the p95 window) and the script reports
+p50/p95/p99 latency plus attempts per request, i.e. the extra cost.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import benchlib  # noqa: E402
+import llm_stub  # noqa: E402
+import meal_parser  # noqa: E402
+from llm_client import LLMClient  # noqa: E402
+from model_router import ModelRouter, LLM_HEDGE_MIN_SAMPLES  # noqa: E402
+
+MODELS = ['stub/primary', 'stub/secondary']
+REQUEST = {
+    'messages': [{'role': 'user', 'content': 'Breakfast (~500 cal), Lunch (~800 cal), Dinner (~700 cal)'}],
+    'max_tokens': 600,
+    'response_format': {'type': 'json_schema',
+                        'json_schema': {'name': 'meal_plan', 'strict': True, 'schema': meal_parser.MEAL_PLAN_SCHEMA}}
+}
+
+
+class CountingClient:
+    """Counts upstream attempts so the extra cost of hedging shows up"""
+
+    def __init__(self, client):
+        self.client = client
+        self.attempts = 0
+
+    def create_chat_completion(self, **kwargs):
+        self.attempts += 1
+        return self.client.create_chat_completion(**kwargs)
+
+
+def run(router, client, requests, concurrency):
+    def one(_):
+        started = time.perf_counter()
+        router.complete(client, REQUEST, lambda text: meal_parser.parse(text) is not None)
+        return time.perf_counter() - started
+
+    # Warm up so every model has enough samples for a p95 hedge delay
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(one, range(LLM_HEDGE_MIN_SAMPLES * 2)))
+    client.attempts = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        latencies = list(executor.map(one, range(requests)))
+    row = benchlib.summarize(latencies, time.perf_counter() - started)
+    row['attempts_per_request'] = client.attempts / requests
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.2, help='primary model mean delay in seconds')
+    parser.add_argument('--slow-rate', type=float, default=0.05, help='fraction of calls ten times slower')
+    parser.add_argument('--min-delay', type=float, default=0.05,
+                        help='hedge delay floor in seconds (LLM_HEDGE_MIN_DELAY, scaled to the stub)')
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before failing')
+    args = parser.parse_args()
+
+    base_url = llm_stub.start_in_background(
+        port=0, slow_rate=args.slow_rate,
+        model_latency={MODELS[0]: args.latency, MODELS[1]: args.latency * 1.5})
+    client = CountingClient(LLMClient('stub-key', base_url=base_url))
+
+    results = {}
+    for name, hedges in (('unhedged', 0), ('hedged', 1)):
+        router = ModelRouter(MODELS, hedges=hedges, default_delay=args.latency * 3, min_delay=args.min_delay)
+        row = run(router, client, args.requests, args.concurrency)
+        results[name] = row
+        print(f"{name:>9}: p50 {row['p50_ms']:7.0f} ms  p95 {row['p95_ms']:7.0f} ms  p99 {row['p99_ms']:7.0f} ms  "
+              f"mean {row['mean_ms']:7.0f} ms  attempts/request {row['attempts_per_request']:.3f}")
+
+    if args.save:
+        benchlib.save(args.save, results)
+    if args.compare and benchlib.compare(args.compare, results, args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""Benchmark and fuzz the meal-plan parser.
+
+    python benchmarks/bench_meal_parser.py --iterations 2000 --fuzz 5000
+
+Checks every response in benchmarks/corpus/meal_plans against
+expected.json, reports the mean parse time per response, then mutates the
+corpus (truncation, deletions, junk insertion, duplicated sections) to make
+sure the parser never raises and to measure how often it still finds meals.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import meal_parser  # noqa: E402
+
+CORPUS_DIR = os.path.join(ROOT, 'benchmarks', 'corpus', 'meal_plans')
+
+
+def load_corpus():
+    with open(os.path.join(CORPUS_DIR, 'expected.json')) as f:
+        expected = json.load(f)
+    corpus = {}
+    for name in sorted(expected):
+        with open(os.path.join(CORPUS_DIR, name)) as f:
+            corpus[name] = f.read()
+    return corpus, expected
+
+
+def check_corpus(corpus, expected):
+    failures = []
+    for name, content in corpus.items():
+        plan = meal_parser.parse(content)
+        names = [meal.name for meal in plan] if plan else None
+        if names != expected[name]['names']:
+            failures.append((name, expected[name]['names'], names))
+    return failures
+
+
+def bench(corpus, iterations):
+    documents = list(corpus.values())
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for document in documents:
+            meal_parser.parse(document)
+    elapsed = time.perf_counter() - start
+    return elapsed / (iterations * len(documents)) * 1e6
+
+
+def mutate(rng, text):
+    if not text:
+        return text
+    choice = rng.randrange(5)
+    i = rng.randrange(len(text))
+    j = min(len(text), i + rng.randrange(1, 80))
+    if choice == 0:
+        return text[:i]
+    if choice == 1:
+        return text[:i] + text[j:]
+    if choice == 2:
+        junk = rng.choice(['<', '>', '</div>', '<p>', '"', "'", '\x00', '<h4>', '9999 calories', '<div class="meal-section">'])
+        return text[:i] + junk + text[i:]
+    if choice == 3:
+        return text[:i] + text[i:j] * rng.randrange(2, 4) + text[j:]
+    return ''.join(rng.sample(text[i:j], j - i)).join([text[:i], text[j:]])
+
+
+def fuzz(corpus, rounds, seed):
+    rng = random.Random(seed)
+    documents = [doc for doc in corpus.values() if doc]
+    crashes = []
+    parsed = 0
+    for _ in range(rounds):
+        text = rng.choice(documents)
+        for _ in range(rng.randrange(1, 4)):
+            text = mutate(rng, text)
+        try:
+            if meal_parser.parse(text):
+                parsed += 1
+        except Exception as e:  # Any exception is a parser bug
+            crashes.append((repr(e), text[:200]))
+    return parsed, crashes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--fuzz', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    corpus, expected = load_corpus()
+    failures = check_corpus(corpus, expected)
+    print(f"corpus: {len(corpus) - len(failures)}/{len(corpus)} responses parsed as expected")
+    for name, want, got in failures:
+        print(f"  MISMATCH {name}: expected {want}, got {got}")
+
+    print(f"parse: {bench(corpus, args.iterations):.1f} us per response (mean over {args.iterations} passes)")
+
+    parsed, crashes = fuzz(corpus, args.fuzz, args.seed)
+    print(f"fuzz: {args.fuzz} mutated responses, {parsed / args.fuzz:.1%} still parsed, {len(crashes)} crashes")
+    for error, sample in crashes[:5]:
+        print(f"  CRASH {error}: {sample!r}")
+
+    return 1 if failures or crashes else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""Micro-benchmarks for the hot helpers in app.py.
+
+    python benchmarks/bench_micro.py --sizes 1000,10000,100000 --save baseline.json
+    python benchmarks/bench_micro.py --compare baseline.json --tolerance 0.2
+
+Covers parse_meal_plan on the parser corpus, load_user_data/save_user_data
+and single-user operations on each store backend at several user counts,
+and the scalar and batch BMR/TDEE functions. The app is imported with every
+database pointed at a temporary directory and no LLM configured.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import benchlib  # noqa: E402
+from bench_meal_parser import load_corpus  # noqa: E402
+
+WORKDIR = tempfile.mkdtemp(prefix='wellora-bench-')
+for name, filename in (('USER_DB_PATH', 'user_data.db'), ('USER_DATA_FILE', 'user_data.json'),
+                       ('MEAL_CACHE_PATH', 'meal_cache.db'), ('PRECOMPUTED_DB_PATH', 'meal_cache.db')):
+    os.environ[name] = os.path.join(WORKDIR, filename)
+os.environ.update({'OPENAI_API_KEY': '', 'LLM_STUB': '0', 'LOG_LEVEL': 'ERROR'})
+
+import app  # noqa: E402
+import storage  # noqa: E402
+
+
+def make_user(i):
+    """A user record shaped like the ones create_user writes"""
+    return {
+        'username': f'user{i}',
+        'email': f'user{i}@example.com',
+        'password_hash': app.hash_password(f'password{i}'),
+        'created_at': '2026-01-01T00:00:00',
+        'profile': {'age': 20 + i % 50, 'gender': 'male' if i % 2 else 'female', 'height': 150 + i % 40,
+                    'weight': 50 + i % 50, 'activity_level': 'moderate', 'food_preference': 'vegetarian',
+                    'state': 'Karnataka', 'city': 'Bengaluru'},
+        'latest_bmr': {'date': '2026-01-01', 'bmr': 1500, 'tdee': 2300, 'goal_calories': 2300},
+        'goals': {goal: {'target': 8, 'completed': False, 'date_completed': None}
+                  for goal in ('daily_water', 'daily_exercise', 'healthy_meals', 'sleep_hours', 'meditation')},
+        'progress': {'total_goals': 5, 'completed_today': 0, 'completion_percentage': 0,
+                     'streak_days': 0, 'last_activity': '2026-01-01'},
+        'settings': {'email_notifications': True, 'preferred_meal_types': [], 'dietary_restrictions': [],
+                     'favorite_cuisines': []}
+    }
+
+
+def bench_parse():
+    corpus, expected = load_corpus()
+    html = [doc for name, doc in corpus.items() if not name.startswith('json_')]
+    structured = [doc for name, doc in corpus.items() if name.startswith('json_')]
+    results = {}
+    for label, documents in (('html', html), ('json', structured)):
+        seconds = benchlib.best_of(lambda: [app.parse_meal_plan(doc) for doc in documents], repeat=5, number=20)
+        results[f'{label}_us'] = seconds / len(documents) * 1e6
+    return results
+
+
+def bench_store(backend, size, rng):
+    path = os.path.join(WORKDIR, f'{backend}-{size}')
+    store = storage.JSONUserStore(path + '.json') if backend == 'json' else storage.SQLiteUserStore(path + '.db')
+    users = {f'user{i}': make_user(i) for i in range(size)}
+    repeat = 3 if size <= 10000 else 1
+    # Single-user calls on the JSON store read the whole file, so sample fewer of them
+    number = 20 if backend == 'sqlite' else max(1, 2000 // size)
+
+    previous = app.user_store
+    app.user_store = store
+    try:
+        results = {
+            'save_user_data_ms': benchlib.best_of(lambda: app.save_user_data({'users': users}), repeat) * 1000,
+            'load_user_data_ms': benchlib.best_of(app.load_user_data, repeat) * 1000
+        }
+
+        def get_user():
+            app.get_user_data(f'user{rng.randrange(size)}')
+
+        def find_email():
+            store.find_user_by_email(f'USER{rng.randrange(size)}@example.com')
+
+        def update_user():
+            app.update_user_progress(f'user{rng.randrange(size)}', 'daily_water')
+
+        results['get_user_us'] = benchlib.best_of(get_user, 3, number) * 1e6
+        results['find_user_by_email_us'] = benchlib.best_of(find_email, 3, number) * 1e6
+        results['update_user_us'] = benchlib.best_of(update_user, 3, number) * 1e6
+    finally:
+        app.user_store = previous
+    return results
+
+
+def bench_bmr(size, rng):
+    genders = [rng.choice(('male', 'female')) for _ in range(size)]
+    weights = [rng.uniform(45, 110) for _ in range(size)]
+    heights = [rng.uniform(145, 195) for _ in range(size)]
+    ages = [rng.randrange(18, 80) for _ in range(size)]
+    activities = [rng.choice(list(app.ACTIVITY_MULTIPLIERS)) for _ in range(size)]
+
+    def scalar():
+        for row in zip(genders, weights, heights, ages, activities):
+            app.calculate_calorie_needs(app.calculate_bmr(*row[:4]), row[4])
+
+    def batch():
+        app.calculate_calorie_needs_batch(app.calculate_bmr_batch(genders, weights, heights, ages), activities)
+
+    return {
+        'scalar_ms': benchlib.best_of(scalar, 3) * 1000,
+        'batch_ms': benchlib.best_of(batch, 3) * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000', help='user counts for the store benchmarks')
+    parser.add_argument('--backends', default='sqlite,json')
+    parser.add_argument('--bmr-rows', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before failing')
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    results = {'parse': bench_parse()}
+    print(f"parse_meal_plan: {results['parse']['html_us']:.1f} us/html, {results['parse']['json_us']:.1f} us/json")
+
+    results['store'] = {}
+    for backend in filter(None, args.backends.split(',')):
+        for size in (int(n) for n in args.sizes.split(',') if n):
+            row = bench_store(backend, size, rng)
+            results['store'][f'{backend}_{size}'] = row
+            print(f"{backend:>6} {size:>7} users: save {row['save_user_data_ms']:9.1f} ms  "
+                  f"load {row['load_user_data_ms']:9.1f} ms  get {row['get_user_us']:9.1f} us  "
+                  f"email {row['find_user_by_email_us']:9.1f} us  update {row['update_user_us']:9.1f} us")
+
+    results['bmr'] = bench_bmr(args.bmr_rows, rng)
+    print(f"BMR/TDEE for {args.bmr_rows} rows: scalar {results['bmr']['scalar_ms']:.1f} ms, "
+          f"batch {results['bmr']['batch_ms']:.1f} ms")
+
+    if args.save:
+        benchlib.save(args.save, results)
+    if args.compare and benchlib.compare(args.compare, results, args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
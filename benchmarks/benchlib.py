@@ -0,0 +1,85 @@
+"""Helpers shared by the benchmark scripts: timing, percentiles and baselines.
+
+Every script can write its results with --save results.json and check a
+later run against them with --compare results.json; a metric that got
+slower by more than --tolerance (a fraction) makes the script exit 1, so
+the suite can gate a deploy.
+"""
+import json
+import math
+import time
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies, elapsed=None):
+    """p50/p95/p99/mean in milliseconds (and requests per second if elapsed is given)"""
+    values = sorted(latencies)
+    summary = {
+        'count': len(values),
+        'p50_ms': percentile(values, 0.50) * 1000,
+        'p95_ms': percentile(values, 0.95) * 1000,
+        'p99_ms': percentile(values, 0.99) * 1000,
+        'mean_ms': (sum(values) / len(values) * 1000) if values else 0.0
+    }
+    if elapsed:
+        summary['rps'] = len(values) / elapsed
+    return summary
+
+
+def best_of(func, repeat=5, number=1):
+    """Fastest mean seconds per call of func() over repeat rounds of number calls"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def save(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def compare(path, results, tolerance):
+    """Print regressions against a saved baseline; return True if any were found.
+
+    Keys ending in _ms or _us are "lower is better", rps is "higher is better";
+    everything else is informational.
+    """
+    with open(path) as f:
+        baseline = _flatten(json.load(f))
+    regressed = False
+    for name, value in sorted(_flatten(results).items()):
+        old = baseline.get(name)
+        if not old or not isinstance(value, (int, float)):
+            continue
+        if name.endswith(('_ms', '_us')):
+            change = value / old - 1
+        elif name.endswith('rps'):
+            change = old / value - 1 if value else float('inf')
+        else:
+            continue
+        if change > tolerance:
+            regressed = True
+            print(f"  REGRESSION {name}: {old:.3f} -> {value:.3f} ({change:+.0%})")
+    return regressed
+
+
+def _flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + '.'))
+        else:
+            flat[name] = value
+    return flat
@@ -0,0 +1,264 @@
+"""Load-test the app against the local OpenRouter stub.
+
+    python benchmarks/load_test.py --concurrency 1,8,32 --duration 15 \\
+        --latency 1.5 --failure-rate 0.05 --mix login=1,calculator=1,completion=4,progress=4
+
+Starts llm_stub.py and the app (flask's threaded server, gunicorn with
+--server gunicorn, or asgi.py under uvicorn with --server uvicorn; add
+--env LLM_ASYNC=1 for the async client) as subprocesses with every database in a temporary
+directory, signs up one user per client thread, then replays a weighted mix
+of /login, /calculator POST, /meal/completion and /progress/update at each
+concurrency level. Reports p50/p95/p99 latency and requests per second per
+endpoint. Use --save/--compare to keep a baseline (see benchlib.py).
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import benchlib  # noqa: E402
+
+STATES = ['Karnataka', 'Kerala', 'Tamil Nadu', 'Maharashtra', 'Punjab', 'West Bengal', 'Gujarat']
+PREFERENCES = ['vegetarian', 'non-vegetarian', 'eggetarian', 'mixed']
+GOALS = ['daily_water', 'daily_exercise', 'healthy_meals', 'sleep_hours', 'meditation']
+ENDPOINTS = ('login', 'calculator', 'completion', 'progress')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=2).read()
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    raise RuntimeError(f'{url} did not come up within {timeout}s')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class VirtualUser:
+    """One logged-in browser session (cookie jar, no redirect following)"""
+
+    def __init__(self, base_url, index, rng):
+        self.base_url = base_url
+        self.username = f'load{index}'
+        self.password = f'password{index}'
+        self.rng = rng
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def _request(self, path, form=None, body=None):
+        data, headers = None, {}
+        if form is not None:
+            data = urllib.parse.urlencode(form).encode()
+        elif body is not None:
+            data, headers = json.dumps(body).encode(), {'Content-Type': 'application/json'}
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers)
+        try:
+            with self.opener.open(request, timeout=120) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def signup(self):
+        return self._request('/login', form={
+            'form_type': 'signup', 'username': self.username, 'email': f'{self.username}@example.com',
+            'password': self.password, 'confirm_password': self.password})
+
+    def login(self):
+        return self._request('/login', form={
+            'form_type': 'login', 'username': self.username, 'password': self.password})
+
+    def calculator(self):
+        return self._request('/calculator', form={
+            'gender': self.rng.choice(('male', 'female')), 'age': self.rng.randrange(18, 70),
+            'weight': round(self.rng.uniform(45, 110), 1), 'height': self.rng.randrange(145, 195),
+            'activity': self.rng.choice(('sedentary', 'light', 'moderate', 'active', 'very_active')),
+            'state': self.rng.choice(STATES), 'city': '', 'food_preference': self.rng.choice(PREFERENCES)})
+
+    def completion(self):
+        meals = [meal for meal in ('breakfast', 'lunch', 'dinner') if self.rng.random() < 0.5]
+        return self._request('/meal/completion', body={'completed_meals': meals})
+
+    def progress(self):
+        return self._request('/progress/update', form={'goal_id': self.rng.choice(GOALS), 'completed': 'true'})
+
+
+def parse_mix(text):
+    mix = {}
+    for part in filter(None, text.split(',')):
+        name, _, weight = part.partition('=')
+        if name not in ENDPOINTS:
+            raise SystemExit(f'unknown endpoint {name!r} in --mix (choose from {", ".join(ENDPOINTS)})')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def run_level(users, mix, duration):
+    """Drive every user in its own thread for duration seconds"""
+    names, weights = list(mix), list(mix.values())
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def worker(user):
+        local, local_errors = defaultdict(list), defaultdict(int)
+        while time.monotonic() < stop_at:
+            name = user.rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                status = getattr(user, name)()
+            except OSError:
+                status = None
+            local[name].append(time.perf_counter() - started)
+            if status is None or status >= 400:
+                local_errors[name] += 1
+        with lock:
+            for name, values in local.items():
+                samples[name].extend(values)
+            for name, count in local_errors.items():
+                errors[name] += count
+
+    threads = [threading.Thread(target=worker, args=(user,)) for user in users]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for name, values in samples.items():
+        results[name] = benchlib.summarize(values, elapsed)
+        results[name]['errors'] = errors[name]
+    results['all'] = benchlib.summarize([v for values in samples.values() for v in values], elapsed)
+    results['all']['errors'] = sum(errors.values())
+    return results
+
+
+def start_servers(args, workdir):
+    stub_port, app_port = free_port(), free_port()
+    # Access logs would flood the report; keep them next to the databases
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'llm_stub.py'), '--port', str(stub_port),
+         '--latency', str(args.latency), '--failure-rate', str(args.failure_rate)],
+        cwd=ROOT, stdout=log, stderr=subprocess.STDOUT)
+
+    env = dict(os.environ)
+    env.update({
+        'OPENAI_API_KEY': 'stub-key',
+        'OPENROUTER_BASE_URL': f'http://127.0.0.1:{stub_port}/v1',
+        'LLM_STUB': '0',
+        'USER_DB_PATH': os.path.join(workdir, 'user_data.db'),
+        'USER_DATA_FILE': os.path.join(workdir, 'user_data.json'),
+        'MEAL_CACHE_PATH': os.path.join(workdir, 'meal_cache.db'),
+        'PRECOMPUTED_DB_PATH': os.path.join(workdir, 'meal_cache.db'),
+        'LOG_LEVEL': 'WARNING',
+        'FLASK_ENV': 'production'
+    })
+    for pair in args.env:
+        name, _, value = pair.partition('=')
+        env[name] = value
+
+    if args.server == 'gunicorn':
+        command = ['gunicorn', '-w', str(args.workers), '-k', 'gthread', '--threads', str(args.threads),
+                   '-b', f'127.0.0.1:{app_port}', 'app:app']
+    elif args.server == 'uvicorn':
+        command = ['uvicorn', 'asgi:application', '--workers', str(args.workers), '--port', str(app_port),
+                   '--no-access-log']
+    else:
+        command = [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(app_port),
+                   '--with-threads', '--no-reload', '--no-debugger']
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{app_port}'
+    try:
+        wait_for(base_url + '/')
+    except Exception:
+        stub.terminate()
+        server.terminate()
+        raise
+    return base_url, [server, stub]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', default='1,8,32', help='comma-separated client thread counts')
+    parser.add_argument('--duration', type=float, default=15, help='seconds per concurrency level')
+    parser.add_argument('--mix', default='login=1,calculator=1,completion=4,progress=4',
+                        help='endpoint weights')
+    parser.add_argument('--latency', type=float, default=1.0, help='mean stub response delay in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of stub 429/503 responses')
+    parser.add_argument('--server', choices=('flask', 'gunicorn', 'uvicorn'), default='flask')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn/uvicorn worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--env', action='append', default=[], help='extra NAME=VALUE for the app process')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before failing')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    levels = [int(n) for n in args.concurrency.split(',') if n]
+    workdir = tempfile.mkdtemp(prefix='wellora-load-')
+    base_url, processes = start_servers(args, workdir)
+    print(f"app at {base_url}, server log in {os.path.join(workdir, 'server.log')}")
+    results = {}
+    try:
+        users = [VirtualUser(base_url, i, random.Random(args.seed * 100003 + i)) for i in range(max(levels))]
+        for user in users:
+            user.signup()
+
+        for level in levels:
+            level_results = run_level(users[:level], mix, args.duration)
+            results[f'c{level}'] = level_results
+            print(f"concurrency {level} ({args.duration:g}s):")
+            for name in list(mix) + ['all']:
+                row = level_results.get(name)
+                if row:
+                    print(f"  {name:<11} n={row['count']:<6} p50 {row['p50_ms']:8.1f} ms  "
+                          f"p95 {row['p95_ms']:8.1f} ms  p99 {row['p99_ms']:8.1f} ms  "
+                          f"{row['rps']:7.1f} req/s  errors {row['errors']}")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+    if args.save:
+        benchlib.save(args.save, results)
+    if args.compare and benchlib.compare(args.compare, results, args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""Normalized dish names for spotting repeated meals.
+
+Meal history used to be compared by substring search over the full
+"Breakfast: Dish. long description" lines, which both missed spelling
+variants ("Sambhar" vs "Sambar", "Idlis" vs "Idli") and matched dish names
+that merely appeared inside a description. A DishIndex keeps only dish
+names, reduced to sorted tokens that are lowercased, stripped of filler
+words, crudely stemmed and folded over common transliteration variants
+(aspirated consonants, doubled vowels, w/v). Two dishes match when their
+token sets overlap by at least DISH_MATCH_THRESHOLD, with tokens compared
+fuzzily so small spelling differences still count.
+"""
+import os
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+DISH_MATCH_THRESHOLD = float(os.getenv('DISH_MATCH_THRESHOLD', '0.6'))
+DISH_TOKEN_SIMILARITY = float(os.getenv('DISH_TOKEN_SIMILARITY', '0.8'))
+
+_WORDS = re.compile(r'[a-z]+')
+_STOPWORDS = {'a', 'an', 'and', 'the', 'with', 'of', 'in', 'on', 'style', 'served', 'side', 'fresh', 'homemade'}
+_ASPIRATED = re.compile(r'([bcdgjkpt])h')
+_DOUBLED = re.compile(r'(.)\1+')
+# "Breakfast: Poha. A light ..." as written by add_meal_to_history
+_HISTORY_LINE = re.compile(r'^\s*\w+\s*:\s*(.+?)\.(?:\s|$)')
+
+
+def _stem(word):
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def _fold(word):
+    """Collapse spelling variants common in romanized Indian dish names"""
+    word = _ASPIRATED.sub(r'\1', word).replace('w', 'v')
+    return _DOUBLED.sub(r'\1', word)
+
+
+# Dish vocabulary is small and repeats across users, so both steps are memoized
+@lru_cache(maxsize=4096)
+def dish_tokens(name):
+    """Sorted normalized tokens of a dish name"""
+    ascii_name = unicodedata.normalize('NFKD', name or '').encode('ascii', 'ignore').decode().lower()
+    words = (_fold(_stem(word)) for word in _WORDS.findall(ascii_name) if word not in _STOPWORDS)
+    return tuple(sorted(set(word for word in words if word)))
+
+
+def dish_from_history(line):
+    """The dish name from a legacy "Meal: Dish. description" history line, or None"""
+    match = _HISTORY_LINE.match(line or '')
+    if not match or len(match.group(1)) > 60:
+        return None
+    return match.group(1).strip()
+
+
+@lru_cache(maxsize=65536)
+def _similar(a, b):
+    if a == b:
+        return True
+    # Cheap rejections first: variants keep their first letter, and the
+    # length difference alone bounds the best possible ratio
+    if a[0] != b[0] or 2 * min(len(a), len(b)) / (len(a) + len(b)) < DISH_TOKEN_SIMILARITY:
+        return False
+    return SequenceMatcher(None, a, b).ratio() >= DISH_TOKEN_SIMILARITY
+
+
+def _overlap(tokens, other):
+    """Soft Jaccard overlap: tokens pair up when they are spelled alike"""
+    if min(len(tokens), len(other)) / max(len(tokens), len(other)) < DISH_MATCH_THRESHOLD:
+        return 0.0
+    unmatched = list(other)
+    matched = 0
+    for token in tokens:
+        for i, candidate in enumerate(unmatched):
+            if _similar(token, candidate):
+                matched += 1
+                del unmatched[i]
+                break
+    return matched / (len(tokens) + len(other) - matched)
+
+
+class DishIndex:
+    """Dish names a user has had recently, looked up by normalized tokens"""
+
+    def __init__(self, names=()):
+        self._exact = {}
+        self._entries = []
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, name):
+        """Index a dish name; returns False if it was already (nearly) present"""
+        tokens = dish_tokens(name)
+        if not tokens or self.match(name) is not None:
+            return False
+        self._exact[tokens] = name
+        self._entries.append((tokens, name))
+        return True
+
+    def match(self, name):
+        """The indexed dish name that name nearly repeats, or None"""
+        tokens = dish_tokens(name)
+        if not tokens:
+            return None
+        exact = self._exact.get(tokens)
+        if exact is not None:
+            return exact
+        for entry_tokens, entry_name in self._entries:
+            if _overlap(tokens, entry_tokens) >= DISH_MATCH_THRESHOLD:
+                return entry_name
+        return None
+
+    def match_any(self, names):
+        """True if any of names nearly repeats an indexed dish"""
+        return any(name and self.match(name) is not None for name in names)
+
+    def names(self):
+        """Indexed dish names in the order they were added"""
+        return [name for _, name in self._entries]
+
+
+def as_index(names):
+    """names as a DishIndex, reusing it if it already is one"""
+    return names if isinstance(names, DishIndex) else DishIndex(names or ())
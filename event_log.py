@@ -0,0 +1,386 @@
+"""Append-only, date-partitioned event log for per-user history.
+
+Meal plans, BMR calculations, meal completions and goal completions used to
+live as lists inside the user record, which was rewritten (and truncated)
+on every save. Each of them is now one row in user_events, appended with a
+single INSERT and indexed by (username, kind, day), so a date-range query
+only reads the days it asks for. Multi-day meal plans are stored the same
+way, one PLAN event per upcoming day. `flask compact-events` folds old events
+into monthly rollups and deletes them.
+
+Every write also updates user_trends in the same transaction: one row per
+user, period (day, week or month) and bucket start, with a fixed set of
+counters (TREND_FIELDS) added to by an upsert. Meal plans and completions
+are "latest wins" per day, so their change is taken against the day's row
+and the difference is added to the week and month. trends() then reads
+one row per bucket, so a chart over months costs the same whatever the
+history holds, and trends survive compaction.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from storage import open_sqlite, USER_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOG_DB_PATH = os.getenv('EVENT_LOG_DB_PATH', USER_DB_PATH)
+# Events older than this many days are folded into rollups by compaction
+EVENT_LOG_RETENTION_DAYS = int(os.getenv('EVENT_LOG_RETENTION_DAYS', '90'))
+
+MEAL = 'meal'
+BMR = 'bmr'
+COMPLETION = 'completion'
+GOAL = 'goal'
+PLAN = 'plan'
+
+# Legacy list fields in the user record and the event kind they become
+LEGACY_FIELDS = {'meal_history': MEAL, 'bmr_history': BMR}
+
+DAY = 'day'
+WEEK = 'week'
+MONTH = 'month'
+TREND_PERIODS = (DAY, WEEK, MONTH)
+TREND_FIELDS = ('plans', 'meals_planned', 'calories_planned', 'meals_completed', 'bmr_entries', 'bmr_total',
+                'tdee_total', 'goal_calories_total', 'goals_completed')
+
+
+def _today():
+    return datetime.now().date().isoformat()
+
+
+def _rollup(kind, summary, data):
+    """Fold one event into a monthly rollup summary"""
+    summary['events'] = summary.get('events', 0) + 1
+    if kind == MEAL:
+        summary['meals'] = summary.get('meals', 0) + len(data.get('meal_plan', []))
+    elif kind == BMR:
+        for field in ('bmr', 'tdee', 'goal_calories'):
+            if field in data:
+                summary[f'{field}_total'] = summary.get(f'{field}_total', 0) + data[field]
+        summary['last'] = data
+    elif kind == COMPLETION:
+        summary['completed_meals'] = summary.get('completed_meals', 0) + len(data.get('completed_meals', []))
+    elif kind == GOAL:
+        goals = summary.setdefault('goals', {})
+        # Unchecking a goal takes its completion back
+        step = 1 if data.get('completed', True) else -1
+        goals[data.get('goal_id')] = goals.get(data.get('goal_id'), 0) + step
+    return summary
+
+
+def bucket_start(period, day):
+    """ISO start of the day, week (Monday) or month bucket a day falls in"""
+    if period == DAY:
+        return day
+    if period == MONTH:
+        return day[:8] + '01'
+    start = datetime.strptime(day, '%Y-%m-%d').date()
+    return (start - timedelta(days=start.weekday())).isoformat()
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+
+def _trend_delta(kind, data, day_row):
+    """{field: change} one event makes to its day's trend counters"""
+    if kind == MEAL:
+        # A regenerated plan replaces the day's earlier one
+        return {'plans': 1,
+                'meals_planned': len(data.get('meal_plan', [])) - day_row.get('meals_planned', 0),
+                'calories_planned': _number(data.get('calories')) - day_row.get('calories_planned', 0)}
+    if kind == COMPLETION:
+        return {'meals_completed': len(data.get('completed_meals', [])) - day_row.get('meals_completed', 0)}
+    if kind == BMR:
+        return {'bmr_entries': 1, 'bmr_total': _number(data.get('bmr')), 'tdee_total': _number(data.get('tdee')),
+                'goal_calories_total': _number(data.get('goal_calories'))}
+    if kind == GOAL:
+        return {'goals_completed': 1 if data.get('completed', True) else -1}
+    return {}
+
+
+def trend_row(bucket, counters):
+    """A trends() bucket: the raw counters plus the averages and rates charts plot"""
+    row = {'bucket': bucket, **{field: counters.get(field, 0) for field in TREND_FIELDS}}
+    entries = row['bmr_entries']
+    for field in ('bmr', 'tdee', 'goal_calories'):
+        row[f'avg_{field}'] = round(row[f'{field}_total'] / entries, 1) if entries else None
+    row['meal_adherence'] = (round(row['meals_completed'] / row['meals_planned'], 3)
+                             if row['meals_planned'] else None)
+    return row
+
+
+class EventLog:
+    """SQLite-backed per-user event log with monthly rollups"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS user_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            day TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_user_events_day ON user_events(username, kind, day);
+        CREATE TABLE IF NOT EXISTS user_event_rollups (
+            username TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            month TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            PRIMARY KEY (username, kind, month)
+        );
+        CREATE TABLE IF NOT EXISTS user_trends (
+            username TEXT NOT NULL,
+            period TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            plans INTEGER NOT NULL DEFAULT 0,
+            meals_planned INTEGER NOT NULL DEFAULT 0,
+            calories_planned REAL NOT NULL DEFAULT 0,
+            meals_completed INTEGER NOT NULL DEFAULT 0,
+            bmr_entries INTEGER NOT NULL DEFAULT 0,
+            bmr_total REAL NOT NULL DEFAULT 0,
+            tdee_total REAL NOT NULL DEFAULT 0,
+            goal_calories_total REAL NOT NULL DEFAULT 0,
+            goals_completed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (username, period, bucket)
+        ) WITHOUT ROWID;
+    """
+    _ADD_TRENDS = (
+        f"INSERT INTO user_trends (username, period, bucket, {', '.join(TREND_FIELDS)}) "
+        f"VALUES (?, ?, ?, {', '.join('?' for _ in TREND_FIELDS)}) "
+        f"ON CONFLICT (username, period, bucket) DO UPDATE SET "
+        + ', '.join(f'{field} = {field} + excluded.{field}' for field in TREND_FIELDS))
+
+    def __init__(self, path=EVENT_LOG_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        self.is_new = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_events'").fetchone() is None
+        trends_missing = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_trends'").fetchone() is None
+        conn.executescript(self.SCHEMA)
+        if trends_missing and not self.is_new:
+            logger.info("Building trend rollups from %d existing events", self.rebuild_trends())
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = open_sqlite(self.path)
+        return conn
+
+    def append(self, username, kind, data, day=None):
+        """Record one event (day defaults to today)"""
+        self.append_many([(username, kind, day or _today(), data)])
+
+    def append_many(self, rows):
+        """Record many (username, kind, day, data) events, and their trend changes, in one transaction"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'INSERT INTO user_events (username, kind, day, created_at, data) VALUES (?, ?, ?, ?, ?)',
+                [(username, kind, day, now, json.dumps(data, separators=(',', ':')))
+                 for username, kind, day, data in rows])
+            for username, kind, day, data in rows:
+                self._add_trends(conn, username, kind, day, data)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _day_trends(self, conn, username, day):
+        row = conn.execute(
+            f"SELECT {', '.join(TREND_FIELDS)} FROM user_trends WHERE username = ? AND period = ? AND bucket = ?",
+            (username, DAY, day)).fetchone()
+        return dict(zip(TREND_FIELDS, row)) if row else {}
+
+    def _add_trends(self, conn, username, kind, day, data):
+        # Only plans and completions are measured against the day so far
+        day_row = self._day_trends(conn, username, day) if kind in (MEAL, COMPLETION) else {}
+        delta = _trend_delta(kind, data, day_row)
+        if not any(delta.values()):
+            return
+        values = tuple(delta.get(field, 0) for field in TREND_FIELDS)
+        conn.executemany(self._ADD_TRENDS, [(username, period, bucket_start(period, day)) + values
+                                            for period in TREND_PERIODS])
+
+    def trends(self, username, period, since=None, until=None):
+        """trend_row() per bucket of a period that starts between two ISO days, oldest first"""
+        query = f"SELECT bucket, {', '.join(TREND_FIELDS)} FROM user_trends WHERE username = ? AND period = ?"
+        args = [username, period]
+        if since:
+            query += ' AND bucket >= ?'
+            args.append(bucket_start(period, since))
+        if until:
+            query += ' AND bucket <= ?'
+            args.append(until)
+        rows = self._conn().execute(query + ' ORDER BY bucket', args).fetchall()
+        return [trend_row(row[0], dict(zip(TREND_FIELDS, row[1:]))) for row in rows]
+
+    def rebuild_trends(self):
+        """Recompute user_trends from the raw events; return the number of events read.
+
+        Events already folded by compaction are gone, so each user is rebuilt
+        from their own oldest raw day: day buckets before it keep what they
+        held, and week and month buckets that straddle it are summed from
+        those kept days plus the rebuilt ones.
+        """
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute('SELECT username, kind, day, data FROM user_events ORDER BY id').fetchall()
+            users = {}
+            # Each goal's state per user and day: logs from before only flips were logged repeat toggles
+            checked = {}
+            for username, kind, day, data in rows:
+                data = json.loads(data)
+                if kind == GOAL:
+                    key = (username, day, data.get('goal_id'))
+                    completed = bool(data.get('completed', True))
+                    if checked.get(key, False) == completed:
+                        continue
+                    checked[key] = completed
+                day_row = users.setdefault(username, {}).setdefault(day, {})
+                for field, change in _trend_delta(kind, data, day_row).items():
+                    day_row[field] = day_row.get(field, 0) + change
+            trends = []
+            for username, days in users.items():
+                oldest = min(days)
+                starts = {period: bucket_start(period, oldest) for period in TREND_PERIODS}
+                kept = conn.execute(
+                    f"SELECT bucket, {', '.join(TREND_FIELDS)} FROM user_trends "
+                    f"WHERE username = ? AND period = ? AND bucket >= ? AND bucket < ?",
+                    (username, DAY, min(starts.values()), oldest)).fetchall()
+                all_days = {row[0]: dict(zip(TREND_FIELDS, row[1:])) for row in kept}
+                all_days.update(days)
+                conn.executemany('DELETE FROM user_trends WHERE username = ? AND period = ? AND bucket >= ?',
+                                 [(username, period, start) for period, start in starts.items()])
+                buckets = {}
+                for day, day_row in all_days.items():
+                    for period in TREND_PERIODS:
+                        bucket = bucket_start(period, day)
+                        # Earlier buckets hold compacted days only and were not deleted
+                        if bucket < starts[period]:
+                            continue
+                        counters = buckets.setdefault((username, period, bucket), {})
+                        for field, value in day_row.items():
+                            counters[field] = counters.get(field, 0) + value
+                trends.extend(key + tuple(counters.get(field, 0) for field in TREND_FIELDS)
+                              for key, counters in buckets.items())
+            conn.executemany(
+                f"INSERT INTO user_trends (username, period, bucket, {', '.join(TREND_FIELDS)}) "
+                f"VALUES (?, ?, ?, {', '.join('?' for _ in TREND_FIELDS)})", trends)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return len(rows)
+
+    def range(self, username, kind, since=None, until=None, limit=None):
+        """Events of one kind between two ISO days (inclusive), oldest first.
+
+        With limit, only the most recent limit events are returned.
+        """
+        query = 'SELECT day, data FROM user_events WHERE username = ? AND kind = ?'
+        args = [username, kind]
+        if since:
+            query += ' AND day >= ?'
+            args.append(since)
+        if until:
+            query += ' AND day <= ?'
+            args.append(until)
+        if limit:
+            query += ' ORDER BY day DESC, id DESC LIMIT ?'
+            args.append(limit)
+            rows = self._conn().execute(query, args).fetchall()[::-1]
+        else:
+            rows = self._conn().execute(query + ' ORDER BY day, id', args).fetchall()
+        return [(day, json.loads(data)) for day, data in rows]
+
+    def recent(self, username, kind, days):
+        """Events from the last `days` days"""
+        since = (datetime.now().date() - timedelta(days=days)).isoformat()
+        return self.range(username, kind, since=since)
+
+    def latest(self, username, kind, day=None):
+        """The newest event of a kind (on a given day, if set), or None"""
+        query = 'SELECT data FROM user_events WHERE username = ? AND kind = ?'
+        args = [username, kind]
+        if day:
+            query += ' AND day = ?'
+            args.append(day)
+        row = self._conn().execute(query + ' ORDER BY day DESC, id DESC LIMIT 1', args).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def rollups(self, username, kind):
+        """Monthly summaries of compacted events as {month: summary}"""
+        rows = self._conn().execute(
+            'SELECT month, summary FROM user_event_rollups WHERE username = ? AND kind = ? ORDER BY month',
+            (username, kind)).fetchall()
+        return {month: json.loads(summary) for month, summary in rows}
+
+    def compact(self, retention_days=EVENT_LOG_RETENTION_DAYS):
+        """Fold events older than retention_days into monthly rollups; return the count folded"""
+        cutoff = (datetime.now().date() - timedelta(days=retention_days)).isoformat()
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(
+                'SELECT username, kind, day, data FROM user_events WHERE day < ? ORDER BY id',
+                (cutoff,)).fetchall()
+            summaries = {}
+            for username, kind, day, data in rows:
+                key = (username, kind, day[:7])
+                if key not in summaries:
+                    existing = conn.execute(
+                        'SELECT summary FROM user_event_rollups WHERE username = ? AND kind = ? AND month = ?',
+                        key).fetchone()
+                    summaries[key] = json.loads(existing[0]) if existing else {}
+                _rollup(kind, summaries[key], json.loads(data))
+            conn.executemany(
+                'INSERT OR REPLACE INTO user_event_rollups (username, kind, month, summary) VALUES (?, ?, ?, ?)',
+                [key + (json.dumps(summary, separators=(',', ':')),) for key, summary in summaries.items()])
+            conn.execute('DELETE FROM user_events WHERE day < ?', (cutoff,))
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return len(rows)
+
+    def import_legacy(self, user_store):
+        """Move history lists out of every user record into the log; return users touched"""
+        rows = []
+        updated = {}
+        for username, user in user_store.all_users().items():
+            if not any(field in user for field in (*LEGACY_FIELDS, 'meal_completions')):
+                continue
+            for field, kind in LEGACY_FIELDS.items():
+                for entry in user.pop(field, None) or []:
+                    rows.append((username, kind, entry.get('date') or _today(), entry))
+                    if kind == BMR:
+                        user['latest_bmr'] = entry
+            for day, completed_meals in (user.pop('meal_completions', None) or {}).items():
+                rows.append((username, COMPLETION, day, {'completed_meals': completed_meals}))
+            updated[username] = user
+        if rows:
+            self.append_many(rows)
+        if updated:
+            user_store.put_users(updated)
+        return len(updated)
+
+
+def create_event_log(user_store):
+    """Open the event log, importing legacy history the first time it is created"""
+    log = EventLog(EVENT_LOG_DB_PATH)
+    if log.is_new:
+        imported = log.import_legacy(user_store)
+        if imported:
+            logger.info("Moved history for %d users into the event log", imported)
+    return log
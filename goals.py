@@ -0,0 +1,152 @@
+"""Date-aware daily goal progress kept as counters and per-day bitmasks.
+
+Each goal in a user's record owns one bit, in the order the goals are
+listed. progress['mask'] holds today's completed goals, so checking or
+unchecking a goal flips one bit and moves completed_today by one instead
+of recounting. progress['day'] is the day that mask belongs to: the first
+read or write on a later day rolls the record over, appending the finished
+day's mask (and an empty one per day the user was away) to
+progress['history'], two hex digits per day counted from
+progress['history_start'], and clearing today's flags. Any day's
+completion is then one slice of that string, however long the user has
+been active.
+
+The streak moves once per day: the first time every goal is done on a day
+it extends a streak that ended yesterday (or starts a new one), unchecking
+a goal on that same day takes the day back, and rolling over past a day
+that was not fully completed ends it. `flask rollover-goals` rolls over
+users who have not been seen today, so their records read right elsewhere.
+Toggles carrying a timestamp are last-write-wins per goal, so a batch
+queued on one device cannot undo a later change made on another.
+"""
+from datetime import date, timedelta
+
+# Two hex digits per day: room for eight goals
+HISTORY_DIGITS = 2
+MAX_GOALS = 4 * HISTORY_DIGITS
+
+
+def _day(value):
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def goal_bit(user, goal_id):
+    """The mask bit for goal_id, or None if the user has no such goal"""
+    for i, name in enumerate(user['goals']):
+        if name == goal_id:
+            return 1 << i if i < MAX_GOALS else None
+    return None
+
+
+def full_mask(user):
+    return (1 << min(len(user['goals']), MAX_GOALS)) - 1
+
+
+def _set_counters(user, mask):
+    progress = user['progress']
+    progress['mask'] = mask
+    progress['completed_today'] = mask.bit_count()
+    progress['completion_percentage'] = (
+        progress['completed_today'] / progress['total_goals'] * 100 if progress['total_goals'] else 0)
+
+
+def _migrate(user, today):
+    """Give a record from before day tracking its mask, day and streak fields"""
+    progress = user['progress']
+    progress['total_goals'] = min(len(user['goals']), MAX_GOALS)
+    day = progress.get('last_activity') or today.isoformat()
+    mask = 0
+    for goal_id, goal in user['goals'].items():
+        bit = goal_bit(user, goal_id)
+        if bit and goal.get('completed') and goal.get('date_completed') in (None, day):
+            mask |= bit
+    _set_counters(user, mask)
+    progress['day'] = day
+    progress['history'] = ''
+    progress['history_start'] = day
+    # Old streaks were bumped on every tick: only keep one that is still live
+    progress['last_full_day'] = day if mask == full_mask(user) and progress.get('streak_days') else None
+    if progress['last_full_day'] is None:
+        progress['streak_days'] = 0
+
+
+def is_stale(user, today=None):
+    """True if user's goal progress has not been rolled over to today yet"""
+    day = user.get('progress', {}).get('day')
+    return day is None or day < (today or date.today()).isoformat()
+
+
+def roll_over(user, today=None):
+    """Bring user's progress to today; returns True if the record changed"""
+    today = _day(today or date.today())
+    progress = user['progress']
+    migrated = 'day' not in progress
+    if migrated:
+        _migrate(user, today)
+    current = _day(progress['day'])
+    if current >= today:
+        return migrated
+    # The finished day, then an empty day for every day the user skipped
+    gap = (today - current).days - 1
+    progress['history'] += format(progress['mask'], f'0{HISTORY_DIGITS}x') + '0' * HISTORY_DIGITS * gap
+    if progress.get('last_full_day') != (today - timedelta(days=1)).isoformat():
+        progress['streak_days'] = 0
+    for goal in user['goals'].values():
+        goal['completed'] = False
+    _set_counters(user, 0)
+    progress['day'] = today.isoformat()
+    return True
+
+
+def set_goal(user, goal_id, completed, today=None, at=None):
+    """Check or uncheck goal_id for today; returns True if today's mask changed.
+
+    Returns False if the user has no such goal or the goal was already in
+    that state. at is when the toggle happened (epoch milliseconds). A
+    toggle older than the goal's last change loses to it and is ignored,
+    also returning False.
+    """
+    today = _day(today or date.today())
+    bit = goal_bit(user, goal_id)
+    if bit is None:
+        return False
+    roll_over(user, today)
+    progress = user['progress']
+    goal = user['goals'][goal_id]
+    if at is not None:
+        if at < goal.get('updated_at', 0):
+            return False
+        goal['updated_at'] = at
+    previous = progress['mask']
+    was_full = previous == full_mask(user)
+    mask = previous | bit if completed else previous & ~bit
+    goal['completed'] = completed
+    goal['date_completed'] = today.isoformat() if completed else None
+    _set_counters(user, mask)
+    progress['last_activity'] = today.isoformat()
+
+    is_full = mask == full_mask(user)
+    if is_full and not was_full:
+        yesterday = (today - timedelta(days=1)).isoformat()
+        progress['streak_days'] = progress['streak_days'] + 1 if progress.get('last_full_day') == yesterday else 1
+        progress['last_full_day'] = today.isoformat()
+    elif was_full and not is_full:
+        # Taking back today's full day: the streak ends where it did yesterday
+        progress['streak_days'] = max(0, progress['streak_days'] - 1)
+        progress['last_full_day'] = (today - timedelta(days=1)).isoformat() if progress['streak_days'] else None
+    return mask != previous
+
+
+def day_mask(user, day):
+    """Completed-goal bitmask for a past or current day (0 if unknown)"""
+    progress = user['progress']
+    day = _day(day)
+    if 'day' not in progress:
+        return 0
+    if day == _day(progress['day']):
+        return progress['mask']
+    offset = (day - _day(progress['history_start'])).days * HISTORY_DIGITS
+    if offset < 0 or offset >= len(progress['history']):
+        return 0
+    return int(progress['history'][offset:offset + HISTORY_DIGITS], 16)
+
@@ -0,0 +1,327 @@
+"""Shared OpenRouter client.
+
+One OpenAI-compatible client per process with explicit timeouts, a bounded
+connection pool and a cap on concurrent calls. Rate limits, timeouts and 5xx
+responses are retried with exponential backoff; repeated failures open a
+circuit breaker so callers fail fast (and fall back to cached plans) while
+OpenRouter is degraded. Set LLM_STUB=1 to talk to the local stub server in
+llm_stub.py instead of OpenRouter.
+
+With LLM_ASYNC=1 an AsyncLLMClient (AsyncOpenAI on one background event
+loop) is built alongside it, so background meal jobs wait on OpenRouter as
+coroutines instead of each holding a thread; one process can then keep
+LLM_ASYNC_MAX_CONCURRENCY calls in flight.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+import httpx
+import openai
+from openai import AsyncOpenAI, OpenAI
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+OPENROUTER_BASE_URL = os.getenv('OPENROUTER_BASE_URL', 'https://openrouter.ai/api/v1')
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', '5'))
+LLM_READ_TIMEOUT = float(os.getenv('LLM_READ_TIMEOUT', '60'))
+LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', '20'))
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', str(LLM_MAX_CONNECTIONS)))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '3'))
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', '0.5'))
+LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', '8'))
+LLM_BREAKER_THRESHOLD = int(os.getenv('LLM_BREAKER_THRESHOLD', '5'))
+LLM_BREAKER_COOLDOWN = float(os.getenv('LLM_BREAKER_COOLDOWN', '30'))
+LLM_ASYNC = os.getenv('LLM_ASYNC', '0') == '1'
+LLM_ASYNC_MAX_CONCURRENCY = int(os.getenv('LLM_ASYNC_MAX_CONCURRENCY', '256'))
+LLM_STUB = os.getenv('LLM_STUB', '0') == '1'
+LLM_STUB_PORT = int(os.getenv('LLM_STUB_PORT', '8765'))
+LLM_STUB_LATENCY = float(os.getenv('LLM_STUB_LATENCY', '0'))
+LLM_STUB_FAILURE_RATE = float(os.getenv('LLM_STUB_FAILURE_RATE', '0'))
+LLM_STUB_SLOW_RATE = float(os.getenv('LLM_STUB_SLOW_RATE', '0'))
+# Comma-separated MODEL=SECONDS pairs, like llm_stub.py's --model-latency
+LLM_STUB_MODEL_LATENCY = {model.strip(): float(seconds) for model, seconds in
+                          (item.rsplit('=', 1) for item in os.getenv('LLM_STUB_MODEL_LATENCY', '').split(',')
+                           if item.strip())}
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+LLM_LATENCY = metrics.histogram('llm_request_duration_seconds',
+                                'Latency of each OpenRouter call attempt by outcome', ['outcome'])
+LLM_RETRIES = metrics.counter('llm_retries_total', 'OpenRouter call attempts that were retried', ['error'])
+LLM_REJECTED = metrics.counter('llm_circuit_open_total', 'Calls refused because the circuit breaker was open')
+
+
+def _outcome(error):
+    """success, timeout or error, for the latency histogram"""
+    if error is None:
+        return 'success'
+    if isinstance(error, (openai.APITimeoutError, httpx.TimeoutException)):
+        return 'timeout'
+    return 'error'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling OpenRouter while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, threshold=LLM_BREAKER_THRESHOLD, cooldown=LLM_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True if a call may go out now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                # Let one probe through; its result decides whether we close again
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def record_cancelled(self):
+        """A call was cancelled before it had a result; a half-open probe reopens so another can go out"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+def _retry_after(error):
+    """Seconds requested by a Retry-After header, if any"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class _ResilientClient:
+    """Retry, backoff and circuit-breaker bookkeeping shared by both clients"""
+
+    def __init__(self, api_key, base_url, max_retries, breaker):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+
+    def _backoff(self, attempt, error):
+        delay = _retry_after(error)
+        if delay is None:
+            delay = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt))
+            delay *= random.uniform(0.5, 1.0)
+        return delay
+
+    def _before_call(self):
+        if not self.breaker.allow():
+            LLM_REJECTED.inc()
+            raise CircuitOpenError('OpenRouter circuit breaker is open')
+
+    def _succeeded(self, started):
+        LLM_LATENCY.labels('success').observe(time.perf_counter() - started)
+        self.breaker.record_success()
+
+    def _failed(self, error, attempt, started):
+        """Record a failed attempt; return the delay before retrying, or None to give up"""
+        LLM_LATENCY.labels(_outcome(error)).observe(time.perf_counter() - started)
+        if isinstance(error, RETRYABLE_ERRORS):
+            if attempt >= self.max_retries:
+                self.breaker.record_failure()
+                return None
+            delay = self._backoff(attempt, error)
+            LLM_RETRIES.labels(error.__class__.__name__).inc()
+            logger.warning("LLM call failed (%s), retrying in %.1fs", error.__class__.__name__, delay)
+            return delay
+        if isinstance(error, openai.APIStatusError):
+            # A 4xx means OpenRouter is up and rejected this request
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        return None
+
+
+class LLMClient(_ResilientClient):
+    """Process-wide OpenRouter client with retries and a circuit breaker"""
+
+    def __init__(self, api_key, base_url=OPENROUTER_BASE_URL, max_retries=LLM_MAX_RETRIES,
+                 breaker=None):
+        super().__init__(api_key, base_url, max_retries, breaker)
+        self._slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+        self.http_client = httpx.Client(
+            timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                                max_keepalive_connections=LLM_MAX_CONNECTIONS)
+        )
+        # Retries are handled here so they also drive the circuit breaker
+        self.openai = OpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                             http_client=self.http_client)
+
+    def create_chat_completion(self, **kwargs):
+        """chat.completions.create with concurrency cap, retries and breaker.
+
+        With stream=True the retry covers opening the stream; errors in the
+        middle of a stream are raised to the caller.
+        """
+        self._before_call()
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                with self._slots:
+                    response = self.openai.chat.completions.create(**kwargs)
+            except Exception as e:
+                delay = self._failed(e, attempt, started)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self._succeeded(started)
+            return response
+
+    def close(self):
+        self.http_client.close()
+
+
+class AsyncLLMClient(_ResilientClient):
+    """AsyncOpenAI on a dedicated event-loop thread, with the same retries and breaker.
+
+    Coroutines are handed to the loop with submit() from any thread; the
+    loop, HTTP pool and OpenAI client are created on first use so a
+    gunicorn master never owns them across a fork.
+    """
+
+    def __init__(self, api_key, base_url=OPENROUTER_BASE_URL, max_retries=LLM_MAX_RETRIES,
+                 breaker=None, max_concurrency=LLM_ASYNC_MAX_CONCURRENCY):
+        super().__init__(api_key, base_url, max_retries, breaker)
+        self.max_concurrency = max_concurrency
+        self.loop = None
+        self.openai = None
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self.loop is not None:
+                return self.loop
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                self._slots = asyncio.Semaphore(self.max_concurrency)
+                self.http_client = httpx.AsyncClient(
+                    timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                    limits=httpx.Limits(max_connections=self.max_concurrency,
+                                        max_keepalive_connections=LLM_MAX_CONNECTIONS))
+                self.openai = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0,
+                                          http_client=self.http_client)
+                ready.set()
+                loop.run_forever()
+
+            threading.Thread(target=run, daemon=True, name='llm-async').start()
+            ready.wait()
+            self.loop = loop
+            return loop
+
+    def submit(self, coro):
+        """Schedule a coroutine on the client's loop; returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._start())
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the client's loop and block the calling thread for its result"""
+        return self.submit(coro).result(timeout)
+
+    async def create_chat_completion(self, **kwargs):
+        """Async chat.completions.create; must be awaited on the client's loop.
+
+        A cancelled call (a losing hedge, say) records neither success nor
+        failure, but never leaves the breaker stuck waiting for its probe.
+        """
+        self._before_call()
+        attempt = 0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    async with self._slots:
+                        self.in_flight += 1
+                        try:
+                            response = await self.openai.chat.completions.create(**kwargs)
+                        finally:
+                            self.in_flight -= 1
+                except Exception as e:
+                    delay = self._failed(e, attempt, started)
+                    if delay is None:
+                        raise
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                self._succeeded(started)
+                return response
+        except asyncio.CancelledError:
+            self.breaker.record_cancelled()
+            raise
+
+    def close(self):
+        if self.loop is not None:
+            self.run(self.http_client.aclose())
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def create_llm_client():
+    """Build the shared client, or None when no API key is configured"""
+    if LLM_STUB:
+        import llm_stub
+        base_url = llm_stub.start_in_background(port=LLM_STUB_PORT, latency=LLM_STUB_LATENCY,
+                                                failure_rate=LLM_STUB_FAILURE_RATE, slow_rate=LLM_STUB_SLOW_RATE,
+                                                model_latency=LLM_STUB_MODEL_LATENCY)
+        logger.info("Using local LLM stub at %s", base_url)
+        return LLMClient('stub-key', base_url=base_url)
+
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key:
+        return None
+    return LLMClient(api_key)
+
+
+def create_async_llm_client(client):
+    """AsyncLLMClient for the same endpoint as client when LLM_ASYNC=1, else None.
+
+    The two clients share one circuit breaker, so either one seeing
+    OpenRouter fail makes both fall back.
+    """
+    if not LLM_ASYNC or client is None:
+        return None
+    return AsyncLLMClient(client.api_key, base_url=client.base_url, breaker=client.breaker)
@@ -0,0 +1,218 @@
+"""Local stand-in for the OpenRouter chat completions API.
+
+Serves canned meal plans in the same format the real prompt asks for (JSON
+when the request carries a response_format, HTML otherwise), with optional
+latency and failure injection, so the app can be exercised offline. Run it
+on its own with
+
+    python llm_stub.py --port 8765 --latency 1.5 --failure-rate 0.1
+
+and point OPENROUTER_BASE_URL at http://127.0.0.1:8765/v1, or set LLM_STUB=1
+to have the app start one in the background.
+
+--slow-rate makes that fraction of calls ten times slower (a latency tail)
+and --model-latency MODEL=SECONDS gives one model its own mean delay, for
+exercising model routing and hedging. The background stub takes the same
+settings from LLM_STUB_SLOW_RATE and LLM_STUB_MODEL_LATENCY
+(MODEL=SECONDS,MODEL=SECONDS).
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DISHES = {
+    'breakfast': ['Poha', 'Idli Sambar', 'Upma', 'Aloo Paratha', 'Dhokla', 'Appam with Stew', 'Pesarattu'],
+    'lunch': ['Rajma Chawal', 'Bisi Bele Bath', 'Dal Baati', 'Sambar Rice', 'Chole with Rice', 'Kadhi Pakora'],
+    'dinner': ['Palak Paneer with Roti', 'Vegetable Pulao', 'Khichdi', 'Dal Makhani with Roti', 'Avial with Rice']
+}
+
+
+def _meal_calories(prompt):
+    """Pull the per-meal calorie targets out of the prompt"""
+    calories = {}
+    for meal in ('Breakfast', 'Lunch', 'Dinner'):
+        match = re.search(meal + r' \(~(\d+) cal\)', prompt)
+        calories[meal.lower()] = int(match.group(1)) if match else 500
+    return calories
+
+
+def build_multi_day_plan(prompt, days):
+    """Return a {"days": [...]} plan; dishes cycle through a shuffled list, so long plans repeat"""
+    calories = _meal_calories(prompt)
+    dishes = {meal: random.sample(options, len(options)) for meal, options in DISHES.items()}
+    return json.dumps({'days': [
+        {meal: {'name': dishes[meal][day % len(dishes[meal])], 'calories': calories[meal],
+                'description': f"A traditional {meal} made with local ingredients and regional spices."}
+         for meal in ('breakfast', 'lunch', 'dinner')}
+        for day in range(days)
+    ]})
+
+
+def build_meal(prompt):
+    """Return one replacement meal as JSON, preferring a dish the prompt does not list"""
+    meal = re.search(r'one authentic (\w+) dish', prompt)
+    meal = meal.group(1) if meal and meal.group(1) in DISHES else 'lunch'
+    calories = re.search(r'about (\d+) calories', prompt)
+    options = [dish for dish in DISHES[meal] if dish not in prompt] or DISHES[meal]
+    return json.dumps({'name': random.choice(options), 'calories': int(calories.group(1)) if calories else 500,
+                       'description': f"A traditional {meal} made with local ingredients and regional spices."})
+
+
+def build_meal_plan(prompt, structured=False):
+    """Return a meal plan as JSON (structured) or in the legacy HTML format"""
+    calories = _meal_calories(prompt)
+    if structured:
+        return json.dumps({
+            meal: {'name': random.choice(DISHES[meal]), 'calories': calories[meal],
+                   'description': f"A traditional {meal} made with local ingredients and regional spices."}
+            for meal in ('breakfast', 'lunch', 'dinner')
+        })
+    sections = []
+    for meal in ('breakfast', 'lunch', 'dinner'):
+        dish = random.choice(DISHES[meal])
+        sections.append(f"""    <div class="meal-section">
+        <div class="meal-title">{meal.title()}</div>
+        <div class="food-card">
+            <h4>{dish}</h4>
+            <p class="food-calories">{calories[meal]} calories</p>
+            <p class="food-description">A traditional {meal} made with local ingredients and regional spices. It is filling, balanced and popular across the region.</p>
+        </div>
+    </div>""")
+    return '<div class="meal-plan">\n' + '\n'.join(sections) + '\n</div>'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    failure_rate = 0.0
+    slow_rate = 0.0
+    model_latency = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, completion_id, model, content, usage, payload):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        for i in range(0, len(content), 40):
+            chunk = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                     'model': model,
+                     'choices': [{'index': 0, 'delta': {'content': content[i:i + 40]}, 'finish_reason': None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        final = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                 'model': model, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]}
+        self.wfile.write(f"data: {json.dumps(final)}\n\n".encode())
+        if (payload.get('stream_options') or {}).get('include_usage'):
+            usage_chunk = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                           'model': model, 'choices': [], 'usage': usage}
+            self.wfile.write(f"data: {json.dumps(usage_chunk)}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'Not found'}})
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+
+        latency = self.model_latency.get(payload.get('model'), self.latency)
+        if latency:
+            delay = random.uniform(0.5, 1.5) * latency
+            if self.slow_rate and random.random() < self.slow_rate:
+                delay *= 10
+            time.sleep(delay)
+        if self.failure_rate and random.random() < self.failure_rate:
+            if random.random() < 0.5:
+                self._send_json(429, {'error': {'message': 'Rate limited (stub)'}}, {'Retry-After': '0'})
+            else:
+                self._send_json(503, {'error': {'message': 'Upstream unavailable (stub)'}})
+            return
+
+        prompt = ' '.join(m.get('content', '') for m in payload.get('messages', []))
+        schema_name = ((payload.get('response_format') or {}).get('json_schema') or {}).get('name')
+        days = re.search(r'exactly (\d+) day objects', prompt)
+        if schema_name == 'meal_plan_days' and days:
+            content = build_multi_day_plan(prompt, int(days.group(1)))
+        elif schema_name == 'meal':
+            content = build_meal(prompt)
+        else:
+            content = build_meal_plan(prompt, structured=bool(payload.get('response_format')))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = payload.get('model', 'stub')
+        usage = {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(content) // 4,
+                 'total_tokens': (len(prompt) + len(content)) // 4}
+
+        if payload.get('stream'):
+            try:
+                self._send_stream(completion_id, model, content, usage, payload)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # The client hung up, e.g. a hedged attempt that lost
+            return
+
+        self._send_json(200, {
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                         'finish_reason': 'stop'}],
+            'usage': usage
+        })
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections when hundreds of calls arrive at once
+    request_queue_size = 1024
+
+
+def make_server(host='127.0.0.1', port=8765, latency=0.0, failure_rate=0.0, slow_rate=0.0, model_latency=None):
+    handler = type('ConfiguredStubHandler', (StubHandler,),
+                   {'latency': latency, 'failure_rate': failure_rate, 'slow_rate': slow_rate,
+                    'model_latency': dict(model_latency or {})})
+    return StubServer((host, port), handler)
+
+
+def start_in_background(host='127.0.0.1', port=8765, latency=0.0, failure_rate=0.0, slow_rate=0.0,
+                        model_latency=None):
+    """Start the stub on a daemon thread and return its base URL"""
+    try:
+        server = make_server(host, port, latency, failure_rate, slow_rate, model_latency)
+    except OSError:
+        # Another worker already started it on this port
+        return f"http://{host}:{port}/v1"
+    thread = threading.Thread(target=server.serve_forever, daemon=True, name='llm-stub')
+    thread.start()
+    return f"http://{host}:{server.server_address[1]}/v1"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local OpenRouter stub for offline testing')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='mean response delay in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of 429/503 responses')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='fraction of responses 10x slower')
+    parser.add_argument('--model-latency', action='append', default=[], metavar='MODEL=SECONDS',
+                        help='mean delay for one model (repeatable)')
+    args = parser.parse_args()
+    model_latency = {model: float(seconds) for model, seconds in (item.rsplit('=', 1) for item in args.model_latency)}
+    server = make_server(args.host, args.port, args.latency, args.failure_rate, args.slow_rate, model_latency)
+    print(f"LLM stub listening on http://{args.host}:{server.server_address[1]}/v1")
+    server.serve_forever()
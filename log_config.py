@@ -0,0 +1,51 @@
+"""Logging setup shared by the app, workers and CLI commands.
+
+LOG_LEVEL picks the level (INFO by default; request details such as form
+data and LLM response previews are DEBUG). LOG_FORMAT=json emits one JSON
+object per line with any `extra=` fields attached, for log aggregation;
+the default is a plain one-line text format.
+"""
+import json
+import logging
+import os
+import sys
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including extra= fields"""
+
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    """Install a single stderr handler on the root logger (idempotent)"""
+    root = logging.getLogger()
+    if getattr(root, '_wellora_configured', False):
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    if LOG_FORMAT == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    # httpx logs every OpenRouter request at INFO
+    logging.getLogger('httpx').setLevel(max(logging.WARNING, root.level))
+    root._wellora_configured = True
@@ -0,0 +1,191 @@
+"""Cache for AI meal-plan responses.
+
+Plans are keyed on the normalized prompt inputs (state, city, calorie bucket,
+food preference), so every user who falls into the same bucket can be served
+without another LLM round trip. Each key holds a few variants; a lookup skips
+variants with a dish the user has been given recently (a near match in
+their DishIndex, so spelling variants count). Entries live in an
+in-memory LRU with a TTL, backed by a SQLite file that survives restarts.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dish_index import as_index
+from storage import open_sqlite
+
+MEAL_CACHE_PATH = os.getenv('MEAL_CACHE_PATH', 'meal_cache.db')
+MEAL_CACHE_SIZE = int(os.getenv('MEAL_CACHE_SIZE', '512'))
+MEAL_CACHE_TTL = int(os.getenv('MEAL_CACHE_TTL', str(7 * 24 * 3600)))
+MEAL_CACHE_BUCKET = int(os.getenv('MEAL_CACHE_BUCKET', '100'))
+MEAL_CACHE_VARIANTS = int(os.getenv('MEAL_CACHE_VARIANTS', '5'))
+
+
+def quantize_calories(calories, bucket=MEAL_CACHE_BUCKET):
+    """Round calories to the nearest bucket so nearby targets share plans"""
+    if bucket <= 1:
+        return int(calories)
+    return int(round(float(calories) / bucket) * bucket)
+
+
+def make_key(state, city, calories, food_preference, bucket=MEAL_CACHE_BUCKET):
+    """Normalized cache key for a meal-plan prompt"""
+    return (
+        (state or '').strip().lower(),
+        (city or '').strip().lower(),
+        quantize_calories(calories, bucket),
+        (food_preference or '').strip().lower()
+    )
+
+
+def _key_str(key):
+    return json.dumps(list(key), separators=(',', ':'))
+
+
+def _is_excluded(dishes, recent):
+    """True if any dish of a variant nearly repeats one of the user's recent dishes"""
+    return len(recent) > 0 and recent.match_any(dishes)
+
+
+class MealPlanCache:
+    """Two-tier (memory LRU + SQLite) cache of meal-plan responses"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meal_plan_cache (
+            cache_key TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            dishes TEXT NOT NULL,
+            content TEXT NOT NULL,
+            PRIMARY KEY (cache_key, created_at)
+        );
+    """
+
+    def __init__(self, path=MEAL_CACHE_PATH, maxsize=MEAL_CACHE_SIZE, ttl=MEAL_CACHE_TTL,
+                 bucket=MEAL_CACHE_BUCKET, variants=MEAL_CACHE_VARIANTS):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.bucket = bucket
+        self.variants = variants
+        # key -> list of (created_at, dishes, content), oldest first
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self._conn().executescript(self.SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = open_sqlite(self.path)
+        return conn
+
+    def make_key(self, state, city, calories, food_preference):
+        return make_key(state, city, calories, food_preference, self.bucket)
+
+    def _fresh(self, entries):
+        cutoff = time.time() - self.ttl
+        return [entry for entry in entries if entry[0] >= cutoff]
+
+    def _load_variants(self, key):
+        """Memory tier first, then the disk tier"""
+        with self._lock:
+            entries = self._memory.get(key)
+            if entries is not None:
+                self._memory.move_to_end(key)
+                return self._fresh(entries)
+
+        entries = []
+        if self.path:
+            rows = self._conn().execute(
+                'SELECT created_at, dishes, content FROM meal_plan_cache '
+                'WHERE cache_key = ? AND created_at >= ? ORDER BY created_at',
+                (_key_str(key), time.time() - self.ttl)).fetchall()
+            entries = [(created_at, json.loads(dishes), content)
+                       for created_at, dishes, content in rows]
+        self._remember(key, entries)
+        return entries
+
+    def _remember(self, key, entries):
+        with self._lock:
+            self._memory[key] = entries
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.maxsize:
+                self._memory.popitem(last=False)
+
+    def get(self, key, previous_meals=None, refresh=False):
+        """Return a cached response that avoids previous_meals, or None.
+
+        previous_meals is a list of dish names or a DishIndex of them.
+        refresh=True skips the memory tier, for when another worker may
+        just have written the disk tier.
+        """
+        if refresh:
+            with self._lock:
+                self._memory.pop(key, None)
+        recent = as_index(previous_meals)
+        for created_at, dishes, content in reversed(self._load_variants(key)):
+            if not _is_excluded(dishes, recent):
+                with self._lock:
+                    self.hits += 1
+                return content
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, content, dishes):
+        """Store a validated response as a new variant, dropping the oldest.
+
+        With a disk tier the trim happens in SQL, so variants other workers
+        wrote count towards the limit, and the memory tier is refilled from
+        what is left.
+        """
+        entry = (time.time(), list(dishes), content)
+        if not self.path:
+            entries = (self._load_variants(key) + [entry])[-self.variants:]
+            self._remember(key, entries)
+            return
+
+        conn = self._conn()
+        key_str = _key_str(key)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO meal_plan_cache (cache_key, created_at, dishes, content) '
+                'VALUES (?, ?, ?, ?)',
+                (key_str, entry[0], json.dumps(entry[1]), content))
+            conn.execute(
+                'DELETE FROM meal_plan_cache WHERE cache_key = ? AND (created_at < ? OR created_at NOT IN ('
+                'SELECT created_at FROM meal_plan_cache WHERE cache_key = ? ORDER BY created_at DESC LIMIT ?))',
+                (key_str, time.time() - self.ttl, key_str, self.variants))
+            rows = conn.execute(
+                'SELECT created_at, dishes, content FROM meal_plan_cache WHERE cache_key = ? ORDER BY created_at',
+                (key_str,)).fetchall()
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        self._remember(key, [(created_at, json.loads(dishes), content) for created_at, dishes, content in rows])
+
+    def purge_expired(self):
+        """Drop expired rows from the disk tier; return how many were removed"""
+        if not self.path:
+            return 0
+        cursor = self._conn().execute(
+            'DELETE FROM meal_plan_cache WHERE created_at < ?', (time.time() - self.ttl,))
+        return cursor.rowcount
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'keys': len(self._memory), 'maxsize': self.maxsize}
+
+
+def create_meal_cache():
+    """Build the meal-plan cache, or None when MEAL_CACHE_SIZE is 0"""
+    if MEAL_CACHE_SIZE <= 0:
+        return None
+    return MealPlanCache()
@@ -0,0 +1,214 @@
+"""Background meal-plan generation.
+
+The calculator hands the slow LLM call to a small thread pool and renders the
+BMR result straight away. Each job has an ID the page polls (or streams over
+Server-Sent Events). Job status and results are also written to SQLite so a
+poll that lands on a different gunicorn worker still gets an answer.
+Jobs whose work is a coroutine (submit_async) run on an event loop instead
+of the pool, so they do not count against MEAL_JOB_WORKERS.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import open_sqlite, USER_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+MEAL_JOB_WORKERS = int(os.getenv('MEAL_JOB_WORKERS', '8'))
+MEAL_JOB_DB_PATH = os.getenv('MEAL_JOB_DB_PATH', USER_DB_PATH)
+MEAL_JOB_TTL = int(os.getenv('MEAL_JOB_TTL', '3600'))
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class MealJob:
+    """In-process state of one generation job, including streamed tokens"""
+
+    def __init__(self, job_id, username, params, status=PENDING, result=None, error=None,
+                 created_at=None):
+        self.job_id = job_id
+        self.username = username
+        self.params = params
+        self.status = status
+        self.result = result
+        self.error = error
+        self.created_at = created_at or time.time()
+        self.chunks = []
+        self.cond = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    def push_token(self, text):
+        """Record a streamed piece of the LLM response and wake listeners"""
+        with self.cond:
+            self.chunks.append(text)
+            self.cond.notify_all()
+
+    def wait(self, seen, timeout):
+        """Block until there are chunks beyond seen or the job finishes"""
+        with self.cond:
+            if len(self.chunks) <= seen and not self.finished:
+                self.cond.wait(timeout)
+            return self.chunks[seen:], self.finished
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'meal_plan': self.result,
+            'error': self.error
+        }
+
+
+class MealJobManager:
+    """Runs generation jobs on a thread pool and tracks their state"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meal_jobs (
+            job_id TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            status TEXT NOT NULL,
+            params TEXT NOT NULL,
+            result TEXT,
+            error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_meal_jobs_created ON meal_jobs(created_at);
+    """
+
+    def __init__(self, path=MEAL_JOB_DB_PATH, workers=MEAL_JOB_WORKERS, ttl=MEAL_JOB_TTL):
+        self.path = path
+        self.workers = workers
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._executor = None
+        self._conn().executescript(self.SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = open_sqlite(self.path)
+        return conn
+
+    def _get_executor(self):
+        # Created lazily so the pool is started in the worker process, not
+        # in a gunicorn master that forks afterwards
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix='meal-job')
+            return self._executor
+
+    def _persist(self, job):
+        self._conn().execute(
+            'INSERT INTO meal_jobs (job_id, username, status, params, result, error, created_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(job_id) DO UPDATE SET status = excluded.status, result = excluded.result, '
+            'error = excluded.error, updated_at = excluded.updated_at',
+            (job.job_id, job.username, job.status, json.dumps(job.params),
+             json.dumps(job.result) if job.result is not None else None,
+             job.error, job.created_at, time.time()))
+
+    def submit(self, username, params, work):
+        """Queue work(job) and return the new job.
+
+        work runs on the pool, may call job.push_token() while streaming, and
+        returns the parsed meal plan (or None if generation failed).
+        """
+        job = self._create(username, params)
+        self._get_executor().submit(self._run, job, work)
+        return job
+
+    def submit_async(self, username, params, work, schedule):
+        """Like submit, but work(job) returns a coroutine and schedule(coro) runs it on an event loop"""
+        job = self._create(username, params)
+        schedule(self._run_async(job, work))
+        return job
+
+    def _create(self, username, params):
+        job = MealJob(uuid.uuid4().hex, username, params)
+        with self._lock:
+            self._jobs[job.job_id] = job
+        self._persist(job)
+        self._prune()
+        return job
+
+    def _set_result(self, job, result):
+        job.result = result
+        job.status = DONE if result else FAILED
+        if not result:
+            job.error = 'No meal recommendations available right now'
+
+    def _set_error(self, job, e):
+        logger.exception("Meal job %s failed: %s", job.job_id, e)
+        job.status = FAILED
+        job.error = str(e)
+
+    def _run(self, job, work):
+        job.status = RUNNING
+        try:
+            self._set_result(job, work(job))
+        except Exception as e:
+            self._set_error(job, e)
+        self._finish(job)
+
+    async def _run_async(self, job, work):
+        job.status = RUNNING
+        try:
+            self._set_result(job, await work(job))
+        except Exception as e:
+            self._set_error(job, e)
+        # The SQLite write would otherwise stall every other coroutine on the loop
+        await asyncio.to_thread(self._finish, job)
+
+    def _finish(self, job):
+        try:
+            self._persist(job)
+        except Exception as e:
+            logger.error("Error saving meal job %s: %s", job.job_id, e)
+        with job.cond:
+            job.cond.notify_all()
+
+    def get(self, job_id):
+        """Return the job from this process, or a snapshot from SQLite"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        row = self._conn().execute(
+            'SELECT username, status, params, result, error, created_at FROM meal_jobs '
+            'WHERE job_id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        username, status, params, result, error, created_at = row
+        return MealJob(job_id, username, json.loads(params), status,
+                       json.loads(result) if result else None, error, created_at)
+
+    def is_local(self, job_id):
+        """True if the job is running (or ran) in this process"""
+        with self._lock:
+            return job_id in self._jobs
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished and job.created_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+        if expired:
+            self._conn().execute('DELETE FROM meal_jobs WHERE created_at < ?', (cutoff,))
@@ -0,0 +1,279 @@
+"""Parser for LLM meal-plan responses.
+
+Structured responses are JSON validated against MEAL_PLAN_SCHEMA (or
+MULTI_DAY_PLAN_SCHEMA, a list of such days, for multi-day plans, or
+MEAL_SCHEMA for a single replacement meal). Legacy
+HTML responses are scanned once with one precompiled tokenizer pattern:
+every meal-section opens a new meal, and the title, dish name, calories and
+description tokens that follow are attached to it. Fallback regexes only run
+on the rare section that is missing its calorie line.
+"""
+import json
+import math
+import re
+
+MEAL_TYPES = ('breakfast', 'lunch', 'dinner')
+
+_TOKENS = re.compile(
+    r'<div\s+class=["\'][^"\']*\bmeal-section\b[^"\']*["\'][^>]*>'
+    r'|<div\s+class=["\'][^"\']*\bmeal-title\b[^"\']*["\'][^>]*>(?P<title>.*?)</div>'
+    r'|<h(?P<level>[34])[^>]*>(?P<name>.*?)</h(?P=level)>'
+    r'|<p\s+class=["\'][^"\']*\bfood-calories\b[^"\']*["\'][^>]*>(?P<calories>.*?)</p>'
+    r'|<p\s+class=["\'][^"\']*\bfood-description\b[^"\']*["\'][^>]*>(?P<description>.*?)</p>'
+    r'|<p(?:\s[^>]*)?>(?P<paragraph>.*?)</p>',
+    re.DOTALL | re.IGNORECASE
+)
+_CALORIES = re.compile(r'(\d+)\s*(?:calories?|cal|kcal)', re.IGNORECASE)
+_BARE_NUMBER = re.compile(r'\b(\d{2,3})\b')
+_TAGS = re.compile(r'<[^>]*>')
+_WHITESPACE = re.compile(r'\s+')
+_ERROR_MARKERS = ('error-message', 'API Configuration Required')
+_JSON_FENCE = re.compile(r'^```(?:json)?\s*(.*?)\s*```$', re.DOTALL)
+
+MEAL_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'name': {'type': 'string'},
+        'calories': {'type': 'integer'},
+        'description': {'type': 'string'}
+    },
+    'required': ['name', 'calories', 'description'],
+    'additionalProperties': False
+}
+
+MEAL_PLAN_SCHEMA = {
+    'type': 'object',
+    'properties': {meal_type: MEAL_SCHEMA for meal_type in MEAL_TYPES},
+    'required': list(MEAL_TYPES),
+    'additionalProperties': False
+}
+
+MULTI_DAY_PLAN_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'days': {'type': 'array', 'items': MEAL_PLAN_SCHEMA}
+    },
+    'required': ['days'],
+    'additionalProperties': False
+}
+
+
+def _text(fragment):
+    """Strip tags and normalize whitespace"""
+    return _WHITESPACE.sub(' ', _TAGS.sub('', fragment)).strip()
+
+
+class Meal:
+    """One parsed meal"""
+
+    __slots__ = ('meal_type', 'name', 'calories', 'description')
+
+    def __init__(self, meal_type, name, calories, description):
+        self.meal_type = meal_type
+        self.name = name
+        self.calories = calories
+        self.description = description
+
+    def __repr__(self):
+        return f"Meal({self.meal_type!r}, {self.name!r}, {self.calories})"
+
+    def to_dict(self):
+        """The {'name', 'description', 'calories'} shape used by the app"""
+        return {
+            'name': self.name,
+            'description': f"{self.name}. {self.description}",
+            'calories': self.calories
+        }
+
+
+class MealPlan:
+    """Parsed meals in the order they appeared"""
+
+    __slots__ = ('meals',)
+
+    def __init__(self, meals):
+        self.meals = meals
+
+    def __len__(self):
+        return len(self.meals)
+
+    def __iter__(self):
+        return iter(self.meals)
+
+    def get(self, meal_type):
+        for meal in self.meals:
+            if meal.meal_type == meal_type:
+                return meal
+        return None
+
+    @property
+    def total_calories(self):
+        return sum(meal.calories for meal in self.meals)
+
+    def to_dict(self):
+        """The {meal_type: {'name', 'description', 'calories'}} shape used by the app"""
+        return {meal.meal_type: meal.to_dict() for meal in self.meals}
+
+
+class _Section:
+    __slots__ = ('start', 'end', 'title', 'name', 'name_level', 'calories', 'description', 'paragraph')
+
+    def __init__(self, start):
+        self.start = start
+        self.end = None
+        self.title = None
+        self.name = None
+        self.name_level = None
+        self.calories = None
+        self.description = None
+        self.paragraph = None
+
+
+def _load_json(content):
+    fenced = _JSON_FENCE.match(content.strip())
+    if fenced:
+        content = fenced.group(1)
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def parse_json(content):
+    """Validate a structured (JSON) response against MEAL_PLAN_SCHEMA.
+
+    Returns a MealPlan, or None if the JSON is malformed or off-schema.
+    """
+    data = _load_json(content)
+    return _plan_from_json(data) if data is not None else None
+
+
+def parse_days(content):
+    """Validate a multi-day response against MULTI_DAY_PLAN_SCHEMA.
+
+    Returns a list of MealPlans (one per day, in order), or None if the JSON
+    is malformed, empty or any day is off-schema.
+    """
+    data = _load_json(content) if content else None
+    days = data.get('days') if data is not None else None
+    if not isinstance(days, list) or not days:
+        return None
+    plans = [_plan_from_json(day) if isinstance(day, dict) else None for day in days]
+    return None if any(plan is None for plan in plans) else plans
+
+
+def parse_meal(content, meal_type):
+    """Validate a single-meal response against MEAL_SCHEMA; returns a Meal or None"""
+    data = _load_json(content) if content else None
+    return _meal_from_json(meal_type, data) if data is not None else None
+
+
+def _meal_from_json(meal_type, meal):
+    if not isinstance(meal, dict):
+        return None
+    name, calories, description = meal.get('name'), meal.get('calories'), meal.get('description')
+    if not isinstance(name, str) or not name.strip() or not isinstance(description, str):
+        return None
+    # Some providers send numbers as floats or numeric strings despite the schema
+    if isinstance(calories, str) and calories.strip().isdigit():
+        calories = int(calories)
+    if (isinstance(calories, bool) or not isinstance(calories, (int, float))
+            or not math.isfinite(calories) or calories <= 0):
+        return None
+    return Meal(meal_type, _text(name), int(round(calories)), _text(description))
+
+
+def _plan_from_json(data):
+    meals = []
+    for meal_type in MEAL_TYPES:
+        meal = _meal_from_json(meal_type, data.get(meal_type))
+        if meal is None:
+            return None
+        meals.append(meal)
+    return MealPlan(meals)
+
+
+def parse(content, max_meals=3):
+    """Parse an LLM response (JSON or HTML) into a MealPlan, or None if nothing usable was found"""
+    if not content:
+        return None
+    stripped = content.strip()
+    if stripped.startswith('{') or stripped.startswith('```json'):
+        return parse_json(stripped)
+    return parse_html(content, max_meals)
+
+
+def parse_html(html_content, max_meals=3):
+    """Parse a legacy HTML response into a MealPlan, or None"""
+    if not html_content or any(marker in html_content for marker in _ERROR_MARKERS):
+        return None
+
+    sections = []
+    current = None
+    for match in _TOKENS.finditer(html_content):
+        group = match.lastgroup
+        if group is None:
+            # A new meal-section opens
+            if current is not None:
+                current.end = match.start()
+                if len(sections) == max_meals:
+                    current = None
+                    break
+            current = _Section(match.end())
+            sections.append(current)
+        elif current is None:
+            continue
+        elif group == 'title':
+            if current.title is None:
+                current.title = _text(match.group('title')).lower()
+        elif group == 'name':
+            # Prefer the <h4> dish name over an <h3> heading
+            level = match.group('level')
+            if current.name is None or (level == '4' and current.name_level == '3'):
+                current.name = _text(match.group('name'))
+                current.name_level = level
+        elif group == 'calories':
+            if current.calories is None:
+                found = _CALORIES.search(match.group('calories')) or _BARE_NUMBER.search(match.group('calories'))
+                if found:
+                    current.calories = int(found.group(1))
+        elif group == 'description':
+            if current.description is None:
+                current.description = _text(match.group('description'))
+        elif group == 'paragraph':
+            if current.paragraph is None:
+                text = _text(match.group('paragraph'))
+                if text and not _CALORIES.fullmatch(text):
+                    current.paragraph = text
+    if current is not None and current.end is None:
+        current.end = len(html_content)
+
+    meals = []
+    used_types = set()
+    for index, section in enumerate(sections[:max_meals]):
+        meal_type = section.title if section.title in MEAL_TYPES and section.title not in used_types else None
+        if meal_type is None:
+            meal_type = MEAL_TYPES[index] if index < len(MEAL_TYPES) else f'meal_{index + 1}'
+        used_types.add(meal_type)
+
+        calories = section.calories
+        if calories is None:
+            # Rare path: look anywhere in the section for a calorie-like number
+            body = html_content[section.start:section.end]
+            found = _CALORIES.search(body)
+            if found:
+                calories = int(found.group(1))
+            else:
+                candidates = [int(n) for n in _BARE_NUMBER.findall(body) if 100 <= int(n) <= 800]
+                calories = candidates[0] if candidates else 300
+
+        meals.append(Meal(
+            meal_type,
+            section.name or f'Traditional {meal_type.title()}',
+            calories,
+            section.description or section.paragraph
+            or f'Authentic {meal_type} dish with traditional ingredients and regional flavors'
+        ))
+
+    return MealPlan(meals) if meals else None
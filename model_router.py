@@ -0,0 +1,326 @@
+"""Latency-aware model routing and hedged OpenRouter calls.
+
+LLM_MODELS lists the models meal generation may use. The router keeps an
+EWMA and a window of recent latencies per model and response schema (a
+multi-day plan is slower than a single replacement meal) and sends each
+request to the currently fastest model. If that call has not produced a
+usable response after its model's p95 latency, a hedge request goes to the
+next model; the first response that passes validation wins and the other
+attempt is cancelled. Only the slow tail is hedged, so average cost barely
+moves while the worst waits are cut to roughly p95 plus the hedge's own
+latency.
+
+Sync hedged attempts stream internally even when nobody listens for tokens:
+that is the only way to drop a blocking call early, by closing its stream
+between chunks. Progress tokens are forwarded from whichever attempt starts
+streaming first.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import metrics
+from llm_client import LLM_MAX_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+LLM_MODELS = [m.strip() for m in os.getenv('LLM_MODELS', 'deepseek/deepseek-chat').split(',') if m.strip()]
+LLM_HEDGE = os.getenv('LLM_HEDGE', '1') == '1'
+# Extra attempts per request, each on the next model in latency order
+LLM_HEDGES = int(os.getenv('LLM_HEDGES', '1'))
+# Hedge delay until a model has LLM_HEDGE_MIN_SAMPLES latencies to take a p95 from
+LLM_HEDGE_DELAY = float(os.getenv('LLM_HEDGE_DELAY', '10'))
+LLM_HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', '1'))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20'))
+LLM_EWMA_ALPHA = float(os.getenv('LLM_EWMA_ALPHA', '0.2'))
+LLM_LATENCY_WINDOW = int(os.getenv('LLM_LATENCY_WINDOW', '200'))
+# Added to a failed attempt's latency so failing models sink in the ranking
+LLM_FAILURE_PENALTY = float(os.getenv('LLM_FAILURE_PENALTY', '10'))
+
+HEDGE_RESULTS = metrics.counter(
+    'llm_hedge_total', 'Routed OpenRouter requests by outcome: unhedged (first attempt answered before '
+    'the hedge delay), primary or hedge (which attempt won after hedging) or failed', ['result'])
+
+
+class HedgeCancelled(Exception):
+    """Raised inside an attempt that lost to another one"""
+
+
+class ModelStats:
+    """EWMA and recent-latency window for one model and request kind"""
+
+    def __init__(self, alpha=LLM_EWMA_ALPHA, window=LLM_LATENCY_WINDOW):
+        self.alpha = alpha
+        self.ewma = None
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency, failed=False):
+        with self._lock:
+            if failed:
+                latency += LLM_FAILURE_PENALTY
+            else:
+                self.latencies.append(latency)
+            self.ewma = latency if self.ewma is None else self.alpha * latency + (1 - self.alpha) * self.ewma
+
+    def p95(self):
+        """95th percentile of recent successful latencies, or None with too few samples"""
+        with self._lock:
+            if len(self.latencies) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+def request_kind(request_args):
+    """What a request asks for (its JSON schema name, or 'text'); latencies are tracked per kind"""
+    response_format = request_args.get('response_format') or {}
+    return (response_format.get('json_schema') or {}).get('name', 'text')
+
+
+class ModelRouter:
+    """Sends chat completions to the fastest model and hedges slow ones on the next"""
+
+    def __init__(self, models=LLM_MODELS, hedge=LLM_HEDGE, hedges=LLM_HEDGES, default_delay=LLM_HEDGE_DELAY,
+                 min_delay=LLM_HEDGE_MIN_DELAY):
+        self.models = list(models)
+        self.hedges = max(0, hedges) if hedge else 0
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def stats(self, model, kind):
+        with self._lock:
+            stats = self._stats.get((model, kind))
+            if stats is None:
+                stats = self._stats[(model, kind)] = ModelStats()
+            return stats
+
+    def ewmas(self):
+        """{(model, kind): EWMA seconds} for the metrics endpoint"""
+        with self._lock:
+            return {key: stats.ewma for key, stats in self._stats.items() if stats.ewma is not None}
+
+    def ranked(self, kind):
+        """Models to try for a request kind, fastest EWMA first; unmeasured ones keep their listed order"""
+        order = {model: i for i, model in enumerate(self.models)}
+        ewmas = {model: self.stats(model, kind).ewma for model in self.models}
+        return sorted(self.models, key=lambda m: (ewmas[m] is None, ewmas[m] or 0, order[m]))
+
+    def hedge_delay(self, model, kind):
+        p95 = self.stats(model, kind).p95()
+        return max(self.min_delay, p95 if p95 is not None else self.default_delay)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Created lazily so a gunicorn master never forks with live threads
+                self._executor = ThreadPoolExecutor(max_workers=2 * LLM_MAX_CONCURRENCY,
+                                                    thread_name_prefix='llm-hedge')
+            return self._executor
+
+    def _record(self, model, kind, started, failed=False):
+        self.stats(model, kind).record(time.perf_counter() - started, failed)
+
+    @staticmethod
+    def _token_gate(on_token):
+        """Per-attempt on_token wrappers that only forward the first attempt to stream"""
+        if on_token is None:
+            return lambda model: None
+        owner = []
+        lock = threading.Lock()
+
+        def attempt_callback(model):
+            def push(text):
+                with lock:
+                    if not owner:
+                        owner.append(model)
+                if owner[0] == model:
+                    on_token(text)
+            return push
+
+        return attempt_callback
+
+    def _call(self, client, model, kind, request_args, on_token, cancelled=None):
+        """One attempt on one model; returns (text, usage)"""
+        args = dict(request_args, model=model)
+        started = time.perf_counter()
+        try:
+            if on_token is None and cancelled is None:
+                response = client.create_chat_completion(**args)
+                text, usage = response.choices[0].message.content, response.usage
+            else:
+                parts = []
+                usage = None
+                stream = client.create_chat_completion(stream=True, stream_options={"include_usage": True}, **args)
+                try:
+                    for chunk in stream:
+                        if cancelled is not None and cancelled.is_set():
+                            raise HedgeCancelled(model)
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            parts.append(chunk.choices[0].delta.content)
+                            if on_token is not None:
+                                on_token(chunk.choices[0].delta.content)
+                        if getattr(chunk, 'usage', None):
+                            usage = chunk.usage
+                finally:
+                    # Closing the connection is what stops a losing attempt upstream
+                    stream.close()
+                text = ''.join(parts)
+        except HedgeCancelled:
+            # A lower bound, but dropping it would hide exactly the slow tail the p95 should see
+            self._record(model, kind, started)
+            raise
+        except Exception:
+            self._record(model, kind, started, failed=True)
+            raise
+        self._record(model, kind, started)
+        return text, usage
+
+    def complete(self, client, request_args, validate=None, on_token=None):
+        """Return (text, usage) from the first attempt whose text passes validate.
+
+        Streams to on_token if given. If every attempt fails validation the
+        first invalid text is returned; if every attempt raises, the first
+        error is raised.
+        """
+        kind = request_kind(request_args)
+        models = self.ranked(kind)[:1 + self.hedges]
+        if len(models) == 1:
+            return self._call(client, models[0], kind, request_args, on_token)
+
+        executor = self._get_executor()
+        cancelled = threading.Event()
+        gate = self._token_gate(on_token)
+        attempts = {}
+
+        def launch(model):
+            future = executor.submit(self._call, client, model, kind, request_args, gate(model), cancelled)
+            attempts[future] = model
+            return time.monotonic() + self.hedge_delay(model, kind)
+
+        waiting = list(models)
+        hedge_at = launch(waiting.pop(0))
+        pending = set(attempts)
+        first_error = invalid = None
+        while pending or waiting:
+            timeout = max(0.0, hedge_at - time.monotonic()) if waiting else None
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    text, usage = future.result()
+                except Exception as e:
+                    first_error = first_error or e
+                    continue
+                if validate is None or validate(text):
+                    cancelled.set()
+                    self._count(attempts, future)
+                    return text, usage
+                logger.warning("Response from %s failed validation", attempts[future])
+                invalid = invalid or (text, usage)
+            # Hedge when the delay ran out, or at once if the last attempt already failed
+            if waiting and (not done or not pending):
+                model = waiting.pop(0)
+                logger.info("Hedging %s request on %s", kind, model)
+                hedge_at = launch(model)
+                pending = {future for future in attempts if not future.done()}
+        HEDGE_RESULTS.labels('failed').inc()
+        if invalid is not None:
+            return invalid
+        raise first_error
+
+    def _count(self, attempts, winner):
+        if len(attempts) == 1:
+            HEDGE_RESULTS.labels('unhedged').inc()
+        else:
+            HEDGE_RESULTS.labels('primary' if winner is next(iter(attempts)) else 'hedge').inc()
+
+    async def _call_async(self, client, model, kind, request_args, on_token):
+        args = dict(request_args, model=model)
+        started = time.perf_counter()
+        try:
+            if on_token is None:
+                response = await client.create_chat_completion(**args)
+                text, usage = response.choices[0].message.content, response.usage
+            else:
+                parts = []
+                usage = None
+                stream = await client.create_chat_completion(stream=True, stream_options={"include_usage": True},
+                                                             **args)
+                try:
+                    async for chunk in stream:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            parts.append(chunk.choices[0].delta.content)
+                            on_token(chunk.choices[0].delta.content)
+                        if getattr(chunk, 'usage', None):
+                            usage = chunk.usage
+                finally:
+                    await stream.close()
+                text = ''.join(parts)
+        except asyncio.CancelledError:
+            self._record(model, kind, started)
+            raise
+        except Exception:
+            self._record(model, kind, started, failed=True)
+            raise
+        self._record(model, kind, started)
+        return text, usage
+
+    async def complete_async(self, client, request_args, validate=None, on_token=None):
+        """complete() on an AsyncLLMClient; losing attempts are cancelled outright"""
+        kind = request_kind(request_args)
+        models = self.ranked(kind)[:1 + self.hedges]
+        if len(models) == 1:
+            return await self._call_async(client, models[0], kind, request_args, on_token)
+
+        gate = self._token_gate(on_token)
+        attempts = {}
+
+        def launch(model):
+            task = asyncio.ensure_future(self._call_async(client, model, kind, request_args, gate(model)))
+            attempts[task] = model
+            return time.monotonic() + self.hedge_delay(model, kind)
+
+        waiting = list(models)
+        hedge_at = launch(waiting.pop(0))
+        pending = set(attempts)
+        first_error = invalid = None
+        try:
+            while pending or waiting:
+                timeout = max(0.0, hedge_at - time.monotonic()) if waiting else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        text, usage = task.result()
+                    except Exception as e:
+                        first_error = first_error or e
+                        continue
+                    if validate is None or validate(text):
+                        self._count(attempts, task)
+                        return text, usage
+                    logger.warning("Response from %s failed validation", attempts[task])
+                    invalid = invalid or (text, usage)
+                if waiting and (not done or not pending):
+                    model = waiting.pop(0)
+                    logger.info("Hedging %s request on %s", kind, model)
+                    hedge_at = launch(model)
+                    pending = {task for task in attempts if not task.done()}
+        finally:
+            # The winner has returned (or the caller was cancelled): stop everything else
+            for task in attempts:
+                task.cancel()
+        HEDGE_RESULTS.labels('failed').inc()
+        if invalid is not None:
+            return invalid
+        raise first_error
+
+
+def create_model_router():
+    """The process-wide router over LLM_MODELS"""
+    return ModelRouter()
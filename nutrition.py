@@ -0,0 +1,174 @@
+"""Offline nutrition data for Indian regional dishes and a meal planner on top of it.
+
+data/indian_dishes.json lists dishes per state (plus '*' for dishes eaten
+all over India) with approximate calories per home serving, diet type and
+the meal slots they suit. NutritionDB indexes them by (state, diet, meal
+type) when it loads, so planning a day is a few dict lookups and a scan of a
+dozen candidates: no network, well under a millisecond.
+
+plan() picks breakfast, lunch and dinner for the same 25/40/35 calorie split
+the LLM prompt asks for, scaling each dish to the nearest half serving and
+skipping dishes the user had recently. check_calories() compares the
+calories an LLM reported for a dish it knows against the reference serving.
+"""
+import json
+import logging
+import os
+import random
+
+from dish_index import DishIndex
+from meal_parser import Meal, MealPlan, MEAL_TYPES
+
+logger = logging.getLogger(__name__)
+
+NUTRITION_DATA_PATH = os.getenv('NUTRITION_DATA_PATH', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'data', 'indian_dishes.json'))
+# How far a planned meal may be from its share of the daily calories
+PLANNER_TOLERANCE = float(os.getenv('PLANNER_TOLERANCE', '0.15'))
+
+MEAL_SPLIT = {'breakfast': 0.25, 'lunch': 0.40, 'dinner': 0.35}
+MIN_SERVINGS = 0.5
+MAX_SERVINGS = 3.0
+PAN_INDIAN = '*'
+SLOTS = {'b': 'breakfast', 'l': 'lunch', 'd': 'dinner'}
+PREFERENCE_DIETS = {
+    'vegetarian': ('veg',),
+    'eggetarian': ('veg', 'egg'),
+    'non-vegetarian': ('veg', 'egg', 'nonveg'),
+    'mixed': ('veg', 'egg', 'nonveg')
+}
+
+
+class Dish:
+    """One dish from the dataset"""
+
+    __slots__ = ('name', 'calories', 'diet', 'meal_types', 'description')
+
+    def __init__(self, name, calories, diet, slots, description):
+        self.name = name
+        self.calories = calories
+        self.diet = diet
+        self.meal_types = tuple(SLOTS[slot] for slot in slots)
+        self.description = description
+
+    def __repr__(self):
+        return f"Dish({self.name!r}, {self.calories})"
+
+
+def servings_for(dish_calories, target):
+    """Half-serving count closest to target calories, within MIN_SERVINGS..MAX_SERVINGS"""
+    return min(MAX_SERVINGS, max(MIN_SERVINGS, round(target / dish_calories * 2) / 2))
+
+
+class NutritionDB:
+    """Dishes indexed by (state, diet, meal type), plus a fuzzy name lookup"""
+
+    def __init__(self, states):
+        self._index = {}
+        self._by_name = {}
+        self._names = DishIndex()
+        self._states = {}
+        for state, dishes in states.items():
+            self._states[state.lower()] = state
+            for dish in dishes:
+                for meal_type in dish.meal_types:
+                    self._index.setdefault((state, dish.diet, meal_type), []).append(dish)
+                self._by_name.setdefault(dish.name, dish)
+                self._names.add(dish.name)
+
+    @classmethod
+    def load(cls, path=NUTRITION_DATA_PATH):
+        with open(path) as f:
+            data = json.load(f)
+        # Rows are positional, in the order data['fields'] lists them
+        return cls({
+            state: [Dish(*row) for row in rows]
+            for state, rows in data['states'].items()
+        })
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def candidates(self, state, food_preference, meal_type):
+        """(regional, pan-Indian) dishes for a meal slot that fit the diet"""
+        state = self._states.get((state or '').lower())
+        diets = PREFERENCE_DIETS.get(food_preference, PREFERENCE_DIETS['mixed'])
+        regional = [dish for diet in diets for dish in self._index.get((state, diet, meal_type), ())]
+        pan_indian = [dish for diet in diets for dish in self._index.get((PAN_INDIAN, diet, meal_type), ())]
+        return regional, pan_indian
+
+    def lookup(self, name):
+        """The dataset dish a (possibly misspelled) dish name refers to, or None"""
+        dish = self._by_name.get(name)
+        if dish is None:
+            match = self._names.match(name)
+            dish = self._by_name.get(match) if match else None
+        return dish
+
+    def plan(self, state, calorie_limit, food_preference, previous_meals=None, rng=random):
+        """A MealPlan on the 25/40/35 split that avoids previous_meals, or None.
+
+        Regional dishes within PLANNER_TOLERANCE of their share come first,
+        then pan-Indian ones; failing both, the closest dish is used, and a
+        recent dish only if nothing else is left.
+        """
+        recent = DishIndex(previous_meals or ())
+        meals = []
+        for meal_type in MEAL_TYPES:
+            target = calorie_limit * MEAL_SPLIT[meal_type]
+            regional, pan_indian = self.candidates(state, food_preference, meal_type)
+            scored = []
+            for group, dishes in enumerate((regional, pan_indian)):
+                for dish in dishes:
+                    servings = servings_for(dish.calories, target)
+                    error = abs(servings * dish.calories - target) / target
+                    scored.append((recent.match(dish.name) is not None, error > PLANNER_TOLERANCE, group,
+                                   error, dish, servings))
+            if not scored:
+                return None
+            # Lower sorts first: not recent, within tolerance, regional
+            best = min(entry[:3] for entry in scored)
+            if best[1]:
+                # Nothing fits: the closest dish, wherever it is from
+                choice = min((entry for entry in scored if entry[0] == best[0]), key=lambda entry: entry[3])
+            else:
+                # Any dish in the best tier will do; picking at random keeps repeat visits varied
+                choice = rng.choice([entry for entry in scored if entry[:3] == best])
+            dish, servings = choice[4], choice[5]
+            recent.add(dish.name)
+            portion = f"{servings:g} serving{'s' if servings != 1 else ''}"
+            meals.append(Meal(meal_type, dish.name, int(round(servings * dish.calories)),
+                              f"{dish.description} Portion: {portion}."))
+        return MealPlan(meals)
+
+    def check_calories(self, meal_plan):
+        """Check {meal_type: meal} calories against reference servings, fixing implausible ones.
+
+        Returns {meal_type: 'ok' | 'corrected' | 'unknown'}; a meal whose
+        calories imply fewer than MIN_SERVINGS or more than MAX_SERVINGS of
+        a known dish gets the calories of the nearest allowed portion.
+        """
+        results = {}
+        for meal_type, meal in meal_plan.items():
+            dish = self.lookup(meal['name'])
+            if dish is None:
+                results[meal_type] = 'unknown'
+                continue
+            if MIN_SERVINGS <= meal['calories'] / dish.calories <= MAX_SERVINGS:
+                results[meal_type] = 'ok'
+                continue
+            corrected = int(round(servings_for(dish.calories, meal['calories']) * dish.calories))
+            logger.debug("%s: %s reported at %d kcal, %d kcal per serving; using %d",
+                         meal_type, meal['name'], meal['calories'], dish.calories, corrected)
+            meal['calories'] = corrected
+            results[meal_type] = 'corrected'
+        return results
+
+
+def create_nutrition_db():
+    """The bundled dish database, or None if the data file is missing or unreadable"""
+    try:
+        return NutritionDB.load()
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning("Nutrition data unavailable (%s): no offline meal plans or calorie checks", e)
+        return None
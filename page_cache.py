@@ -0,0 +1,122 @@
+"""Rendered-page cache for the pages that only vary by login state.
+
+The landing, about and breathe templates depend on nothing but
+session.username (the nav bar), so PageCache.render keeps the rendered body
+per (template, username) together with a strong ETag and gzip/brotli
+copies. A repeat visit is a dict lookup; a revalidation with a matching
+If-None-Match is a bodiless 304. Entries are dropped when Jinja reports the
+template file changed (checked at most every PAGE_CACHE_CHECK_INTERVAL
+seconds), so a deploy that edits a template needs no manual flush.
+"""
+import gzip
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, render_template, request, session
+
+import metrics
+
+try:
+    import brotli
+except ImportError:  # Optional: only gzip bodies are kept without it
+    brotli = None
+
+PAGE_CACHE_ENABLED = os.getenv('PAGE_CACHE_ENABLED', '1') == '1'
+PAGE_CACHE_SIZE = int(os.getenv('PAGE_CACHE_SIZE', '256'))
+PAGE_CACHE_CHECK_INTERVAL = float(os.getenv('PAGE_CACHE_CHECK_INTERVAL', '2'))
+PAGE_CACHE_MIN_COMPRESS = 1024
+
+PAGE_CACHE_LOOKUPS = metrics.counter('page_cache_total', 'Cached page lookups by result', ['result'])
+
+
+class CachedPage:
+    """One rendered body, its encodings and the check that it is still current"""
+
+    def __init__(self, body, uptodate):
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.bodies = {None: body}
+        if len(body) > PAGE_CACHE_MIN_COMPRESS:
+            self.bodies['gzip'] = gzip.compress(body, 6, mtime=0)
+            if brotli is not None:
+                self.bodies['br'] = brotli.compress(body, quality=11)
+        self.uptodate = uptodate
+        self.checked_at = time.monotonic()
+
+    def tag(self, encoding):
+        # Strong ETags are per representation, so encoded bodies get their own
+        return f'{self.etag}-{encoding}' if encoding else self.etag
+
+    def is_current(self, interval):
+        now = time.monotonic()
+        if now - self.checked_at < interval:
+            return True
+        self.checked_at = now
+        return self.uptodate is None or self.uptodate()
+
+
+class PageCache:
+    """LRU of rendered pages keyed by template and logged-in username"""
+
+    def __init__(self, app, size=PAGE_CACHE_SIZE, check_interval=PAGE_CACHE_CHECK_INTERVAL):
+        self.app = app
+        self.size = size
+        self.check_interval = check_interval
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is None:
+                return None
+            if not page.is_current(self.check_interval):
+                self._pages.clear()
+                # Jinja keeps compiled templates unless auto_reload is on
+                if self.app.jinja_env.cache is not None:
+                    self.app.jinja_env.cache.clear()
+                return None
+            self._pages.move_to_end(key)
+            return page
+
+    def _put(self, key, page):
+        with self._lock:
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.size:
+                self._pages.popitem(last=False)
+
+    def _render(self, template_name):
+        body = render_template(template_name).encode('utf-8')
+        env = self.app.jinja_env
+        _, _, uptodate = env.loader.get_source(env, template_name)
+        return CachedPage(body, uptodate)
+
+    def render(self, template_name):
+        """Response for a template whose output depends only on session.username"""
+        if not PAGE_CACHE_ENABLED:
+            return render_template(template_name)
+        username = session.get('username')
+        key = (template_name, username)
+        page = self._get(key)
+        if page is None:
+            PAGE_CACHE_LOOKUPS.labels('miss').inc()
+            page = self._render(template_name)
+            self._put(key, page)
+
+        encoding = next((e for e in ('br', 'gzip') if e in page.bodies and request.accept_encodings[e]), None)
+        if any(request.if_none_match.contains_weak(page.tag(e)) for e in page.bodies):
+            PAGE_CACHE_LOOKUPS.labels('not_modified').inc()
+            response = Response(status=304)
+        else:
+            PAGE_CACHE_LOOKUPS.labels('hit').inc()
+            response = Response(page.bodies[encoding], content_type='text/html; charset=utf-8')
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(page.tag(encoding))
+        response.vary.add('Accept-Encoding')
+        # Browsers may keep the page but must revalidate; logged-in copies stay out of shared caches
+        response.headers['Cache-Control'] = 'private, no-cache' if username else 'no-cache'
+        return response
@@ -0,0 +1,208 @@
+"""Precomputed meal plans for common (state, city, calories, diet) inputs.
+
+`flask precompute-plans` sweeps a grid of prompt inputs with a bounded
+worker pool, validates each generated plan and stores it in a SQLite lookup
+table. Each worker process loads that table into a dict, so the calculator
+can answer the common cases with a single lookup and only calls the LLM for
+rare combinations.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dish_index import as_index
+from meal_cache import make_key, MEAL_CACHE_BUCKET
+from storage import open_sqlite
+
+logger = logging.getLogger(__name__)
+
+PRECOMPUTED_DB_PATH = os.getenv('PRECOMPUTED_DB_PATH', 'meal_cache.db')
+PRECOMPUTED_REFRESH = float(os.getenv('PRECOMPUTED_REFRESH', '60'))
+# Serve a state-level plan when no plan exists for the user's city
+PRECOMPUTED_STATE_FALLBACK = os.getenv('PRECOMPUTED_STATE_FALLBACK', '1') == '1'
+
+DEFAULT_STATES = [
+    'Andhra Pradesh', 'Arunachal Pradesh', 'Assam', 'Bihar', 'Chhattisgarh', 'Goa', 'Gujarat',
+    'Haryana', 'Himachal Pradesh', 'Jharkhand', 'Karnataka', 'Kerala', 'Madhya Pradesh',
+    'Maharashtra', 'Manipur', 'Meghalaya', 'Mizoram', 'Nagaland', 'Odisha', 'Punjab', 'Rajasthan',
+    'Sikkim', 'Tamil Nadu', 'Telangana', 'Tripura', 'Uttar Pradesh', 'Uttarakhand', 'West Bengal',
+    'Delhi'
+]
+DEFAULT_PREFERENCES = ['vegetarian', 'non-vegetarian', 'eggetarian', 'mixed']
+
+
+def validate_plan(meal_plan, calorie_limit, tolerance=0.25):
+    """True if the plan has all three meals and roughly the right total"""
+    if not meal_plan or set(meal_plan) != {'breakfast', 'lunch', 'dinner'}:
+        return False
+    total = sum(meal['calories'] for meal in meal_plan.values())
+    return abs(total - calorie_limit) <= calorie_limit * tolerance
+
+
+class PrecomputedPlans:
+    """SQLite-backed lookup table mirrored into an in-process dict"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS precomputed_meal_plans (
+            cache_key TEXT NOT NULL,
+            variant INTEGER NOT NULL,
+            dishes TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (cache_key, variant)
+        );
+    """
+
+    def __init__(self, path=PRECOMPUTED_DB_PATH, refresh=PRECOMPUTED_REFRESH):
+        self.path = path
+        self.refresh = refresh
+        self._plans = {}
+        self._loaded_at = 0.0
+        self._signature = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._conn().executescript(self.SCHEMA)
+        self.hits = 0
+        self.misses = 0
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = open_sqlite(self.path)
+        return conn
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if self._signature is not None and now - self._loaded_at < self.refresh:
+            return
+        with self._lock:
+            if self._signature is not None and now - self._loaded_at < self.refresh:
+                return
+            conn = self._conn()
+            signature = conn.execute(
+                'SELECT COUNT(*), MAX(created_at) FROM precomputed_meal_plans').fetchone()
+            if signature != self._signature:
+                plans = {}
+                for key, dishes, content in conn.execute(
+                        'SELECT cache_key, dishes, content FROM precomputed_meal_plans '
+                        'ORDER BY cache_key, variant'):
+                    plans.setdefault(tuple(json.loads(key)), []).append((json.loads(dishes), content))
+                self._plans = plans
+                self._signature = signature
+            self._loaded_at = now
+
+    def __len__(self):
+        self._maybe_reload()
+        return len(self._plans)
+
+    def get(self, key, previous_meals=None):
+        """Return a precomputed response for key that avoids previous_meals (dish names or a DishIndex)"""
+        self._maybe_reload()
+        variants = self._plans.get(key)
+        if variants is None and PRECOMPUTED_STATE_FALLBACK and key[1]:
+            variants = self._plans.get((key[0], '') + key[2:])
+        recent = as_index(previous_meals)
+        for dishes, content in variants or ():
+            if not recent.match_any(dishes):
+                self.hits += 1
+                return content
+        self.misses += 1
+        return None
+
+    def variants(self, key):
+        self._maybe_reload()
+        return self._plans.get(key, [])
+
+    def put(self, key, variant, content, dishes):
+        self._conn().execute(
+            'INSERT OR REPLACE INTO precomputed_meal_plans (cache_key, variant, dishes, content, created_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (json.dumps(list(key), separators=(',', ':')), variant, json.dumps(list(dishes)),
+             content, time.time()))
+        # Make our own writes visible without waiting for the refresh interval
+        with self._lock:
+            plans = self._plans.setdefault(key, [])
+            if variant < len(plans):
+                plans[variant] = (list(dishes), content)
+            elif variant == len(plans):
+                plans.append((list(dishes), content))
+            else:
+                # Slots in between are not loaded here: reread the table so list positions match variants
+                self._signature = None
+                self._loaded_at = 0.0
+
+
+def build_grid(states, cities, min_calories, max_calories, preferences, bucket=MEAL_CACHE_BUCKET):
+    """Every (state, city, calories, preference) combination to precompute.
+
+    cities maps a state to the list of cities to sweep ('' is state-level).
+    """
+    step = max(bucket, 1)
+    grid = []
+    for state in states:
+        for city in cities.get(state, ['']):
+            for calories in range(min_calories, max_calories + 1, step):
+                for preference in preferences:
+                    grid.append((state, city, calories, preference))
+    return grid
+
+
+def grid_from_profiles(users, top, bucket=MEAL_CACHE_BUCKET):
+    """The most common (state, city, calorie bucket, preference) among user profiles"""
+    combos = Counter()
+    for user in users.values():
+        profile = user.get('profile') or {}
+        latest_bmr = user.get('latest_bmr')
+        if not profile.get('state') or not latest_bmr:
+            continue
+        key = make_key(profile['state'], profile.get('city'), latest_bmr['goal_calories'],
+                       profile.get('food_preference'), bucket)
+        combos[(profile['state'], (profile.get('city') or '').strip(), key[2],
+                profile.get('food_preference') or 'mixed')] += 1
+    return [combo for combo, count in combos.most_common(top)]
+
+
+def run_precompute(table, grid, generate, parse, variants=1, workers=4, bucket=MEAL_CACHE_BUCKET):
+    """Generate and store plans for every grid entry on a bounded pool.
+
+    generate(state, city, calories, preference, previous_meals) returns the
+    raw LLM response and parse turns it into a meal plan dict.
+    """
+    stats = Counter()
+    stats_lock = threading.Lock()
+
+    def count(name):
+        with stats_lock:
+            stats[name] += 1
+
+    def work(state, city, calories, preference):
+        key = make_key(state, city, calories, preference, bucket)
+        existing = table.variants(key)
+        previous = [dish for dishes, content in existing for dish in dishes]
+        # One attempt per missing variant; a rejected attempt does not use up a slot
+        variant = len(existing)
+        for _ in range(len(existing), variants):
+            response = generate(state, city, key[2], preference, previous)
+            meal_plan = parse(response)
+            if not validate_plan(meal_plan, key[2]):
+                count('rejected')
+                continue
+            dishes = [meal['name'] for meal in meal_plan.values()]
+            table.put(key, variant, response, dishes)
+            variant += 1
+            previous.extend(dishes)
+            count('stored')
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(work, *entry) for entry in grid]
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                count('failed')
+                logger.error("Precompute task failed: %s", e)
+    return dict(stats)
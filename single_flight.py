@@ -0,0 +1,173 @@
+"""Coalescing of identical concurrent meal-plan LLM calls.
+
+When several requests need a plan for the same cache key at the same time
+only the first (the leader) calls OpenRouter; the rest wait for its result.
+Within a process the waiters share a Future. Across gunicorn workers the
+leader holds an flock on a per-key file in SINGLE_FLIGHT_LOCK_DIR; a worker
+that finds the lock taken waits for it to be released and then reads the
+plan the other worker put in the shared meal cache, only calling OpenRouter
+itself if nothing usable is there.
+
+SINGLE_FLIGHT_VARIANTS > 1 spreads users over that many slots per key
+(by username), so a burst of identical requests still produces a few
+different plans instead of one.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows: coalesce within the process only
+    fcntl = None
+
+SINGLE_FLIGHT_ENABLED = os.getenv('SINGLE_FLIGHT_ENABLED', '1') == '1'
+SINGLE_FLIGHT_VARIANTS = max(1, int(os.getenv('SINGLE_FLIGHT_VARIANTS', '1')))
+SINGLE_FLIGHT_LOCK_DIR = os.getenv('SINGLE_FLIGHT_LOCK_DIR',
+                                   os.path.join(tempfile.gettempdir(), 'wellora-single-flight'))
+SINGLE_FLIGHT_WAIT = float(os.getenv('SINGLE_FLIGHT_WAIT', '90'))
+SINGLE_FLIGHT_POLL = 0.05
+
+SINGLE_FLIGHT_CALLS = metrics.counter(
+    'llm_single_flight_total',
+    'Meal plan generations by how they were served: leader (called OpenRouter), shared (waited on a '
+    'call in this process) or cross_worker (read another worker\'s result)', ['result'])
+
+
+def variant_slot(username, variants=SINGLE_FLIGHT_VARIANTS):
+    """Stable per-user slot so users spread over a fixed number of plans per key"""
+    if variants <= 1 or not username:
+        return 0
+    return zlib.crc32(username.encode('utf-8')) % variants
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time and hands its result to every waiter"""
+
+    def __init__(self, lock_dir=SINGLE_FLIGHT_LOCK_DIR, wait=SINGLE_FLIGHT_WAIT):
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.wait = wait
+        self._calls = {}
+        self._lock = threading.Lock()
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    def _claim(self, key):
+        """(future, True) for the leader, (future of the running call, False) for waiters"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _settle(self, key, future, result=None, error=None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _try_worker_lock(self, key):
+        path = os.path.join(self.lock_dir, hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.lock')
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except BlockingIOError:
+            os.close(fd)
+            return None
+
+    def _release_worker_lock(self, fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    def do(self, key, call, shared_result=None):
+        """Return (result, shared): call() once per key across threads and workers.
+
+        shared_result() is tried after waiting for another worker's lock
+        and should return what that worker produced, or None.
+        """
+        future, leader = self._claim(key)
+        if not leader:
+            SINGLE_FLIGHT_CALLS.labels('shared').inc()
+            return future.result(self.wait), True
+        try:
+            result, shared = self._lead(key, call, shared_result)
+        except BaseException as e:
+            # Includes cancellation, so waiters are never left hanging
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, result)
+        return result, shared
+
+    def _lead(self, key, call, shared_result):
+        fd = self._try_worker_lock(key) if self.lock_dir else None
+        waited = False
+        deadline = time.monotonic() + self.wait
+        while self.lock_dir and fd is None and time.monotonic() < deadline:
+            waited = True
+            time.sleep(SINGLE_FLIGHT_POLL)
+            fd = self._try_worker_lock(key)
+        try:
+            if waited and shared_result is not None:
+                result = shared_result()
+                if result is not None:
+                    SINGLE_FLIGHT_CALLS.labels('cross_worker').inc()
+                    return result, True
+            SINGLE_FLIGHT_CALLS.labels('leader').inc()
+            return call(), False
+        finally:
+            if fd is not None:
+                self._release_worker_lock(fd)
+
+    async def do_async(self, key, call, shared_result=None):
+        """do() for coroutines: call() and shared_result() return awaitables"""
+        future, leader = self._claim(key)
+        if not leader:
+            SINGLE_FLIGHT_CALLS.labels('shared').inc()
+            # shield: a waiter timing out must not cancel the leader's future
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.wait), True
+        try:
+            result, shared = await self._lead_async(key, call, shared_result)
+        except BaseException as e:
+            # Includes cancellation, so waiters are never left hanging
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, result)
+        return result, shared
+
+    async def _lead_async(self, key, call, shared_result):
+        fd = self._try_worker_lock(key) if self.lock_dir else None
+        waited = False
+        deadline = time.monotonic() + self.wait
+        while self.lock_dir and fd is None and time.monotonic() < deadline:
+            waited = True
+            await asyncio.sleep(SINGLE_FLIGHT_POLL)
+            fd = self._try_worker_lock(key)
+        try:
+            if waited and shared_result is not None:
+                result = await shared_result()
+                if result is not None:
+                    SINGLE_FLIGHT_CALLS.labels('cross_worker').inc()
+                    return result, True
+            SINGLE_FLIGHT_CALLS.labels('leader').inc()
+            return await call(), False
+        finally:
+            if fd is not None:
+                self._release_worker_lock(fd)
+
+
+def create_single_flight():
+    """The process-wide coalescer, or None when SINGLE_FLIGHT_ENABLED=0"""
+    if not SINGLE_FLIGHT_ENABLED:
+        return None
+    return SingleFlight()
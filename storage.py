@@ -0,0 +1,653 @@
+"""User storage backends.
+
+All user state goes through a UserStore. The SQLite backend keeps one row per
+user (WAL mode) so reads and writes touch a single record instead of the
+whole data set, plus a user_keys table of normalized lookup keys (username,
+email) that every write keeps in step with the record. The JSON backend
+keeps the old whole-file behaviour for local development and is the source
+for migration.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+from datetime import datetime
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+USER_DATA_FILE = os.getenv('USER_DATA_FILE', 'user_data.json')
+USER_DB_PATH = os.getenv('USER_DB_PATH', 'user_data.db')
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '1024'))
+
+STORE_LATENCY = metrics.histogram('user_store_duration_seconds',
+                                  'User store backend call latency', ['kind', 'operation'])
+
+
+def normalize_username(username):
+    return (username or '').strip().lower() or None
+
+
+def normalize_email(email):
+    return (email or '').strip().lower() or None
+
+
+# Secondary lookup keys: field -> normalizer. Values come from the user record
+# (the username from the primary key); add a field here to index it.
+INDEXED_FIELDS = {
+    'username': normalize_username,
+    'email': normalize_email
+}
+
+
+def index_keys(username, user):
+    """The set of (field, normalized value) lookup keys for one user"""
+    keys = set()
+    for field, normalize in INDEXED_FIELDS.items():
+        value = normalize(username if field == 'username' else user.get(field))
+        if value:
+            keys.add((field, value))
+    return keys
+
+
+def build_index(users):
+    """Index every user; return ({(field, value): username}, conflicts).
+
+    Usernames are visited in sorted order and the first owner of a key wins;
+    conflicts lists (field, value, owner, other) for the rest.
+    """
+    index = {}
+    conflicts = []
+    for username in sorted(users):
+        for key in index_keys(username, users[username]):
+            owner = index.setdefault(key, username)
+            if owner != username:
+                conflicts.append(key + (owner, username))
+    return index, conflicts
+
+
+def open_sqlite(path):
+    """Open an autocommit SQLite connection in WAL mode"""
+    # Autocommit mode; write transactions are opened explicitly
+    conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA busy_timeout=10000')
+    return conn
+
+
+class UserStore:
+    """Interface shared by every user storage backend"""
+
+    def get_user(self, username):
+        """Return the user record or None"""
+        raise NotImplementedError
+
+    def add_user(self, username, user):
+        """Insert a new user; return False if the username is taken"""
+        raise NotImplementedError
+
+    def put_user(self, username, user):
+        """Insert or replace a single user record"""
+        raise NotImplementedError
+
+    def put_users(self, users):
+        """Insert or replace many user records at once"""
+        for username, user in users.items():
+            self.put_user(username, user)
+
+    def update_user(self, username, mutate, create=False):
+        """Apply mutate(user) atomically and persist the result.
+
+        Returns whatever mutate returns, or None if the user does not exist
+        and create is False.
+        """
+        raise NotImplementedError
+
+    def find_user_by(self, field, value):
+        """Return the username whose normalized field matches value, or None"""
+        raise NotImplementedError
+
+    def find_user_by_email(self, email):
+        """Return the username registered with email, or None"""
+        return self.find_user_by('email', email)
+
+    def verify_indexes(self):
+        """Compare the lookup keys with the user records; return a list of problems"""
+        return [f"{field} {value!r} is claimed by both {owner} and {other}"
+                for field, value, owner, other in build_index(self.all_users())[1]]
+
+    def rebuild_indexes(self):
+        """Recompute the lookup keys from the user records; return the key count"""
+        return len(build_index(self.all_users())[0])
+
+    def all_users(self):
+        """Return every user as a {username: record} dict"""
+        raise NotImplementedError
+
+    def count_users(self):
+        return len(self.all_users())
+
+    def data_version(self):
+        """Cheap token that changes whenever any process writes the store"""
+        return None
+
+    def last_write_versions(self):
+        """(before, after) data versions around this thread's last write"""
+        return None, None
+
+    def user_version(self, username):
+        """Cheap token that changes whenever username's record is written"""
+        return self.data_version()
+
+    def last_write_version(self):
+        """user_version() of the record this thread last wrote, as of that write"""
+        return self.last_write_versions()[1]
+
+
+class JSONUserStore(UserStore):
+    """Whole-file JSON store (the original user_data.json format)"""
+
+    def __init__(self, path=USER_DATA_FILE):
+        self.path = path
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._index_cache = None
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"users": {}}
+        except json.JSONDecodeError:
+            return {"users": {}}
+
+    def _save(self, data):
+        before = self.data_version()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.path)
+        self._local.write_versions = (before, self.data_version())
+
+    def data_version(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def last_write_versions(self):
+        return getattr(self._local, 'write_versions', (None, None))
+
+    def _index(self, users=None):
+        """Lookup keys for the current file, rebuilt only when it changes"""
+        version = self.data_version()
+        cached = self._index_cache
+        if cached is None or cached[0] != version:
+            cached = self._index_cache = (version, build_index(
+                users if users is not None else self._load()['users'])[0])
+        return cached[1]
+
+    def get_user(self, username):
+        return self._load()['users'].get(username)
+
+    def add_user(self, username, user):
+        with self._lock:
+            data = self._load()
+            index = self._index(data['users'])
+            if username in data['users'] or any(key in index for key in index_keys(username, user)):
+                return False
+            data['users'][username] = user
+            self._save(data)
+            return True
+
+    def put_user(self, username, user):
+        with self._lock:
+            data = self._load()
+            data['users'][username] = user
+            self._save(data)
+
+    def put_users(self, users):
+        with self._lock:
+            data = self._load()
+            data['users'].update(users)
+            self._save(data)
+
+    def update_user(self, username, mutate, create=False):
+        with self._lock:
+            data = self._load()
+            if username not in data['users']:
+                if not create:
+                    return None
+                data['users'][username] = {}
+            result = mutate(data['users'][username])
+            self._save(data)
+            return result
+
+    def find_user_by(self, field, value):
+        value = INDEXED_FIELDS[field](value)
+        return self._index().get((field, value)) if value else None
+
+    def all_users(self):
+        return self._load()['users']
+
+    def rebuild_indexes(self):
+        self._index_cache = None
+        return len(self._index())
+
+
+class SQLiteUserStore(UserStore):
+    """One row per user in an embedded SQLite database (WAL mode)"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            email TEXT,
+            data TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS user_keys (
+            field TEXT NOT NULL,
+            value TEXT NOT NULL,
+            username TEXT NOT NULL,
+            PRIMARY KEY (field, value)
+        );
+        CREATE INDEX IF NOT EXISTS idx_user_keys_username ON user_keys(username);
+        DROP INDEX IF EXISTS idx_users_email;
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+    """
+
+    def __init__(self, path=USER_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        # Other modules share this database file, so check for our table rather than the file
+        tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.is_new = 'users' not in tables
+        conn.executescript(self.SCHEMA)
+        if not self.is_new and 'user_keys' not in tables:
+            # Database from before lookup keys existed
+            self.rebuild_indexes()
+
+    def _conn(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = open_sqlite(self.path)
+        return conn
+
+    @staticmethod
+    def _row(username, user):
+        return (username, user.get('email'), json.dumps(user, separators=(',', ':')),
+                datetime.now().isoformat())
+
+    @staticmethod
+    def _index_user(conn, username, user, strict=False, previous=None):
+        """Replace this user's lookup keys inside the current write transaction.
+
+        strict raises IntegrityError if a key belongs to someone else;
+        otherwise the existing owner keeps it (verify_indexes reports it).
+        """
+        keys = index_keys(username, user)
+        if previous is not None and keys == index_keys(username, previous):
+            return
+        conn.execute('DELETE FROM user_keys WHERE username = ?', (username,))
+        conn.executemany(
+            f"INSERT {'' if strict else 'OR IGNORE '}INTO user_keys (field, value, username) VALUES (?, ?, ?)",
+            [(field, value, username) for field, value in keys])
+
+    def _bump_version(self, conn):
+        """Increment the store version inside the current write transaction"""
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+        after = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+        self._local.write_versions = (after - 1, after)
+
+    @contextmanager
+    def _write(self):
+        """BEGIN IMMEDIATE ... COMMIT, bumping the store version.
+
+        BEGIN IMMEDIATE takes the write lock up front so concurrent
+        read-modify-write cycles from other workers cannot interleave.
+        """
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            self._bump_version(conn)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def data_version(self):
+        return self._conn().execute(
+            "SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def last_write_versions(self):
+        return getattr(self._local, 'write_versions', (None, None))
+
+    def user_version(self, username):
+        # Writes are serialized by BEGIN IMMEDIATE, so each one stamps a new updated_at
+        row = self._conn().execute(
+            'SELECT updated_at FROM users WHERE username = ?', (username,)).fetchone()
+        return row[0] if row else None
+
+    def last_write_version(self):
+        return getattr(self._local, 'written_at', None)
+
+    def _upsert(self, conn, username, user, sql=None):
+        row = self._row(username, user)
+        conn.execute(sql or self._UPSERT, row)
+        self._local.written_at = row[3]
+
+    def get_user(self, username):
+        row = self._conn().execute(
+            'SELECT data FROM users WHERE username = ?', (username,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add_user(self, username, user):
+        try:
+            with self._write() as conn:
+                self._upsert(conn, username, user,
+                             'INSERT INTO users (username, email, data, updated_at) VALUES (?, ?, ?, ?)')
+                self._index_user(conn, username, user, strict=True)
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    _UPSERT = """
+        INSERT INTO users (username, email, data, updated_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT(username) DO UPDATE SET
+            email = excluded.email,
+            data = excluded.data,
+            updated_at = excluded.updated_at
+    """
+
+    def put_user(self, username, user):
+        with self._write() as conn:
+            self._upsert(conn, username, user)
+            self._index_user(conn, username, user)
+
+    def put_users(self, users):
+        with self._write() as conn:
+            conn.executemany(self._UPSERT, [self._row(u, d) for u, d in users.items()])
+            self._local.written_at = None
+            for username, user in users.items():
+                self._index_user(conn, username, user)
+
+    def update_user(self, username, mutate, create=False):
+        conn = self._conn()
+        row = conn.execute(
+            'SELECT 1 FROM users WHERE username = ?', (username,)).fetchone()
+        if row is None and not create:
+            return None
+        with self._write() as conn:
+            row = conn.execute(
+                'SELECT data FROM users WHERE username = ?', (username,)).fetchone()
+            user = json.loads(row[0]) if row else {}
+            previous = dict(user) if row else None
+            result = mutate(user)
+            self._upsert(conn, username, user)
+            self._index_user(conn, username, user, previous=previous)
+        return result
+
+    def find_user_by(self, field, value):
+        value = INDEXED_FIELDS[field](value)
+        if not value:
+            return None
+        row = self._conn().execute(
+            'SELECT username FROM user_keys WHERE field = ? AND value = ?', (field, value)).fetchone()
+        return row[0] if row else None
+
+    def verify_indexes(self):
+        expected, conflicts = build_index(self.all_users())
+        stored = {(field, value): username for field, value, username in
+                  self._conn().execute('SELECT field, value, username FROM user_keys')}
+        problems = [f"{field} {value!r} is claimed by both {owner} and {other}"
+                    for field, value, owner, other in conflicts]
+        for key, username in expected.items():
+            if key not in stored:
+                problems.append(f"missing {key[0]} key {key[1]!r} for {username}")
+            elif stored[key] != username:
+                problems.append(f"{key[0]} key {key[1]!r} points to {stored[key]}, expected {username}")
+        for key, username in stored.items():
+            if key not in expected:
+                problems.append(f"stale {key[0]} key {key[1]!r} for {username}")
+        return problems
+
+    def rebuild_indexes(self):
+        expected = build_index(self.all_users())[0]
+        with self._write() as conn:
+            conn.execute('DELETE FROM user_keys')
+            conn.executemany('INSERT INTO user_keys (field, value, username) VALUES (?, ?, ?)',
+                             [key + (username,) for key, username in expected.items()])
+        return len(expected)
+
+    def all_users(self):
+        rows = self._conn().execute('SELECT username, data FROM users').fetchall()
+        return {username: json.loads(data) for username, data in rows}
+
+    def count_users(self):
+        return self._conn().execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+
+class CachedUserStore(UserStore):
+    """Bounded LRU cache of user records in front of another store.
+
+    Writes go through to the backing store and refresh the cached record.
+    Each cached record keeps the store's user_version() token from when it
+    was read or written; before serving it we compare that token with the
+    store's current one, so a write by another worker only invalidates the
+    record it changed.
+    """
+
+    def __init__(self, store, maxsize=USER_CACHE_SIZE):
+        self.store = store
+        self.maxsize = maxsize
+        # username -> (record, user_version token)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _remember(self, username, user, version):
+        with self._lock:
+            self._cache[username] = (user, version)
+            self._cache.move_to_end(username)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+    def _after_write(self, username, user):
+        if user is None:
+            self._forget(username)
+        else:
+            # If someone else writes this user later, the tokens differ and the next read refetches
+            self._remember(username, user, self.store.last_write_version())
+
+    def _forget(self, username):
+        with self._lock:
+            self._cache.pop(username, None)
+
+    def get_user(self, username):
+        """Return the cached record (treat it as read-only)"""
+        version = self.store.user_version(username)
+        with self._lock:
+            cached = self._cache.get(username)
+            if cached is not None and cached[1] == version:
+                self._cache.move_to_end(username)
+                self.hits += 1
+                return cached[0]
+            if cached is not None:
+                self.invalidations += 1
+                del self._cache[username]
+            self.misses += 1
+        # Read after the token: a write in between only makes the entry look stale
+        user = self.store.get_user(username)
+        if user is not None:
+            self._remember(username, user, version)
+        return user
+
+    def add_user(self, username, user):
+        added = self.store.add_user(username, user)
+        if added:
+            self._after_write(username, user)
+        return added
+
+    def put_user(self, username, user):
+        self.store.put_user(username, user)
+        self._after_write(username, user)
+
+    def put_users(self, users):
+        self.store.put_users(users)
+        with self._lock:
+            self._cache.clear()
+
+    def update_user(self, username, mutate, create=False):
+        updated = {}
+
+        def apply(user):
+            updated['user'] = user
+            return mutate(user)
+
+        try:
+            result = self.store.update_user(username, apply, create=create)
+        except Exception:
+            self._forget(username)
+            raise
+        if 'user' in updated:
+            self._after_write(username, updated['user'])
+        return result
+
+    def find_user_by(self, field, value):
+        return self.store.find_user_by(field, value)
+
+    def verify_indexes(self):
+        return self.store.verify_indexes()
+
+    def rebuild_indexes(self):
+        return self.store.rebuild_indexes()
+
+    def all_users(self):
+        return self.store.all_users()
+
+    def count_users(self):
+        return self.store.count_users()
+
+    def data_version(self):
+        return self.store.data_version()
+
+    def last_write_versions(self):
+        return self.store.last_write_versions()
+
+    def user_version(self, username):
+        return self.store.user_version(username)
+
+    def last_write_version(self):
+        return self.store.last_write_version()
+
+    def stats(self):
+        """Hit/miss counters for monitoring"""
+        with self._lock:
+            size = len(self._cache)
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'size': size,
+            'maxsize': self.maxsize,
+            'hit_rate': (self.hits / lookups) if lookups else 0.0
+        }
+
+
+class InstrumentedUserStore(UserStore):
+    """Times every call into another store (read/write) for /metrics"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def _timed(self, kind, operation, *args, **kwargs):
+        with STORE_LATENCY.labels(kind, operation).time():
+            return getattr(self.store, operation)(*args, **kwargs)
+
+    def get_user(self, username):
+        return self._timed('read', 'get_user', username)
+
+    def add_user(self, username, user):
+        return self._timed('write', 'add_user', username, user)
+
+    def put_user(self, username, user):
+        return self._timed('write', 'put_user', username, user)
+
+    def put_users(self, users):
+        return self._timed('write', 'put_users', users)
+
+    def update_user(self, username, mutate, create=False):
+        return self._timed('write', 'update_user', username, mutate, create=create)
+
+    def find_user_by(self, field, value):
+        return self._timed('read', 'find_user_by', field, value)
+
+    def all_users(self):
+        return self._timed('read', 'all_users')
+
+    def count_users(self):
+        return self._timed('read', 'count_users')
+
+    def data_version(self):
+        return self._timed('read', 'data_version')
+
+    def last_write_versions(self):
+        return self.store.last_write_versions()
+
+    def user_version(self, username):
+        return self._timed('read', 'user_version', username)
+
+    def last_write_version(self):
+        return self.store.last_write_version()
+
+    def verify_indexes(self):
+        return self.store.verify_indexes()
+
+    def rebuild_indexes(self):
+        return self.store.rebuild_indexes()
+
+
+def migrate_json_to_sqlite(json_path, store):
+    """Copy every user from a user_data.json file into store; return the count"""
+    users = JSONUserStore(json_path).all_users()
+    if users:
+        store.put_users(users)
+    return len(users)
+
+
+def create_user_store():
+    """Build the store selected by USER_STORE_BACKEND (sqlite or json), cached if enabled"""
+    backend = os.getenv('USER_STORE_BACKEND', 'sqlite').lower()
+    if backend == 'json':
+        store = JSONUserStore(USER_DATA_FILE)
+    else:
+        store = SQLiteUserStore(USER_DB_PATH)
+        # One-shot import of the legacy file the first time the database is created
+        if store.is_new and os.path.exists(USER_DATA_FILE):
+            migrated = migrate_json_to_sqlite(USER_DATA_FILE, store)
+            if migrated:
+                logger.info("Migrated %d users from %s to %s", migrated, USER_DATA_FILE, USER_DB_PATH)
+
+    if STORE_LATENCY is not metrics.NOOP:
+        # Time the backend itself; cache hits never reach it
+        store = InstrumentedUserStore(store)
+    if USER_CACHE_SIZE > 0:
+        store = CachedUserStore(store, USER_CACHE_SIZE)
+    return store
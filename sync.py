@@ -0,0 +1,120 @@
+"""Batched client deltas for goal toggles and meal completions.
+
+calculator.html used to send one request per checkbox click, and each one
+loaded and saved the user record. It now queues timestamped deltas and
+POSTs them to /sync in batches:
+
+    {"deltas": [{"type": "goal", "goal_id": "meditation", "completed": true, "ts": 1760000000000},
+                {"type": "meal", "meal_type": "lunch", "completed": true, "day": "2026-10-17",
+                 "ts": 1760000005000}]}
+
+All goal toggles in a batch are applied to the user record in one
+update_user call, and each day's meal completions become one COMPLETION
+event, so a batch costs one user-store write plus one event-log
+transaction however many clicks it holds. Deltas are applied oldest first
+and are last-write-wins against what the server already has: a goal
+toggle only counts on the day it was made, and meal completions may be
+for any day.
+
+GET /sync returns the same state the client renders, with an ETag over its
+contents, so an unchanged state revalidates as a 304.
+"""
+import hashlib
+import json
+import os
+import time
+from datetime import date, datetime
+
+import goals
+
+SYNC_MAX_DELTAS = int(os.getenv('SYNC_MAX_DELTAS', '500'))
+
+GOAL_DELTA = 'goal'
+MEAL_DELTA = 'meal'
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def parse_deltas(payload):
+    """Validated deltas from a /sync request body, oldest first; raises ValueError"""
+    deltas = (payload or {}).get('deltas')
+    if not isinstance(deltas, list):
+        raise ValueError("deltas must be a list")
+    if len(deltas) > SYNC_MAX_DELTAS:
+        raise ValueError(f"at most {SYNC_MAX_DELTAS} deltas per request")
+    now = _now_ms()
+    parsed = []
+    for delta in deltas:
+        if not isinstance(delta, dict) or not isinstance(delta.get('completed'), bool):
+            raise ValueError("every delta needs a boolean 'completed'")
+        ts = delta.get('ts')
+        if not isinstance(ts, (int, float)) or isinstance(ts, bool):
+            raise ValueError("every delta needs a numeric 'ts' in epoch milliseconds")
+        # A client clock running ahead must not make its toggles unbeatable
+        ts = min(int(ts), now)
+        if delta.get('type') == GOAL_DELTA and isinstance(delta.get('goal_id'), str):
+            parsed.append({'type': GOAL_DELTA, 'goal_id': delta['goal_id'], 'completed': delta['completed'],
+                           'ts': ts})
+        elif delta.get('type') == MEAL_DELTA and isinstance(delta.get('meal_type'), str):
+            try:
+                day = date.fromisoformat(delta.get('day') or '').isoformat()
+            except (TypeError, ValueError):
+                raise ValueError("meal deltas need an ISO 'day'") from None
+            parsed.append({'type': MEAL_DELTA, 'meal_type': delta['meal_type'], 'completed': delta['completed'],
+                           'day': day, 'ts': ts})
+        else:
+            raise ValueError("deltas are {'type': 'goal', 'goal_id'} or {'type': 'meal', 'meal_type', 'day'}")
+    parsed.sort(key=lambda delta: delta['ts'])
+    return parsed
+
+
+def apply_goal_deltas(user, deltas, today):
+    """Apply goal deltas to a user record; returns the ones that took effect"""
+    if not user.get('goals') or 'progress' not in user:
+        # Nothing to toggle on a record without goals
+        return []
+    goals.roll_over(user, today)
+    applied = []
+    for delta in deltas:
+        # Toggles from before the last rollover were for a day that is already history
+        if datetime.fromtimestamp(delta['ts'] / 1000).date() != today:
+            continue
+        if goals.set_goal(user, delta['goal_id'], delta['completed'], today, at=delta['ts']):
+            applied.append(delta)
+    return applied
+
+
+def apply_meal_deltas(completions, deltas):
+    """Fold meal deltas into {day: COMPLETION event data}; returns the ones that took effect"""
+    applied = []
+    for delta in deltas:
+        completion = completions[delta['day']]
+        updated_at = completion.setdefault('updated_at', {})
+        if delta['ts'] < updated_at.get(delta['meal_type'], 0):
+            continue
+        updated_at[delta['meal_type']] = delta['ts']
+        meals = completion.setdefault('completed_meals', [])
+        if delta['completed'] and delta['meal_type'] not in meals:
+            meals.append(delta['meal_type'])
+        elif not delta['completed'] and delta['meal_type'] in meals:
+            meals.remove(delta['meal_type'])
+        applied.append(delta)
+    return applied
+
+
+def snapshot(user, completed_meals, day):
+    """The goal and meal state calculator.html renders; records without goals read as empty"""
+    progress = user.get('progress') or {}
+    return {
+        'day': day,
+        'goals': {goal_id: bool(goal.get('completed')) for goal_id, goal in (user.get('goals') or {}).items()},
+        'progress': {field: progress.get(field, 0)
+                     for field in ('completed_today', 'completion_percentage', 'streak_days')},
+        'completed_meals': completed_meals
+    }
+
+
+def state_etag(state):
+    return hashlib.sha256(json.dumps(state, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()[:32]
@@ -1,9 +1,16 @@
-import openai
-openai.api_key = "your-api-key"
+from dotenv import load_dotenv
 
-try:
-    response = openai.Model.list()
-    print("API key is valid!")
-except Exception as e:
-    print(f"Error: {e}")
-    
\ No newline at end of file
+load_dotenv()
+
+from llm_client import create_llm_client
+
+# Checks the configured OpenRouter key (or LLM_STUB=1) with the same client the app uses
+client = create_llm_client()
+if client is None:
+    print("Error: OPENAI_API_KEY is not set")
+else:
+    try:
+        client.openai.models.list()
+        print("API key is valid!")
+    except Exception as e:
+        print(f"Error: {e}")
@@ -0,0 +1,16 @@
+"""Point every database at a scratch directory before the app modules are imported"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_scratch = tempfile.mkdtemp(prefix='wellora-tests-')
+for name, filename in (('USER_DB_PATH', 'user_data.db'), ('USER_DATA_FILE', 'user_data.json'),
+                       ('MEAL_CACHE_PATH', 'meal_cache.db'), ('PRECOMPUTED_DB_PATH', 'meal_cache.db')):
+    os.environ[name] = os.path.join(_scratch, filename)
+# Empty values win over .env, so tests never reach OpenRouter
+os.environ['OPENAI_API_KEY'] = ''
+os.environ['LLM_STUB'] = '0'
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
@@ -0,0 +1,20 @@
+import pytest
+
+
+@pytest.mark.parametrize('weight', ['nan', 'inf', '-Infinity'])
+def test_batch_rejects_non_finite_numbers(weight):
+    import app
+
+    response = app.app.test_client().post('/api/calculate/batch', json={
+        'gender': ['male', 'female'], 'weight': [70, weight], 'height': 170, 'age': 30})
+    assert response.status_code == 400
+
+
+def test_batch_matches_scalar_formula():
+    import app
+
+    response = app.app.test_client().post('/api/calculate/batch', json={
+        'gender': ['male', 'female'], 'weight': [70, 60], 'height': 170, 'age': 30, 'activity': 'light'})
+    body = response.get_json()
+    assert body['bmr'] == [app.calculate_bmr('male', 70, 170, 30), app.calculate_bmr('female', 60, 170, 30)]
+    assert body['tdee'] == [app.calculate_calorie_needs(bmr, 'light') for bmr in body['bmr']]
@@ -0,0 +1,94 @@
+from datetime import date, timedelta
+
+from event_log import EventLog, TREND_PERIODS, MEAL, BMR, COMPLETION, GOAL
+
+
+def _day(days_ago):
+    return (date.today() - timedelta(days=days_ago)).isoformat()
+
+
+def _all_trends(log, usernames):
+    return {(username, period): log.trends(username, period) for username in usernames for period in TREND_PERIODS}
+
+
+def _fill(log):
+    # alice has events on both sides of the 30-day cutoff, with days 31 and 30 ago
+    # sharing a week or month bucket; bob's history is entirely compacted
+    log.append_many([
+        ('alice', MEAL, _day(45), {'meal_plan': [{}, {}, {}], 'calories': 1800}),
+        ('alice', COMPLETION, _day(45), {'completed_meals': ['breakfast']}),
+        ('alice', BMR, _day(31), {'bmr': 1500, 'tdee': 2100, 'goal_calories': 1900}),
+        ('alice', GOAL, _day(31), {'goal_id': 'water', 'completed': True}),
+        ('alice', MEAL, _day(30), {'meal_plan': [{}, {}], 'calories': 1600}),
+        ('alice', COMPLETION, _day(30), {'completed_meals': ['lunch', 'dinner']}),
+        ('alice', GOAL, _day(2), {'goal_id': 'water', 'completed': True}),
+        ('alice', GOAL, _day(2), {'goal_id': 'water', 'completed': False}),
+        ('alice', MEAL, _day(1), {'meal_plan': [{}], 'calories': 700}),
+        ('bob', MEAL, _day(31), {'meal_plan': [{}, {}, {}], 'calories': 2000}),
+        ('bob', GOAL, _day(40), {'goal_id': 'sleep', 'completed': True}),
+    ])
+
+
+def test_rebuild_after_compaction_keeps_trends(tmp_path):
+    log = EventLog(str(tmp_path / 'events.db'))
+    _fill(log)
+    before = _all_trends(log, ('alice', 'bob'))
+
+    assert log.compact(retention_days=30) == 6
+    assert log.rebuild_trends() == 5
+    assert _all_trends(log, ('alice', 'bob')) == before
+
+
+def test_rebuild_repairs_buckets_after_oldest_raw_day(tmp_path):
+    log = EventLog(str(tmp_path / 'events.db'))
+    _fill(log)
+    before = _all_trends(log, ('alice', 'bob'))
+    log.compact(retention_days=30)
+    log._conn().execute("UPDATE user_trends SET meals_planned = 99 WHERE username = 'alice' AND bucket >= ?",
+                        (_day(1),))
+
+    log.rebuild_trends()
+    assert _all_trends(log, ('alice', 'bob')) == before
+
+
+def test_compact_events_then_rebuild_trends_commands():
+    import app
+
+    app.event_log.append_many([
+        ('cli-user', MEAL, _day(91), {'meal_plan': [{}, {}], 'calories': 1500}),
+        ('cli-user', MEAL, _day(89), {'meal_plan': [{}, {}, {}], 'calories': 2100}),
+        ('cli-other', BMR, _day(91), {'bmr': 1400, 'tdee': 1900, 'goal_calories': 1700}),
+    ])
+    before = _all_trends(app.event_log, ('cli-user', 'cli-other'))
+    runner = app.app.test_cli_runner()
+
+    result = runner.invoke(args=['compact-events', '--retention-days', '90'])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(args=['rebuild-trends'])
+    assert result.exit_code == 0, result.output
+    assert _all_trends(app.event_log, ('cli-user', 'cli-other')) == before
+
+
+def test_repeated_goal_toggles_count_once():
+    import app
+
+    app.create_user('toggler', 'toggler@example.com', 'pw12345678')
+    today = date.today().isoformat()
+    for goal_id, completed in (('daily_water', True), ('daily_water', True), ('daily_water', True),
+                               ('sleep_hours', False)):
+        assert app.update_user_progress('toggler', goal_id, completed)
+
+    assert app.get_user_data('toggler')['progress']['completed_today'] == 1
+    assert app.event_log.trends('toggler', 'day', since=today)[0]['goals_completed'] == 1
+
+
+def test_rebuild_ignores_goal_events_that_did_not_flip(tmp_path):
+    log = EventLog(str(tmp_path / 'events.db'))
+    log.append_many([
+        ('dana', GOAL, _day(1), {'goal_id': 'daily_water', 'completed': True}),
+        ('dana', GOAL, _day(1), {'goal_id': 'daily_water', 'completed': True}),
+        ('dana', GOAL, _day(1), {'goal_id': 'sleep_hours', 'completed': False}),
+    ])
+
+    log.rebuild_trends()
+    assert log.trends('dana', 'day')[0]['goals_completed'] == 1
@@ -0,0 +1,23 @@
+from datetime import date
+
+import goals
+
+TODAY = date(2026, 10, 17)
+
+
+def _user():
+    user = {'goals': {'daily_water': {'completed': False}, 'sleep_hours': {'completed': False}},
+            'progress': {'total_goals': 2, 'completed_today': 0, 'completion_percentage': 0, 'streak_days': 0}}
+    goals.roll_over(user, TODAY)
+    return user
+
+
+def test_set_goal_reports_only_real_changes():
+    user = _user()
+    assert goals.set_goal(user, 'daily_water', True, TODAY) is True
+    assert goals.set_goal(user, 'daily_water', True, TODAY) is False
+    assert goals.set_goal(user, 'sleep_hours', False, TODAY) is False
+    assert goals.set_goal(user, 'missing', True, TODAY) is False
+    assert user['progress']['completed_today'] == 1
+    assert goals.set_goal(user, 'daily_water', False, TODAY) is True
+    assert user['progress']['completed_today'] == 0
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from llm_client import AsyncLLMClient, CircuitBreaker, CircuitOpenError
+
+
+class _HangingCompletions:
+    def __init__(self):
+        self.started = asyncio.Event()
+
+    async def create(self, **kwargs):
+        self.started.set()
+        await asyncio.sleep(3600)
+
+
+class _Chat:
+    def __init__(self, completions):
+        self.completions = completions
+
+
+class _OpenAI:
+    def __init__(self, completions):
+        self.chat = _Chat(completions)
+
+
+def test_cancelled_probe_reopens_breaker():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.05)
+    breaker.record_failure()
+    client = AsyncLLMClient('key', base_url='http://127.0.0.1:9/v1', breaker=breaker)
+    completions = _HangingCompletions()
+
+    async def scenario():
+        client._slots = asyncio.Semaphore(1)
+        client.openai = _OpenAI(completions)
+        await asyncio.sleep(0.06)
+        probe = asyncio.ensure_future(client.create_chat_completion(model='m', messages=[]))
+        await completions.started.wait()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        # A second call is turned away while the probe is out
+        with pytest.raises(CircuitOpenError):
+            await client.create_chat_completion(model='m', messages=[])
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+    asyncio.run(scenario())
+    assert breaker.state == CircuitBreaker.OPEN
+    # After another cooldown a new probe may go out, and its success closes the breaker
+    asyncio.run(asyncio.sleep(0.06))
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
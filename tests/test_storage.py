@@ -0,0 +1,32 @@
+from storage import CachedUserStore, SQLiteUserStore
+
+
+def _workers(tmp_path):
+    path = str(tmp_path / 'users.db')
+    return CachedUserStore(SQLiteUserStore(path)), CachedUserStore(SQLiteUserStore(path))
+
+
+def test_write_by_another_worker_only_invalidates_that_user(tmp_path):
+    first, second = _workers(tmp_path)
+    first.put_user('ana', {'username': 'ana', 'n': 1})
+    first.put_user('ben', {'username': 'ben', 'n': 1})
+    assert first.get_user('ana')['n'] == 1 and first.get_user('ben')['n'] == 1
+
+    second.update_user('ben', lambda user: user.update(n=2))
+
+    hits = first.hits
+    assert first.get_user('ana')['n'] == 1
+    assert first.hits == hits + 1
+    assert first.get_user('ben')['n'] == 2
+    assert first.stats()['invalidations'] == 1
+    # The refetched record is cached again
+    assert first.get_user('ben')['n'] == 2
+    assert first.hits == hits + 2
+
+
+def test_own_writes_stay_cached(tmp_path):
+    first, _ = _workers(tmp_path)
+    first.put_user('ana', {'username': 'ana', 'n': 1})
+    first.update_user('ana', lambda user: user.update(n=2))
+    assert first.get_user('ana')['n'] == 2
+    assert first.stats()['misses'] == 0
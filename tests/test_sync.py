@@ -0,0 +1,52 @@
+from datetime import date
+
+import sync
+
+
+def test_snapshot_of_bare_user_record():
+    state = sync.snapshot({'username': 'bare'}, [], '2026-10-17')
+    assert state == {
+        'day': '2026-10-17',
+        'goals': {},
+        'progress': {'completed_today': 0, 'completion_percentage': 0, 'streak_days': 0},
+        'completed_meals': []
+    }
+
+
+def test_goal_deltas_on_bare_user_record_are_ignored():
+    user = {'username': 'bare'}
+    deltas = [{'type': sync.GOAL_DELTA, 'goal_id': 'meditation', 'completed': True, 'ts': 0}]
+    assert sync.apply_goal_deltas(user, deltas, date(2026, 10, 17)) == []
+    assert user == {'username': 'bare'}
+
+
+def test_get_sync_for_user_without_goals():
+    import app
+
+    # A record from before goals existed: no 'goals' or 'progress' at all
+    app.user_store.put_user('bare', {'username': 'bare', 'password': 'x'})
+    client = app.app.test_client()
+    with client.session_transaction() as session:
+        session['username'] = 'bare'
+
+    response = client.get('/sync?date=2026-10-17')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['state']['goals'] == {}
+    assert body['state']['progress']['completed_today'] == 0
+    assert client.get('/sync?date=2026-10-17', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+def test_meal_completion_rejects_bad_date_and_meals():
+    import app
+
+    client = app.app.test_client()
+    with client.session_transaction() as session:
+        session['username'] = 'bare'
+
+    assert client.post('/meal/completion', json={'date': '17/10/2026', 'completed_meals': []}).status_code == 400
+    assert client.post('/meal/completion', json={'date': '2026-10-17', 'completed_meals': 'lunch'}).status_code == 400
+    assert client.post('/meal/completion', json={'date': '2026-10-17', 'completed_meals': [1]}).status_code == 400
+    response = client.post('/meal/completion', json={'date': '2026-10-17', 'completed_meals': ['lunch']})
+    assert response.status_code == 200
+    assert client.get('/meal/completion?date=2026-10-17').get_json()['completed_meals'] == ['lunch']
@@ -0,0 +1,23 @@
+import pytest
+
+import workouts
+
+
+def _event(**fields):
+    return {'ts': 1760000000000, 'day': '2026-10-13', 'type': 'exercise', 'seconds': 45, 'label': 'Plank',
+            **fields}
+
+
+@pytest.mark.parametrize('fields', [{'ts': 2 ** 63}, {'ts': -1}, {'ts': float('inf')}, {'seconds': 2 ** 32},
+                                    {'seconds': -5}])
+def test_out_of_range_events_are_rejected(fields):
+    with pytest.raises(ValueError):
+        workouts.parse_events({'events': [_event(**fields)]})
+
+
+def test_largest_values_fit_their_columns(tmp_path):
+    store = workouts.WorkoutStore(str(tmp_path / 'workouts.db'))
+    _, events = workouts.parse_events({'events': [_event(ts=2 ** 63 - 1, seconds=2 ** 32 - 1)]})
+    store.add_events('ana', events)
+    stored = store.range('ana', '2026-10-13', '2026-10-13')
+    assert stored['ts'] == [2 ** 63 - 1] and stored['seconds'] == [2 ** 32 - 1]
@@ -0,0 +1,280 @@
+"""Server-side storage for workout planner events.
+
+templates/Workouts.html used to keep everything in localStorage. It now
+queues timer and exercise events there and uploads the backlog to
+POST /workouts/events in one (optionally gzip-compressed) batch:
+
+    {"batch_id": "…", "events": [{"ts": 1760000000000, "day": "2026-10-13", "type": "exercise",
+                                  "seconds": 45, "label": "Jumping Jacks"}, …]}
+
+Events are stored column by column in array-backed blocks, one row per
+user and calendar month of the event's day: parallel arrays of day
+numbers, timestamps, type codes, seconds and label ids, each packed with
+the array module and zlib-compressed. Workout titles and exercise names
+repeat endlessly, so they are interned per user in workout_labels and a
+block only holds their ids. A month of daily workouts is a few hundred
+bytes, and a range query decodes only the months it spans.
+
+batch_id makes uploads idempotent: a client that lost the response to a
+successful upload can send the same batch again without doubling it.
+"""
+import json
+import os
+import threading
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+
+from storage import open_sqlite, USER_DB_PATH
+
+WORKOUT_DB_PATH = os.getenv('WORKOUT_DB_PATH', USER_DB_PATH)
+WORKOUT_MAX_EVENTS = int(os.getenv('WORKOUT_MAX_EVENTS', '50000'))
+# Limit on a decompressed upload, so a small gzip body cannot expand without bound
+WORKOUT_MAX_BODY = int(os.getenv('WORKOUT_MAX_BODY', str(8 * 1024 * 1024)))
+
+# Stored as one byte each; never renumber
+EVENT_TYPES = ('session', 'exercise', 'complete', 'uncomplete', 'schedule', 'unschedule')
+TYPE_CODES = {name: code for code, name in enumerate(EVENT_TYPES)}
+# Column name -> array typecode; every column of a block has one entry per event
+COLUMNS = (('day', 'i'), ('ts', 'q'), ('type', 'B'), ('seconds', 'I'), ('label', 'I'))
+EPOCH = date(1970, 1, 1)
+# Largest value each unsigned column holds ('q' is signed, so ts stops at 2**63 - 1)
+MAX_TS = 2 ** 63 - 1
+MAX_SECONDS = 2 ** 32 - 1
+
+
+def _day_number(day):
+    return (date.fromisoformat(day) - EPOCH).days
+
+
+def _day_iso(number):
+    return (EPOCH + timedelta(days=number)).isoformat()
+
+
+def _month(day_number):
+    return (EPOCH + timedelta(days=day_number)).isoformat()[:7]
+
+
+def _bounded(value, high):
+    """int(value) if it lies in 0..high; raises ValueError so it reads as a bad event"""
+    number = int(value)
+    if not 0 <= number <= high:
+        raise ValueError(f"{number} is outside 0..{high}")
+    return number
+
+
+def decode_body(body, encoding=None):
+    """Decompress an upload body (gzip, deflate or none); raises ValueError"""
+    encoding = (encoding or '').strip().lower()
+    if encoding in ('', 'identity'):
+        data = body
+    elif encoding in ('gzip', 'deflate'):
+        # wbits=47 accepts both gzip and zlib headers
+        inflater = zlib.decompressobj(47)
+        try:
+            data = inflater.decompress(body, WORKOUT_MAX_BODY)
+        except zlib.error as e:
+            raise ValueError(f"Invalid {encoding} body: {e}") from None
+        if inflater.unconsumed_tail:
+            raise ValueError(f"Upload is larger than {WORKOUT_MAX_BODY} bytes uncompressed")
+    else:
+        raise ValueError(f"Unsupported Content-Encoding: {encoding}")
+    if len(data) > WORKOUT_MAX_BODY:
+        raise ValueError(f"Upload is larger than {WORKOUT_MAX_BODY} bytes")
+    try:
+        return json.loads(data)
+    except (UnicodeDecodeError, ValueError):
+        raise ValueError("Body must be JSON") from None
+
+
+def parse_events(payload):
+    """(batch_id, events) from an upload; events are validated dicts; raises ValueError"""
+    if not isinstance(payload, dict) or not isinstance(payload.get('events'), list):
+        raise ValueError("Expected {'batch_id': ..., 'events': [...]}")
+    batch_id = payload.get('batch_id')
+    if batch_id is not None and (not isinstance(batch_id, str) or not 0 < len(batch_id) <= 64):
+        raise ValueError("batch_id must be a string of at most 64 characters")
+    events = payload['events']
+    if len(events) > WORKOUT_MAX_EVENTS:
+        raise ValueError(f"At most {WORKOUT_MAX_EVENTS} events per upload")
+    parsed = []
+    for event in events:
+        try:
+            parsed.append({
+                'day': _day_number(event['day']),
+                'ts': _bounded(event['ts'], MAX_TS),
+                'type': TYPE_CODES[event['type']],
+                'seconds': _bounded(event.get('seconds') or 0, MAX_SECONDS),
+                'label': str(event.get('label') or '')[:120]
+            })
+        except (KeyError, TypeError, ValueError, OverflowError):
+            raise ValueError(f"Invalid event: {event!r:.200}") from None
+    return batch_id, parsed
+
+
+class Block:
+    """One user's events for one month, as parallel arrays sorted by (day, ts)"""
+
+    def __init__(self, columns=None):
+        self.columns = columns or {name: array(code) for name, code in COLUMNS}
+
+    def __len__(self):
+        return len(self.columns['day'])
+
+    @classmethod
+    def decode(cls, blob):
+        columns = {}
+        raw = zlib.decompress(blob)
+        offset = 0
+        for name, code in COLUMNS:
+            column = array(code)
+            size = int.from_bytes(raw[offset:offset + 4], 'little')
+            column.frombytes(raw[offset + 4:offset + 4 + size])
+            columns[name] = column
+            offset += 4 + size
+        return cls(columns)
+
+    def encode(self):
+        parts = []
+        for name, _ in COLUMNS:
+            data = self.columns[name].tobytes()
+            parts.append(len(data).to_bytes(4, 'little') + data)
+        return zlib.compress(b''.join(parts))
+
+    def extend(self, rows):
+        """Add (day, ts, type, seconds, label) rows, keeping the block sorted"""
+        merged = sorted(list(zip(*(self.columns[name] for name, _ in COLUMNS))) + list(rows))
+        self.columns = {name: array(code, (row[i] for row in merged)) for i, (name, code) in enumerate(COLUMNS)}
+
+    def between(self, first_day, last_day):
+        """Column slices for days first_day..last_day (day numbers, inclusive)"""
+        days = self.columns['day']
+        start, end = bisect_left(days, first_day), bisect_right(days, last_day)
+        return {name: self.columns[name][start:end] for name, _ in COLUMNS}
+
+
+class WorkoutStore:
+    """SQLite-backed columnar workout events per user"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS workout_blocks (
+            username TEXT NOT NULL,
+            month TEXT NOT NULL,
+            events INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (username, month)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS workout_labels (
+            username TEXT NOT NULL,
+            id INTEGER NOT NULL,
+            label TEXT NOT NULL,
+            PRIMARY KEY (username, id),
+            UNIQUE (username, label)
+        );
+        CREATE TABLE IF NOT EXISTS workout_batches (
+            username TEXT NOT NULL,
+            batch_id TEXT NOT NULL,
+            events INTEGER NOT NULL,
+            PRIMARY KEY (username, batch_id)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path=WORKOUT_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(self.SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = open_sqlite(self.path)
+        return conn
+
+    def _label_ids(self, conn, username, labels):
+        rows = conn.execute('SELECT label, id FROM workout_labels WHERE username = ?', (username,)).fetchall()
+        ids = dict(rows)
+        new = [label for label in dict.fromkeys(labels) if label not in ids]
+        for label in new:
+            ids[label] = len(ids)
+        conn.executemany('INSERT INTO workout_labels (username, id, label) VALUES (?, ?, ?)',
+                         [(username, ids[label], label) for label in new])
+        return ids
+
+    def add_events(self, username, events, batch_id=None):
+        """Store parsed events in one transaction; returns (stored, duplicate batch)"""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if batch_id is not None:
+                seen = conn.execute('SELECT events FROM workout_batches WHERE username = ? AND batch_id = ?',
+                                    (username, batch_id)).fetchone()
+                if seen is not None:
+                    conn.execute('ROLLBACK')
+                    return seen[0], True
+                conn.execute('INSERT INTO workout_batches (username, batch_id, events) VALUES (?, ?, ?)',
+                             (username, batch_id, len(events)))
+            ids = self._label_ids(conn, username, [event['label'] for event in events])
+            months = {}
+            for event in events:
+                months.setdefault(_month(event['day']), []).append(
+                    (event['day'], event['ts'], event['type'], event['seconds'], ids[event['label']]))
+            for month, rows in months.items():
+                existing = conn.execute('SELECT data FROM workout_blocks WHERE username = ? AND month = ?',
+                                        (username, month)).fetchone()
+                block = Block.decode(existing[0]) if existing else Block()
+                block.extend(rows)
+                conn.execute('INSERT OR REPLACE INTO workout_blocks (username, month, events, data) '
+                             'VALUES (?, ?, ?, ?)', (username, month, len(block), block.encode()))
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return len(events), False
+
+    def range(self, username, since, until):
+        """Events with days between two ISO dates (inclusive) as columns, oldest day first.
+
+        Returns {'day': [...], 'ts': [...], 'type': [...], 'seconds': [...],
+        'label': [...]} with ISO days, type names and label strings.
+        """
+        first_day, last_day = _day_number(since), _day_number(until)
+        conn = self._conn()
+        rows = conn.execute(
+            'SELECT data FROM workout_blocks WHERE username = ? AND month BETWEEN ? AND ? ORDER BY month',
+            (username, since[:7], until[:7])).fetchall()
+        result = {name: [] for name, _ in COLUMNS}
+        for (blob,) in rows:
+            for name, values in Block.decode(blob).between(first_day, last_day).items():
+                result[name].extend(values)
+        if result['label']:
+            labels = dict(conn.execute('SELECT id, label FROM workout_labels WHERE username = ?', (username,)))
+            result['label'] = [labels.get(label, '') for label in result['label']]
+        result['day'] = [_day_iso(day) for day in result['day']]
+        result['type'] = [EVENT_TYPES[code] for code in result['type']]
+        return result
+
+    def summary(self, username, since, until):
+        """Per-day totals for a range: {day: {'sessions', 'exercises', 'seconds', 'completed', 'scheduled'}}"""
+        events = self.range(username, since, until)
+        days = {}
+        # Days are in order and each day's events by time, so later toggles win
+        for day, kind, seconds in zip(events['day'], events['type'], events['seconds']):
+            # completed / scheduled stay None for days without a toggle
+            totals = days.setdefault(day, {'sessions': 0, 'exercises': 0, 'seconds': 0, 'completed': None,
+                                           'scheduled': None})
+            if kind == 'session':
+                totals['sessions'] += 1
+            elif kind == 'exercise':
+                totals['exercises'] += 1
+                totals['seconds'] += seconds
+            elif kind in ('complete', 'uncomplete'):
+                totals['completed'] = kind == 'complete'
+            elif kind in ('schedule', 'unschedule'):
+                totals['scheduled'] = kind == 'schedule'
+        return days
+
+
+def create_workout_store():
+    """The process-wide workout store in WORKOUT_DB_PATH"""
+    return WorkoutStore(WORKOUT_DB_PATH)